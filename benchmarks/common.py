@@ -0,0 +1,174 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" Things shared by the benchmarks.
+
+The random data generators used by the tests (``tests/make_randoms.py``)
+are used to make the data, so the tests directory is put on the path.
+
+"""
+
+import collections
+import datetime
+import os
+import os.path
+import random
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(
+    __file__)), os.pardir, 'tests'))
+
+import make_randoms
+
+
+# The size classes of the data. Tiny is a scalar or a container with a
+# few elements, medium is a container or array with 1e3 elements, and
+# huge is a 1 GB array (only for numpy arrays).
+size_classes = ('tiny', 'medium', 'huge')
+
+huge_nbytes = 2**30
+
+# The option profiles to read and write with (keyword arguments for
+# hdf5storage.Options). Incompatible types are still written when doing
+# MATLAB compatibility so that every marshaller can be measured.
+option_profiles = {
+    'matlab': {'matlab_compatible': True,
+               'action_for_matlab_incompatible': 'ignore'},
+    'matlab_uncompressed': {'matlab_compatible': True,
+                            'action_for_matlab_incompatible': 'ignore',
+                            'compress': False},
+    'python': {'matlab_compatible': False,
+               'store_python_metadata': True},
+    'python_uncompressed': {'matlab_compatible': False,
+                            'store_python_metadata': True,
+                            'compress': False},
+    'no_python_metadata': {'matlab_compatible': False,
+                           'store_python_metadata': False}}
+
+
+def seed():
+    """ Seed the random number generators so that data is repeatable. """
+    random.seed(0)
+    np.random.seed(0)
+    make_randoms.random.seed(0)
+
+
+def _medium_dict(values):
+    return {make_randoms.random_str_ascii(10) + str(i): v
+            for i, v in enumerate(values)}
+
+
+def _sparse(shape, nnz):
+    # scipy is optional, so not having it skips the benchmarks the same
+    # way as missing size classes.
+    try:
+        import scipy.sparse
+    except ImportError:
+        raise NotImplementedError('scipy is not available.')
+    rows = np.random.randint(0, shape[0], size=nnz)
+    columns = np.random.randint(0, shape[1], size=nnz)
+    return scipy.sparse.csc_matrix((np.random.random(nnz),
+                                    (rows, columns)), shape=shape)
+
+
+# Functions to make the data for each builtin marshaller (by name) for
+# each size class. Size classes a marshaller can't do are missing.
+data_makers = {
+    'NumpyScalarArrayMarshaller': {
+        'tiny': lambda: np.float64(make_randoms.random_float()),
+        'medium': lambda: make_randoms.random_numpy((1000, ),
+                                                    'float64'),
+        'huge': lambda: np.random.random(huge_nbytes // 8)},
+    'NumpyDtypeMarshaller': {
+        'tiny': lambda: np.dtype('float64'),
+        'medium': lambda: np.dtype([('f' + str(i), 'float64')
+                                    for i in range(1000)])},
+    'PythonScalarMarshaller': {
+        'tiny': make_randoms.random_int},
+    'PythonStringMarshaller': {
+        'tiny': lambda: make_randoms.random_str_ascii(10),
+        'medium': lambda: make_randoms.random_str_ascii(1000)},
+    'PythonNoneEllipsisNotImplementedMarshaller': {
+        'tiny': lambda: None},
+    'PythonDictMarshaller': {
+        'tiny': lambda: make_randoms.random_dict('dict'),
+        'medium': lambda: _medium_dict(range(1000))},
+    'PythonCounterMarshaller': {
+        'tiny': lambda: make_randoms.random_dict('Counter'),
+        'medium': lambda: collections.Counter(_medium_dict(
+            range(1000)))},
+    'PythonSliceRangeMarshaller': {
+        'tiny': make_randoms.random_slice},
+    'PythonDatetimeObjsMarshaller': {
+        'tiny': lambda: datetime.datetime(2020, 1, 2, 3, 4, 5, 6)},
+    'PythonFractionMarshaller': {
+        'tiny': make_randoms.random_fraction},
+    'PythonListMarshaller': {
+        'tiny': lambda: make_randoms.random_list(3, 'python'),
+        'medium': lambda: make_randoms.random_list(1000, 'python')},
+    'PythonTupleSetDequeMarshaller': {
+        'tiny': lambda: tuple(make_randoms.random_list(3, 'python')),
+        'medium': lambda: tuple(make_randoms.random_list(1000,
+                                                         'python'))},
+    'PythonChainMapMarshaller': {
+        'tiny': make_randoms.random_chainmap,
+        'medium': lambda: collections.ChainMap(
+            _medium_dict(range(500)), _medium_dict(range(500)))},
+    'ScipySparseMatrixMarshaller': {
+        'tiny': lambda: _sparse((3, 3), 3),
+        'medium': lambda: _sparse((1000, 1000), 1000)}}
+
+
+def make_data(marshaller, size):
+    """ Make the data for a marshaller and size class.
+
+    Raises ``NotImplementedError`` (which makes asv skip the benchmark)
+    if the marshaller doesn't have data for the size class.
+
+    """
+    try:
+        maker = data_makers[marshaller][size]
+    except KeyError:
+        raise NotImplementedError(marshaller + ' has no ' + size
+                                  + ' data.')
+    seed()
+    return maker()
+
+
+def make_filename(suffix='.h5'):
+    """ Make a temporary filename (the file is not left existing). """
+    fld = tempfile.mkstemp(suffix=suffix)
+    os.close(fld[0])
+    os.remove(fld[1])
+    return fld[1]
+
+
+def remove_file(filename):
+    if os.path.exists(filename):
+        os.remove(filename)
@@ -0,0 +1,75 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" Benchmarks of the per file cost of opening and making files.
+
+Each benchmark does many small files so that the cost of opening the
+file (and writing the MATLAB header) dominates.
+
+"""
+
+import hdf5storage
+
+from .common import make_filename, remove_file
+
+
+class OpenFile(object):
+    params = ([True, False], )
+    param_names = ('matlab_compatible', )
+    number_of_files = 100
+
+    def setup(self, matlab_compatible):
+        self.filenames = [make_filename(suffix='.mat')
+                          for i in range(self.number_of_files)]
+        for filename in self.filenames:
+            hdf5storage.File(filename, writable=True,
+                             matlab_compatible=matlab_compatible).close()
+
+    def teardown(self, matlab_compatible):
+        for filename in self.filenames:
+            remove_file(filename)
+
+    def time_create(self, matlab_compatible):
+        for filename in self.filenames:
+            hdf5storage.File(filename, writable=True,
+                             truncate_existing=True,
+                             matlab_compatible=matlab_compatible).close()
+
+    def time_open_existing_writable(self, matlab_compatible):
+        for filename in self.filenames:
+            hdf5storage.File(filename, writable=True,
+                             matlab_compatible=matlab_compatible).close()
+
+    def time_open_existing_readonly(self, matlab_compatible):
+        for filename in self.filenames:
+            hdf5storage.File(filename,
+                             matlab_compatible=matlab_compatible).close()
+
+    def time_write_small(self, matlab_compatible):
+        for filename in self.filenames:
+            hdf5storage.writes({'a': 1.0}, filename=filename,
+                               truncate_existing=True,
+                               matlab_compatible=matlab_compatible)
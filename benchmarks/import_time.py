@@ -0,0 +1,79 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" Benchmarks of how long it takes to import hdf5storage.
+
+Short lived programs pay for the import every time they are run, so it
+needs to stay fast. Each import is done in a fresh interpreter.
+
+"""
+
+import subprocess
+import sys
+import time
+
+
+# The target budget (in seconds) for importing hdf5storage on top of
+# importing numpy and h5py, which hdf5storage can't do without.
+IMPORT_TIME_BUDGET = 0.05
+
+
+def _time_import(statement, setup='pass'):
+    code = ('import time\n'
+            + setup + '\n'
+            + 't0 = time.perf_counter()\n'
+            + statement + '\n'
+            + 'print(time.perf_counter() - t0)\n')
+    return float(subprocess.check_output([sys.executable, '-c', code]))
+
+
+def timeraw_import_hdf5storage():
+    return 'import hdf5storage'
+
+
+def timeraw_import_hdf5storage_only():
+    return 'import hdf5storage', 'import numpy, h5py'
+
+
+def track_import_time_budget_fraction():
+    """ Fraction of the budget used by importing just hdf5storage. """
+    return min(_time_import('import hdf5storage',
+                            setup='import numpy, h5py')
+               for i in range(5)) / IMPORT_TIME_BUDGET
+
+
+track_import_time_budget_fraction.unit = 'budget fraction'
+
+
+def track_first_default_MarshallerCollection():
+    """ Time to import and get the default MarshallerCollection. """
+    return min(_time_import('import hdf5storage\n'
+                            'hdf5storage.get_default_MarshallerCollection()',
+                            setup='import numpy, h5py')
+               for i in range(5))
+
+
+track_first_default_MarshallerCollection.unit = 'seconds'
@@ -0,0 +1,75 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" Benchmarks of reading and writing with each builtin marshaller. """
+
+import hdf5storage
+
+from .common import size_classes, option_profiles, data_makers, \
+    make_data, make_filename, remove_file
+
+
+class _Base(object):
+    params = (sorted(data_makers), list(size_classes),
+              sorted(option_profiles))
+    param_names = ('marshaller', 'size', 'options')
+    # Making, writing, and reading the huge data takes a while.
+    timeout = 600.0
+
+    def setup(self, marshaller, size, options):
+        self.data = make_data(marshaller, size)
+        self.options = hdf5storage.Options(**option_profiles[options])
+        self.filename = make_filename()
+
+    def teardown(self, marshaller, size, options):
+        remove_file(self.filename)
+
+
+class Write(_Base):
+    def time_write(self, marshaller, size, options):
+        hdf5storage.write(self.data, path='/a', filename=self.filename,
+                          truncate_existing=True, options=self.options)
+
+    def time_overwrite(self, marshaller, size, options):
+        # The data is written over the same data already in the file.
+        hdf5storage.write(self.data, path='/a', filename=self.filename,
+                          options=self.options)
+
+    def setup(self, marshaller, size, options):
+        _Base.setup(self, marshaller, size, options)
+        hdf5storage.write(self.data, path='/a', filename=self.filename,
+                          truncate_existing=True, options=self.options)
+
+
+class Read(_Base):
+    def setup(self, marshaller, size, options):
+        _Base.setup(self, marshaller, size, options)
+        hdf5storage.write(self.data, path='/a', filename=self.filename,
+                          truncate_existing=True, options=self.options)
+
+    def time_read(self, marshaller, size, options):
+        hdf5storage.read(path='/a', filename=self.filename,
+                         options=self.options)
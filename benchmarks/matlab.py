@@ -0,0 +1,72 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" Benchmarks of savemat and loadmat. """
+
+import hdf5storage
+
+from .common import size_classes, data_makers, make_data, \
+    make_filename, remove_file
+
+
+def make_mdict(size):
+    # A variable of each kind that MATLAB can read that has data for
+    # the size class.
+    mdict = dict()
+    for marshaller in ('NumpyScalarArrayMarshaller',
+                       'PythonScalarMarshaller',
+                       'PythonStringMarshaller', 'PythonDictMarshaller',
+                       'PythonListMarshaller'):
+        if size in data_makers[marshaller]:
+            mdict[marshaller] = make_data(marshaller, size)
+    return mdict
+
+
+class MatFile(object):
+    params = (list(size_classes), [True, False])
+    param_names = ('size', 'store_python_metadata')
+    timeout = 600.0
+
+    def setup(self, size, store_python_metadata):
+        self.mdict = make_mdict(size)
+        self.filename = make_filename(suffix='.mat')
+        hdf5storage.savemat(self.filename, self.mdict,
+                            store_python_metadata=store_python_metadata)
+
+    def teardown(self, size, store_python_metadata):
+        remove_file(self.filename)
+
+    def time_savemat(self, size, store_python_metadata):
+        hdf5storage.savemat(self.filename, self.mdict,
+                            store_python_metadata=store_python_metadata,
+                            truncate_existing=True)
+
+    def time_loadmat(self, size, store_python_metadata):
+        hdf5storage.loadmat(self.filename)
+
+    def time_loadmat_one_variable(self, size, store_python_metadata):
+        hdf5storage.loadmat(self.filename,
+                            variable_names=['PythonScalarMarshaller'])
@@ -0,0 +1,81 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" Benchmarks of the string conversions in ``hdf5storage.utilities``.
+
+Each benchmark converts an array of 1e6 strings of 10 characters, both
+all ASCII (converted all at once) and with some characters that aren't
+ASCII (and some that need UTF-16 surrogate pairs).
+
+"""
+
+import numpy as np
+
+import hdf5storage.utilities as utils
+
+
+class StrConversions(object):
+    params = (['ascii', 'unicode'], )
+    param_names = ('characters', )
+    number_of_strings = 10**6
+    length = 10
+
+    def setup(self, characters):
+        np.random.seed(0)
+        codes = np.random.randint(ord('a'), ord('z') + 1,
+                                  size=(self.number_of_strings,
+                                        self.length)).astype('uint32')
+        if characters == 'unicode':
+            codes[:, 3] = 0xE9
+            codes[::10, 5] = 0x1F600
+        self.str_array = codes.view('U' + str(self.length)).ravel()
+        self.uint32 = utils.convert_numpy_str_to_uint32(self.str_array)
+        self.uint16 = np.char.encode(self.str_array, 'UTF-16LE').view(
+            'uint16').reshape(self.number_of_strings, -1)
+        self.uint16_length = self.uint16.shape[1]
+        self.uint8 = np.char.encode(self.str_array, 'UTF-8').view(
+            'uint8').reshape(self.number_of_strings, -1)
+        self.uint8_length = self.uint8.shape[1]
+
+    def time_numpy_str_to_uint16(self, characters):
+        utils.convert_numpy_str_to_uint16(self.str_array)
+
+    def time_numpy_str_to_numpy_bytes(self, characters):
+        utils.convert_to_numpy_bytes(self.str_array)
+
+    def time_uint32_to_numpy_str(self, characters):
+        utils.convert_to_numpy_str(self.uint32, length=self.length)
+
+    def time_uint16_to_numpy_str(self, characters):
+        utils.convert_to_numpy_str(self.uint16,
+                                   length=self.uint16_length)
+
+    def time_uint8_to_numpy_str(self, characters):
+        utils.convert_to_numpy_str(self.uint8, length=self.uint8_length)
+
+    def time_uint16_to_numpy_bytes(self, characters):
+        utils.convert_to_numpy_bytes(self.uint16,
+                                     length=self.uint16_length)
@@ -29,23 +29,37 @@
 import ast
 import collections
 import datetime
+import hashlib
 import importlib
+import itertools
+import zlib
 
 import numpy as np
 import h5py
 
+from . import instrumentation
 from .pathesc import escape_path, unescape_path
 from .utilities import does_dtype_have_a_zero_shape, \
-    write_data, read_data, \
+    get_dataset_filters, create_dataset, dataset_has_filters, \
+    get_array_blocks, write_data, read_data, \
+    get_vlen_dtype, encode_compact_object_array, decode_compact_array, \
     write_object_array, read_object_array, \
     convert_numpy_str_to_uint16, convert_numpy_str_to_uint32, \
+    convert_numpy_str_to_utf8, \
+    convert_datetime64_to_datenum, convert_datenum_to_datetime64, \
     convert_to_str, convert_to_numpy_str, convert_to_numpy_bytes, \
     decode_complex, encode_complex, convert_attribute_to_string, \
-    convert_attribute_to_string_array, set_attribute_string, \
-    set_attributes_all, del_attribute
+    convert_attribute_to_string_array, get_attribute, \
+    get_attribute_string, set_attribute_string, \
+    set_attributes_all, del_attribute, next_unused_name_in_group
 import hdf5storage.exceptions
 
 
+# The int64 that stands for None in the parts of objects written as an
+# HDF5 compound type.
+_compact_none = np.iinfo(np.int64).min
+
+
 class TypeMarshaller(object):
     """ Base class for marshallers of Python types.
 
@@ -524,6 +538,80 @@ class TypeMarshaller(object):
         """
         raise NotImplementedError('Can''t read data: ' + dsetgrp.name)
 
+    def encode_compact(self, data, options):
+        """ Encodes objects as a structured array if possible.
+
+        Encodes an object ``numpy.ndarray`` whose elements are all the
+        same type handled by this marshaller into a structured
+        ``numpy.ndarray`` of the same shape with a field for each part
+        of the objects, so that they can be written as a single Dataset
+        of an HDF5 compound type.
+
+        .. versionadded:: 0.2
+
+        Parameters
+        ----------
+        data : numpy.ndarray of numpy.object_
+            The objects to encode, which are all the same type.
+        options : hdf5storage.core.Options
+            hdf5storage options object.
+
+        Returns
+        -------
+        encoded : numpy.ndarray or None
+            The encoded objects, or ``None`` if they can't be encoded.
+
+        Notes
+        -----
+        Returns ``None``, which is right for marshallers of types
+        without a fixed set of parts. Subclasses that can encode their
+        types need to override this and ``decode_compact``.
+
+        See Also
+        --------
+        decode_compact
+        hdf5storage.Options.fixed_field_objects_as_compound
+
+        """
+        return None
+
+    def decode_compact(self, data, type_string, options):
+        """ Decodes objects encoded by ``encode_compact``.
+
+        .. versionadded:: 0.2
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            The structured array made by ``encode_compact``.
+        type_string : str
+            The type string of the objects.
+        options : hdf5storage.core.Options
+            hdf5storage options object.
+
+        Returns
+        -------
+        decoded : numpy.ndarray of numpy.object_
+            The objects, with the same shape as `data`.
+
+        Raises
+        ------
+        NotImplementedError
+            If the objects can't be decoded.
+
+        Notes
+        -----
+        Must be overridden in a subclass that overrides
+        ``encode_compact`` because a ``NotImplementedError`` is thrown
+        immediately.
+
+        See Also
+        --------
+        encode_compact
+
+        """
+        raise NotImplementedError('Can''t decode ' + type_string)
+
 
 class NumpyScalarArrayMarshaller(TypeMarshaller):
     def __init__(self):
@@ -547,7 +635,8 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
                       np.int8, np.int16, np.int32, np.int64,
                       np.float16, np.float32, np.float64,
                       np.complex64, np.complex128,
-                      np.bytes_, np.unicode_, np.object_)
+                      np.bytes_, np.unicode_, np.object_,
+                      np.datetime64, np.timedelta64, np.memmap)
         self._numpy_types = self.types
         # Using Python 3 type strings.
         self.python_type_strings = ('numpy.ndarray', 'numpy.matrix',
@@ -563,7 +652,10 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
                                     'numpy.complex64',
                                     'numpy.complex128',
                                     'numpy.bytes_', 'numpy.str_',
-                                    'numpy.object_')
+                                    'numpy.object_',
+                                    'numpy.datetime64',
+                                    'numpy.timedelta64',
+                                    'numpy.memmap')
 
         # If we are storing in MATLAB format, we will need to be able to
         # set the MATLAB_class attribute. The different numpy types just
@@ -616,13 +708,23 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
     def write(self, f, grp, name, data, type_string, options):
         # Start with an emtpy attributes.
         attributes = dict()
+        # datetime64 and timedelta64 can be converted to datenums if the
+        # option is set, except for timedelta64 in years or months
+        # which don't have a fixed number of days.
+        as_datenum = data.dtype.kind in ('M', 'm') \
+            and options.convert_datetime64_to_datenum \
+            and not (data.dtype.kind == 'm' \
+            and np.datetime_data(data.dtype)[0] in ('Y', 'M'))
         # If we are doing matlab compatibility and the data type is not
         # one of those that is supported for matlab, skip writing the
         # data or throw an error if appropriate. structured ndarrays and
         # recarrays are compatible if the
-        # structured_numpy_ndarray_as_struct option is set.
+        # structured_numpy_ndarray_as_struct option is set, and
+        # datetime64 and timedelta64 are if they are converted to
+        # datenums.
         if options.matlab_compatible \
                 and not (data.dtype.type in self.__MATLAB_classes \
+                or as_datenum \
                 or (data.dtype.fields is not None \
                 and options.structured_numpy_ndarray_as_struct)):
             if options.action_for_matlab_incompatible == 'error':
@@ -632,6 +734,22 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
             elif options.action_for_matlab_incompatible == 'discard':
                 return None
 
+        # A numpy.memmap is written as a plain ndarray since that is what
+        # it is read back as.
+        if type_string is None and isinstance(data, np.memmap):
+            type_string = 'numpy.ndarray'
+
+        # Arrays of bools, numbers, and times that are bigger than the
+        # memory budget are written in blocks so that they are never
+        # converted or copied whole. The shape manipulations below are
+        # just views, and the conversions of their elements are skipped
+        # and instead done block by block by _convert_block as they are
+        # written.
+        in_blocks = isinstance(data, np.ndarray) \
+            and data.dtype.kind in 'biufcmM' \
+            and data.dtype.fields is None \
+            and data.nbytes > options.write_memory_budget
+
         # Need to make a set of data that will be stored. It will start
         # out as a copy of data and then be steadily manipulated.
 
@@ -642,6 +760,24 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
         if isinstance(data_to_store, np.core.records.recarray):
             data_to_store = data_to_store.view(np.ndarray)
 
+        # h5py can't write datetime64 and timedelta64, so they are
+        # converted to datenums if the option is set, or otherwise
+        # stored as the int64 counts of their unit (NaT is the smallest
+        # int64), which is just a view. Their dtype including the unit
+        # is put in an Attribute so they can be read back.
+        if data.dtype.kind in ('M', 'm'):
+            if in_blocks:
+                pass
+            elif as_datenum:
+                data_to_store = convert_datetime64_to_datenum(
+                    data_to_store)
+            else:
+                data_to_store = np.asarray(data_to_store).view(np.int64)
+            attributes['hdf5storage.TimeUnit'] = ('string',
+                                                  data.dtype.name)
+            if as_datenum and options.matlab_compatible:
+                attributes['MATLAB_class'] = ('string', 'double')
+
         # Optionally convert bytes_ strings to UTF-16, if possible (all
         # are in the ASCII character set). This is done by simply
         # converting to uint16's and checking that each one's value is
@@ -669,7 +805,16 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
         # than the length of the strings); then it will be simply
         # converted to uint32's byte for byte instead.
 
-        if data.dtype.type == np.unicode_:
+        # If the option is set, non-empty numpy.str_ are instead encoded
+        # to UTF-8 and stored as HDF5 fixed length UTF-8 strings, which
+        # are read back into the original dtype using the underlying
+        # type in the metadata.
+
+        if data.dtype.type == np.unicode_ \
+                and options.convert_numpy_str_to_utf8 \
+                and data_to_store.nbytes != 0:
+            data_to_store = convert_numpy_str_to_utf8(data_to_store)
+        elif data.dtype.type == np.unicode_:
             new_data = None
             if options.convert_numpy_str_to_utf16:
                 try:
@@ -705,7 +850,7 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
 
         # Bools need to be converted to uint8 if the option is given.
         if data_to_store.dtype.name == 'bool' \
-                and options.convert_bools_to_uint8:
+                and options.convert_bools_to_uint8 and not in_blocks:
             data_to_store = np.uint8(data_to_store)
 
         # If data is empty, we instead need to store the shape of the
@@ -719,17 +864,32 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
 
         # If it is a complex type, then it needs to be encoded to have
         # the proper complex field names.
-        if np.iscomplexobj(data_to_store):
+        if np.iscomplexobj(data_to_store) and not in_blocks:
             data_to_store = encode_complex(data_to_store,
                                            options.complex_names)
 
         # If we are storing an object type and it isn't empty
         # (data_to_store is still an object), then we must recursively
         # write what each element points to and make an array of the
-        # references to them.
+        # references to them, unless the elements can all be written
+        # together as an HDF5 variable length type or columnar as an
+        # HDF5 compound type (the type of the elements is then put in
+        # an Attribute).
         if data_to_store.dtype.name == 'object':
-            data_to_store = write_object_array(f, data_to_store,
-                                               options)
+            vlen_dtype = get_vlen_dtype(data_to_store, options)
+            compact = None
+            if vlen_dtype is None:
+                compact, compact_type = encode_compact_object_array(
+                    data_to_store, options)
+            if vlen_dtype is not None:
+                data_to_store = data_to_store.view(vlen_dtype)
+            elif compact is not None:
+                data_to_store = compact
+                attributes['hdf5storage.CompactType'] = ('string',
+                                                         compact_type)
+            else:
+                data_to_store = write_object_array(f, data_to_store,
+                                                   options)
 
         # If it an ndarray with fields and we are writing such things as
         # a Group/struct or if its shape is zero (h5py can't write it
@@ -751,6 +911,7 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
                 and h5py.check_dtype(ref=data_to_store.dtype) \
                 is not h5py.Reference \
                 and not np.iscomplexobj(data) \
+                and 'hdf5storage.CompactType' not in attributes \
                 and (options.structured_numpy_ndarray_as_struct \
                 or (data_to_store.dtype.hasobject \
                 or '\\x00' in str(data_to_store.dtype)) \
@@ -825,7 +986,13 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
 
                     # In the case that we wrote a Reference array (not a
                     # single element), then all other attributes need to
-                    # be removed.
+                    # be removed except for the type of the elements if
+                    # they were written columnar as a compound type.
+                    compact_type = get_attribute_string(
+                        field_obj, 'hdf5storage.CompactType')
+                    if compact_type is not None:
+                        esc_attrs['hdf5storage.CompactType'] = (
+                            'string', compact_type)
                     set_attributes_all(field_obj,
                                        esc_attrs,
                                        np.prod(new_data.shape) != 1)
@@ -833,43 +1000,30 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
             wrote_as_struct = False
 
             # Set the storage options such as compression, chunking,
-            # filters, etc. If the data is being compressed (compression
-            # is enabled and the data is bigger than the threshold),
-            # turn on compression, set the algorithm, set the
-            # compression level, and enable the shuffle and fletcher32
-            # filters appropriately. If the data is not being
-            # compressed, turn on the fletcher32 filter if
-            # indicated. Compression should not be done for scalars.
-            filters = dict()
-            is_scalar = (data_to_store.shape != tuple())
-            if is_scalar and options.compress \
-                    and data_to_store.nbytes \
-                    >= options.compress_size_threshold:
-                filters['compression'] = \
-                    options.compression_algorithm
-                if filters['compression'] == 'gzip':
-                    filters['compression_opts'] = \
-                        options.gzip_compression_level
-                filters['shuffle'] = options.shuffle_filter
-                filters['fletcher32'] = \
-                    options.compressed_fletcher32_filter
+            # filters, etc. If the compression was chosen by sampling,
+            # the choice is recorded if storing Python metadata.
+            if in_blocks:
+                def convert(block):
+                    return self._convert_block(block, as_datenum, options)
             else:
-                filters['compression'] = None
-                filters['shuffle'] = False
-                filters['compression_opts'] = None
-                if is_scalar:
-                    filters['fletcher32'] = \
-                        options.uncompressed_fletcher32_filter
-                else:
-                    filters['fletcher32'] = False
-
-            # Set the chunking to auto if it is being chuncked
-            # (compressed or using the fletcher32 filter).
-            if filters['compression'] is not None \
-                    or filters['fletcher32']:
+                convert = None
+            filters, choice = get_dataset_filters(data_to_store, options,
+                                                  convert=convert)
+            if choice is not None and options.store_python_metadata:
+                attributes['Python.Compression'] = ('string', choice)
+
+            # For delta checkpoints, arrays of bools, numbers, and times
+            # are always chunked so that only the chunks that changed
+            # need to be written, which is done along with writing in
+            # blocks.
+            delta = options.delta_checkpoints \
+                and isinstance(data, np.ndarray) \
+                and data.dtype.kind in 'biufcmM' \
+                and data.dtype.fields is None \
+                and data_to_store.shape != tuple() \
+                and data_to_store.size != 0
+            if delta:
                 filters['chunks'] = True
-            else:
-                filters['chunks'] = None
 
             # The data must first be written. If name is not present
             # yet, then it must be created. If it is present, but not a
@@ -877,27 +1031,40 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
             # use the same compression, or doesn't use the same filters;
             # then it must be deleted and then written. Otherwise, it is
             # just overwritten in place.
-            try:
-                dsetgrp = grp[name]
-                if not isinstance(dsetgrp, h5py.Dataset) \
-                        or dsetgrp.dtype != data_to_store.dtype \
-                        or dsetgrp.shape != data_to_store.shape \
-                        or dsetgrp.compression \
-                        != filters['compression'] \
-                        or dsetgrp.shuffle != filters['shuffle'] \
-                        or dsetgrp.fletcher32 \
-                        != filters['fletcher32'] \
-                        or dsetgrp.compression_opts != \
-                        filters['compression_opts']:
-                    del grp[name]
-                    dsetgrp = grp.create_dataset(name,
-                                                 data=data_to_store,
-                                                 **filters)
-                else:
-                    dsetgrp[...] = data_to_store
-            except:
-                dsetgrp = grp.create_dataset(name, data=data_to_store,
-                                             **filters)
+            if in_blocks or delta:
+                dsetgrp = self._write_in_blocks(
+                    grp, name, data_to_store, convert, filters, options,
+                    attributes=(attributes if delta else None))
+            else:
+                try:
+                    dsetgrp = grp[name]
+                    if not isinstance(dsetgrp, h5py.Dataset) \
+                            or dsetgrp.dtype != data_to_store.dtype \
+                            or h5py.check_dtype(vlen=dsetgrp.dtype) \
+                            != h5py.check_dtype(
+                                vlen=data_to_store.dtype) \
+                            or dsetgrp.shape != data_to_store.shape \
+                            or not dataset_has_filters(dsetgrp, filters):
+                        del grp[name]
+                        with instrumentation.span(
+                                'create_dataset', grp, name,
+                                bytes_in=data_to_store.nbytes,
+                                objects_created=1):
+                            dsetgrp = create_dataset(grp, name,
+                                                     data_to_store,
+                                                     filters)
+                    else:
+                        with instrumentation.span(
+                                'write_dataset', dsetgrp,
+                                bytes_in=data_to_store.nbytes):
+                            dsetgrp[...] = data_to_store
+                except:
+                    with instrumentation.span(
+                            'create_dataset', grp, name,
+                            bytes_in=data_to_store.nbytes,
+                            objects_created=1):
+                        dsetgrp = create_dataset(grp, name,
+                                                 data_to_store, filters)
 
         # Write the metadata using the inherited function (good enough).
         self.write_metadata(f, dsetgrp, data, type_string,
@@ -905,6 +1072,219 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
                             wrote_as_struct=wrote_as_struct)
         return dsetgrp
 
+    def _convert_block(self, block, as_datenum, options):
+        # Does the conversions of the elements that write does to the
+        # whole array (datetime64 and timedelta64 to datenums or int64,
+        # bools to uint8, and encoding complex numbers) to one block of
+        # an array being written in blocks.
+        if block.dtype.kind in ('M', 'm'):
+            if as_datenum:
+                block = convert_datetime64_to_datenum(block)
+            else:
+                block = np.asarray(block).view(np.int64)
+        if block.dtype.name == 'bool' and options.convert_bools_to_uint8:
+            block = np.uint8(block)
+        if np.iscomplexobj(block):
+            block = encode_complex(block, options.complex_names)
+        return block
+
+    def _write_in_blocks(self, grp, name, data, convert, filters,
+                         options, attributes=None):
+        # Writes data to a Dataset in blocks of at most a quarter of the
+        # memory budget (a block, its conversion, and the contiguous
+        # copy h5py makes of it must all fit), converting each one with
+        # convert (if not None). The blocks are aligned to the chunks so
+        # each chunk is only compressed and written once. Like the whole
+        # array case, an existing Dataset is reused if it has the same
+        # dtype (or HDF5 type, since complex numbers encoded with the
+        # field names h5py uses are read as complex), shape, and
+        # filters. If attributes is given, this is a delta checkpoint
+        # and the chunks are written by _write_changed_chunks instead,
+        # which puts the Reference to the hashes of the chunks in
+        # attributes.
+        if convert is None:
+            convert = np.asarray
+        dtype = convert(data[tuple([slice(0, 1)] * data.ndim)]).dtype
+        try:
+            dset = grp[name]
+            if not isinstance(dset, h5py.Dataset) \
+                    or (dset.dtype != dtype
+                        and dset.id.get_type()
+                        != h5py.h5t.py_create(dtype)) \
+                    or dset.shape != data.shape \
+                    or not dataset_has_filters(dset, filters) \
+                    or (attributes is not None and dset.chunks is None):
+                del grp[name]
+                dset = None
+        except KeyError:
+            dset = None
+        if dset is None:
+            with instrumentation.span('create_dataset', grp, name,
+                                      objects_created=1):
+                dset = create_dataset(grp, name, None, filters,
+                                      shape=data.shape, dtype=dtype)
+        blocks = get_array_blocks(data.shape, data.strides,
+                                  data.dtype.itemsize,
+                                  max(1, options.write_memory_budget // 4),
+                                  chunks=dset.chunks)
+        if attributes is not None:
+            self._write_changed_chunks(dset, data, convert, blocks,
+                                       options, attributes)
+            return dset
+        with instrumentation.span('write_dataset', dset,
+                                  bytes_in=data.size * dtype.itemsize):
+            for index in blocks:
+                dset[index] = convert(data[index])
+        return dset
+
+    def _write_changed_chunks(self, dset, data, convert, blocks,
+                              options, attributes):
+        # Writes the chunks of a Dataset whose data is different from
+        # what is already there going by the hashes of the chunks stored
+        # in the Dataset in options.group_for_references that its
+        # hdf5storage.ChunkHashes Attribute points to, and puts the
+        # Reference to the Dataset with the hashes of the new chunks in
+        # attributes. The hashes are kept in their own Dataset rather
+        # than an Attribute so that there is no limit on the number of
+        # chunks. They are the first 8 bytes of the SHA-1 of the dtype,
+        # the chunk shape, and the data of the chunk, so they can't
+        # match ones from a Dataset with a different chunk shape. The
+        # Attribute is deleted before anything is written so that the
+        # hashes are never stale if writing fails part way through (the
+        # Dataset of old hashes is then left for the garbage
+        # collection).
+        chunks = dset.chunks
+        grid = tuple([-(-n // c) for n, c in zip(dset.shape, chunks)])
+        n_chunks = int(np.prod(grid))
+        hashes_dset = self._get_chunk_hashes(dset, n_chunks)
+        old = None if hashes_dset is None else hashes_dset[...]
+        hashes = np.zeros((n_chunks, ), dtype=np.uint64)
+        salt = (dset.dtype.str + str(chunks)).encode('ascii')
+        encode = self._get_chunk_encoder(dset)
+        for index in blocks:
+            block = convert(data[index])
+            starts = [s.indices(n)[0] for s, n in zip(index, dset.shape)]
+            # Go through the chunks in the block by their offsets.
+            for offsets in itertools.product(*[
+                    range(start, start + m, c) for start, m, c
+                    in zip(starts, block.shape, chunks)]):
+                region = tuple([slice(o, min(o + c, n)) for o, c, n
+                                in zip(offsets, chunks, dset.shape)])
+                chunk = np.ascontiguousarray(block[tuple([
+                    slice(r.start - start, r.stop - start)
+                    for r, start in zip(region, starts)])])
+                h = hashlib.sha1(salt)
+                h.update(chunk.reshape(-1).view(np.uint8))
+                i = np.ravel_multi_index(
+                    tuple([o // c for o, c in zip(offsets, chunks)]),
+                    grid)
+                hashes[i] = int.from_bytes(h.digest()[:8], 'little')
+                if old is not None and old[i] == hashes[i]:
+                    continue
+                with instrumentation.span('write_dataset', dset,
+                                          bytes_in=chunk.nbytes):
+                    if encode is None:
+                        dset[region] = chunk
+                    else:
+                        dset.id.write_direct_chunk(offsets,
+                                                   encode(chunk))
+        if hashes_dset is None:
+            try:
+                grp2 = dset.file.require_group(
+                    options.group_for_references)
+            except TypeError:
+                # Something else is in the way, which is left alone at
+                # the cost of the hashes.
+                return
+            hashes_dset = grp2.create_dataset(
+                next_unused_name_in_group(grp2, 16), data=hashes)
+        else:
+            hashes_dset[...] = hashes
+        attributes['hdf5storage.ChunkHashes'] = ('value', np.array(
+            hashes_dset.ref,
+            dtype=h5py.special_dtype(ref=h5py.Reference)))
+
+    def _get_chunk_hashes(self, dset, n_chunks):
+        # Gets the Dataset of the hashes of the chunks of a Dataset
+        # written as a delta checkpoint, deleting the Attribute pointing
+        # to it. None is returned if there isn't one or it isn't right
+        # for the number of chunks.
+        ref = get_attribute(dset, 'hdf5storage.ChunkHashes')
+        if ref is None:
+            return None
+        del_attribute(dset, 'hdf5storage.ChunkHashes')
+        try:
+            hashes_dset = dset.file[ref]
+        except Exception:
+            return None
+        if not isinstance(hashes_dset, h5py.Dataset) \
+                or hashes_dset.dtype != np.uint64 \
+                or hashes_dset.shape != (n_chunks, ):
+            return None
+        return hashes_dset
+
+    def _get_chunk_encoder(self, dset):
+        # Gets the function that does the filters of a Dataset to the
+        # data of one of its chunks for writing it directly with
+        # write_direct_chunk, which is only done for Datasets with no
+        # fields (their layout might be different in the file) that are
+        # compressed with only the gzip filter and optionally the
+        # shuffle filter before it and the fletcher32 filter after it
+        # (the order h5py puts them in). None is returned for anything
+        # else.
+        dcpl = dset.id.get_create_plist()
+        filters = [dcpl.get_filter(i)[0]
+                   for i in range(dcpl.get_nfilters())]
+        shuffle = h5py.h5z.FILTER_SHUFFLE in filters
+        fletcher32 = h5py.h5z.FILTER_FLETCHER32 in filters
+        expected = [h5py.h5z.FILTER_DEFLATE]
+        if shuffle:
+            expected.insert(0, h5py.h5z.FILTER_SHUFFLE)
+        if fletcher32:
+            expected.append(h5py.h5z.FILTER_FLETCHER32)
+        if dset.dtype.fields is not None or filters != expected:
+            return None
+        chunks = dset.chunks
+        dtype = dset.dtype
+        level = dset.compression_opts
+
+        def encode(chunk):
+            # Edge chunks are padded with zeros to the full chunk shape
+            # since HDF5 stores them that way.
+            if chunk.shape != chunks:
+                full = np.zeros(chunks, dtype=chunk.dtype)
+                full[tuple([slice(0, m) for m in chunk.shape])] = chunk
+                chunk = full
+            raw = chunk.reshape(-1).view(np.uint8)
+            if shuffle and dtype.itemsize > 1:
+                raw = np.ascontiguousarray(
+                    raw.reshape(-1, dtype.itemsize).T)
+            data = zlib.compress(raw.tobytes(), level)
+            if fletcher32:
+                data += self._fletcher32(
+                    np.frombuffer(data, dtype=np.uint8)).to_bytes(
+                        4, 'little')
+            return data
+
+        return encode
+
+    def _fletcher32(self, raw):
+        # Computes the checksum of the bytes raw that the HDF5 fletcher32
+        # filter does, which is a Fletcher-32 checksum of them as big
+        # endian 16 bit words (the last byte of an odd number of them
+        # being the high byte of one more) where the sums are only ever
+        # zero if all the words are.
+        words = raw[:raw.size // 2 * 2].view('>u2').astype(np.uint64)
+        if raw.size % 2 == 1:
+            words = np.append(words, np.uint64(int(raw[-1]) << 8))
+        if not words.any():
+            return 0
+        words %= 65535
+        sum1 = int(words.sum())
+        sum2 = int((words * (np.arange(words.size, 0, -1,
+                                       dtype=np.uint64) % 65535)).sum())
+        return (((sum2 - 1) % 65535 + 1) << 16) | ((sum1 - 1) % 65535 + 1)
+
     def write_metadata(self, f, dsetgrp, data, type_string, options,
                        attributes=None, wrote_as_struct=False):
         # wote_as_struct is used to pass whether data was written like a
@@ -1043,6 +1423,8 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
         python_empty = attributes['Python.Empty']
         python_fields = convert_attribute_to_string_array(
             attributes['Python.Fields'])
+        time_unit = convert_attribute_to_string(
+            attributes['hdf5storage.TimeUnit'])
 
         matlab_class = convert_attribute_to_string(
             attributes['MATLAB_class'])
@@ -1058,8 +1440,14 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
         # ndarray like object that needs to be read field wise and
         # constructed.
         if isinstance(dset, h5py.Dataset):
-            # Read the data.
-            data = dset[...]
+            # Read the data. Variable length UTF-8 strings come back as
+            # bytes in h5py >= 3.0, which has to be asked to decode them
+            # to str (older versions already do).
+            if h5py.check_dtype(vlen=dset.dtype) is str \
+                    and hasattr(dset, 'asstr'):
+                data = dset.asstr()[...]
+            else:
+                data = dset[...]
 
             # If it is a reference type, then we need to make an object
             # array that is its replicate, but with the objects they are
@@ -1067,6 +1455,13 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
             # references.
             if h5py.check_dtype(ref=dset.dtype) is not None:
                 data = read_object_array(f, data, options)
+
+            # If it is objects that were written columnar as a compound
+            # type, they need to be decoded.
+            compact_type = convert_attribute_to_string(
+                attributes['hdf5storage.CompactType'])
+            if compact_type is not None:
+                data = decode_compact_array(data, compact_type, options)
         else:
             # Starting with an empty dict, all that has to be done is
             # iterate through all the Datasets and Groups in dset
@@ -1076,13 +1471,13 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
             # a try block that just catches exceptions and then does
             # nothing about them (nothing needs to be done). We also
             # need to keep track of whether any of the fields are
-            # Groups, aren't Reference arrays, or have attributes other
-            # than H5PATH since that means that the fields are the
-            # values (single element structured ndarray), as opposed to
-            # Reference arrays to all the values (multi-element structed
-            # ndarray). In Python 2, the field names need to be
-            # converted to str from unicode when storing the fields in
-            # struct_data.
+            # Groups, aren't Reference (or variable length) arrays, or
+            # have attributes other than H5PATH since that means that
+            # the fields are the values (single element structured
+            # ndarray), as opposed to Reference arrays to all the values
+            # (multi-element structed ndarray). In Python 2, the field
+            # names need to be converted to str from unicode when
+            # storing the fields in struct_data.
             struct_data = dict()
             is_multi_element = True
             for k in dset:
@@ -1093,7 +1488,9 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
                     continue
                 fld = dset[k]
                 if isinstance(fld, h5py.Group) \
-                        or h5py.check_dtype(ref=fld.dtype) is None \
+                        or (h5py.check_dtype(ref=fld.dtype) is None
+                            and h5py.check_dtype(vlen=fld.dtype) is None
+                            and 'hdf5storage.CompactType' not in fld.attrs) \
                         or len(set(fld.attrs) \
                         & ((set(self.python_attributes) \
                         | set(self.matlab_attributes))
@@ -1262,6 +1659,15 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
             if underlying_type == 'bool' and data.dtype.name != 'bool':
                 data = np.bool_(data)
 
+            # datetime64 and timedelta64 need to be converted back from
+            # datenums or the int64 counts of their unit (empty ones
+            # already have the right dtype).
+            if time_unit is not None and data.dtype.kind in ('i', 'f'):
+                if data.dtype.kind == 'f':
+                    data = convert_datenum_to_datetime64(data, time_unit)
+                else:
+                    data = data.view(time_unit)
+
             # If MATLAB attributes are present or the reverse dimension
             # order option was given, the dimension order needs to be
             # reversed. This needs to be done before any reshaping as
@@ -1375,9 +1781,175 @@ class NumpyScalarArrayMarshaller(TypeMarshaller):
                 if data.dtype.type != np.bytes_:
                     data = convert_to_numpy_str(data)
 
+        # Without Python metadata, datetime64 and timedelta64 still need
+        # to be converted back from datenums or the int64 counts of
+        # their unit.
+        if time_unit is not None and isinstance(data, np.ndarray) \
+                and data.dtype.kind in ('i', 'f'):
+            if data.dtype.kind == 'f':
+                data = convert_datenum_to_datetime64(data, time_unit)
+            else:
+                data = data.view(time_unit)
+
         # Done adjusting data, so it can be returned.
         return data
 
+    def read_to_memmap(self, f, dsetgrp, attributes, options, filename):
+        """ Read a Dataset into a new ``numpy.memmap`` in blocks.
+
+        Reads an array of bools, numbers, ``numpy.datetime64``, or
+        ``numpy.timedelta64`` the same way as ``read`` except that it is
+        read into a new ``numpy.memmap`` backed by the file `filename`
+        block by block. The blocks are at most a quarter of
+        ``options.write_memory_budget`` bytes and aligned to the chunks
+        of the Dataset, so each chunk is read (and decompressed) once
+        and the whole array is never in memory. The conversions done by
+        ``read`` (decoding complex numbers, ``numpy.uint8`` to ``bool``,
+        datenums to ``numpy.datetime64``, etc.) are done to each block,
+        and the transpose and reshape are done by which part of the
+        ``numpy.memmap`` each block is read into.
+
+        .. versionadded:: 0.2
+
+        Parameters
+        ----------
+        f : h5py.File
+            The HDF5 file handle that is open.
+        dsetgrp : h5py.Dataset or h5py.Group
+            The Dataset to read.
+        attributes : collections.defaultdict
+            All the Attributes of `dsetgrp` with their names as keys
+            and their values as values (``None`` for ones not present).
+        options : hdf5storage.core.Options
+            hdf5storage options object.
+        filename : str or pathlib.Path
+            The file to make the ``numpy.memmap`` with, which is
+            overwritten if it exists.
+
+        Returns
+        -------
+        data : numpy.memmap
+            The data that was read, which is open in ``'r+'`` mode.
+
+        Raises
+        ------
+        exceptions.CantReadError
+            If `dsetgrp` isn't a non-empty array of bools, numbers, or
+            times that would be read as a ``numpy.ndarray``.
+
+        See Also
+        --------
+        read
+        hdf5storage.File.read_to_memmap
+        hdf5storage.Options.write_memory_budget
+        hdf5storage.utilities.get_array_blocks
+
+        """
+        dset = dsetgrp
+
+        # Get the different attributes this marshaller uses.
+        type_string = convert_attribute_to_string(
+            attributes['Python.Type'])
+        underlying_type = convert_attribute_to_string(
+            attributes['Python.numpy.UnderlyingType'])
+        shape = attributes['Python.Shape']
+        container = convert_attribute_to_string(
+            attributes['Python.numpy.Container'])
+        time_unit = convert_attribute_to_string(
+            attributes['hdf5storage.TimeUnit'])
+        matlab_class = convert_attribute_to_string(
+            attributes['MATLAB_class'])
+
+        # Only plain non-empty Datasets can be read in blocks (not
+        # structs, empties whose shape is stored instead, References,
+        # variable length types, objects written columnar, etc.).
+        if not isinstance(dset, h5py.Dataset) or dset.size == 0 \
+                or dset.dtype.hasobject \
+                or h5py.check_dtype(vlen=dset.dtype) is not None \
+                or attributes['hdf5storage.CompactType'] is not None \
+                or attributes['Python.Fields'] is not None \
+                or attributes['MATLAB_fields'] is not None \
+                or attributes['Python.Empty'] == 1 \
+                or attributes['MATLAB_empty'] == 1:
+            raise hdf5storage.exceptions.CantReadError(
+                'Can only read non-empty arrays of bools, numbers, and '
+                'times to a numpy.memmap.')
+
+        # Work out the conversions to do to each block, whether it has
+        # to be transposed, and the shape of the result from the
+        # metadata the same way read does.
+        if type_string is not None and underlying_type is not None \
+                and shape is not None:
+            if container != 'ndarray' \
+                    or int(np.prod(shape)) != dset.size \
+                    or not underlying_type.startswith(
+                        ('bool', 'int', 'uint', 'float', 'complex',
+                         'datetime64', 'timedelta64')):
+                raise hdf5storage.exceptions.CantReadError(
+                    'Can only read numpy.ndarray to a numpy.memmap.')
+            transpose = matlab_class is not None \
+                or options.reverse_dimension_order
+            out_shape = tuple([int(n) for n in shape])
+            decode = underlying_type.startswith('complex')
+            to_bool = underlying_type == 'bool'
+        elif matlab_class in self.__MATLAB_classes_reverse:
+            transpose = True
+            out_shape = dset.shape[::-1]
+            decode = matlab_class in ['single', 'double']
+            to_bool = matlab_class == 'logical'
+        elif matlab_class is None:
+            transpose = False
+            out_shape = dset.shape
+            decode = False
+            to_bool = False
+        else:
+            raise hdf5storage.exceptions.CantReadError(
+                'Can only read non-empty arrays of bools, numbers, and '
+                'times to a numpy.memmap.')
+
+        def convert(block):
+            block = np.asarray(block)
+            if decode:
+                block = decode_complex(block)
+            if to_bool and block.dtype.name != 'bool':
+                block = np.bool_(block)
+            if time_unit is not None and block.dtype.kind in ('i', 'f'):
+                if block.dtype.kind == 'f':
+                    block = convert_datenum_to_datetime64(block,
+                                                          time_unit)
+                else:
+                    block = block.view(time_unit)
+            return block
+
+        # The dtype is that of a converted element, which must be a
+        # bool, number, or time.
+        dtype = convert(dset[tuple([slice(0, 1)] * dset.ndim)]).dtype
+        if dtype.kind not in 'biufcmM' or dtype.fields is not None:
+            raise hdf5storage.exceptions.CantReadError(
+                'Can only read non-empty arrays of bools, numbers, and '
+                'times to a numpy.memmap.')
+
+        # Make the memmap and a view of it with the shape of the
+        # Dataset, where each element is where the element of the
+        # Dataset at the same index goes, and read it block by block
+        # (sequentially in the memmap).
+        data = np.memmap(filename, dtype=dtype, mode='w+',
+                         shape=out_shape)
+        if transpose:
+            view = data.reshape(dset.shape[::-1]).T
+        else:
+            view = data.reshape(dset.shape)
+        blocks = get_array_blocks(dset.shape, view.strides,
+                                  dtype.itemsize,
+                                  max(1, options.write_memory_budget // 4),
+                                  chunks=dset.chunks)
+        with instrumentation.span('read_dataset', dset,
+                                  bytes_in=data.nbytes):
+            for index in blocks:
+                view[index] = convert(dset[index])
+        data.flush()
+        return data
+
 
 class NumpyDtypeMarshaller(NumpyScalarArrayMarshaller):
     def __init__(self):
@@ -1581,6 +2153,11 @@ class PythonDictMarshaller(TypeMarshaller):
         # Set matlab_classes to empty since NumpyScalarArrayMarshaller
         # handles Groups by default now.
         self.matlab_classes = ()
+        # The parts of the types that have a fixed set of them (not
+        # dicts), by type string, as tuples of the name and kind of each
+        # part, for writing them as an HDF5 compound type. The kinds are
+        # 'int', 'int_or_none', 'timedelta', and 'timezone'.
+        self._compact_parts = dict()
         # Update the type lookups.
         self.update_type_lookups()
 
@@ -1738,8 +2315,19 @@ class PythonDictMarshaller(TypeMarshaller):
 
     def read(self, f, dsetgrp, attributes, options):
         grp2 = dsetgrp
-        # If name is not present or is not a Group, then we can't read
-        # it and have to throw an error.
+        # If it was written as an HDF5 compound type, the dict of its
+        # parts is made from it. Otherwise, if name is not present or is
+        # not a Group, then we can't read it and have to throw an error.
+        compact_type = convert_attribute_to_string(
+            attributes['hdf5storage.CompactType'])
+        if isinstance(grp2, h5py.Dataset) \
+                and compact_type in self._compact_parts:
+            parts = self._compact_parts[compact_type]
+            value = grp2[...].ravel()
+            if value.size != 1:
+                raise NotImplementedError('Not a single object.')
+            return {k: self._decode_parts(kind, [value[k][0].item()])[0]
+                    for k, kind in parts}
         if not isinstance(grp2, h5py.Group):
             raise NotImplementedError('Not a Group.')
 
@@ -1839,6 +2427,146 @@ class PythonDictMarshaller(TypeMarshaller):
             tp = dict
         return tp(items)
 
+    def _get_parts(self, data, parts):
+        # Gets the values of the parts of data (the attributes with the
+        # part names), or None if data doesn't have those parts.
+        return tuple([getattr(data, k) for k, kind in parts])
+
+    @staticmethod
+    def _encode_parts(kind, values):
+        # Encodes the values of one part of the objects to ints for an
+        # int64 field, raising a TypeError if they can't be. The int64
+        # conversion raises an OverflowError if they are too big.
+        if kind == 'int':
+            return values
+        elif kind == 'int_or_none':
+            for v in values:
+                if (type(v) is not int or v == _compact_none) \
+                        and v is not None:
+                    raise TypeError('Not an int or None.')
+            return [_compact_none if v is None else v for v in values]
+        elif kind == 'timedelta':
+            return [(v.days * 86400 + v.seconds) * 1000000
+                    + v.microseconds for v in values]
+        # Timezones are stored as their offset in microseconds, if they
+        # don't have a name, and their encodings are cached since there
+        # are usually only a few different ones.
+        cache = {None: _compact_none}
+        out = []
+        for v in values:
+            if v not in cache:
+                if type(v) is not datetime.timezone \
+                        or len(v.__reduce__()[1]) != 1:
+                    raise TypeError('Not a timezone without a name.')
+                cache[v] = PythonDictMarshaller._encode_parts(
+                    'timedelta', [v.utcoffset(None)])[0]
+            out.append(cache[v])
+        return out
+
+    @staticmethod
+    def _decode_parts(kind, values):
+        # Inverse of _encode_parts.
+        if kind == 'int':
+            return values
+        elif kind == 'int_or_none':
+            return [None if v == _compact_none else v for v in values]
+        elif kind == 'timedelta':
+            return [datetime.timedelta(microseconds=v) for v in values]
+        cache = {_compact_none: None}
+        out = []
+        for v in values:
+            if v not in cache:
+                cache[v] = datetime.timezone(
+                    datetime.timedelta(microseconds=v))
+            out.append(cache[v])
+        return out
+
+    def encode_compact(self, data, options):
+        # The parts of all the elements are gotten and then encoded part
+        # by part into the fields of a structured array.
+        first = data.flat[0]
+        type_string = self.get_type_string(first, None)
+        if type_string not in self._compact_parts:
+            return None
+        parts = self._compact_parts[type_string]
+        values = [self._get_parts(x, parts) for x in data.flat]
+        if None in values:
+            return None
+        out = np.empty(data.shape,
+                       dtype=[(k, 'int64') for k, kind in parts])
+        for (k, kind), column in zip(parts, zip(*values)):
+            try:
+                out[k] = np.array(self._encode_parts(kind, column),
+                                  dtype='int64').reshape(data.shape)
+            except (TypeError, OverflowError):
+                return None
+        return out
+
+    def decode_compact(self, data, type_string, options):
+        # The parts are decoded field by field, and then the objects
+        # made by passing them to the type in order.
+        tp = self.typestring_to_type[type_string]
+        if isinstance(tp, str):
+            module, _, tp_name = tp.rpartition('.')
+            tp = getattr(importlib.import_module(module), tp_name)
+        parts = self._compact_parts[type_string]
+        columns = [self._decode_parts(kind, data[k].ravel().tolist())
+                   for k, kind in parts]
+        out = np.empty(data.shape, dtype='object')
+        flat = out.reshape(-1)
+        for i, args in enumerate(zip(*columns)):
+            flat[i] = tp(*args)
+        return out
+
+    def _write_compact(self, f, grp, name, data, type_string, options):
+        # Writes a single object as a Dataset of an HDF5 compound type,
+        # if that option is set, the type will be stored so it can be
+        # decoded, and it can be encoded, returning the Dataset.
+        # Otherwise, None is returned.
+        if not options.fixed_field_objects_as_compound \
+                or not options.store_python_metadata:
+            return None
+        obj = np.empty((), dtype='object')
+        obj[()] = data
+        data_to_store = self.encode_compact(obj, options)
+        if data_to_store is None:
+            return None
+        type_string = self.get_type_string(data, type_string)
+
+        # If there is already a Dataset of the same dtype, it is
+        # overwritten in place. Otherwise, whatever is there is deleted
+        # and the Dataset made.
+        filters, choice = get_dataset_filters(data_to_store, options)
+        try:
+            dset = grp[name]
+            if not isinstance(dset, h5py.Dataset) \
+                    or dset.dtype != data_to_store.dtype \
+                    or dset.shape != data_to_store.shape \
+                    or not dataset_has_filters(dset, filters):
+                del grp[name]
+                with instrumentation.span(
+                        'create_dataset', grp, name,
+                        bytes_in=data_to_store.nbytes,
+                        objects_created=1):
+                    dset = create_dataset(grp, name, data_to_store,
+                                          filters)
+            else:
+                with instrumentation.span(
+                        'write_dataset', dset,
+                        bytes_in=data_to_store.nbytes):
+                    dset[...] = data_to_store
+        except KeyError:
+            with instrumentation.span(
+                    'create_dataset', grp, name,
+                    bytes_in=data_to_store.nbytes, objects_created=1):
+                dset = create_dataset(grp, name, data_to_store, filters)
+
+        TypeMarshaller.write_metadata(
+            self, f, dset, data, type_string, options,
+            attributes={'hdf5storage.CompactType': ('string',
+                                                    type_string)})
+        return dset
+
 
 class PythonCounterMarshaller(PythonDictMarshaller):
     def __init__(self):
@@ -1876,15 +2604,25 @@ class PythonSliceRangeMarshaller(PythonDictMarshaller):
         # As the parent class already has MATLAB strings handled, there
         # are no MATLAB classes that this marshaller should be used for.
         self.matlab_classes = ()
+        self._compact_parts = {
+            'slice': (('start', 'int_or_none'), ('stop', 'int_or_none'),
+                      ('step', 'int_or_none')),
+            'range': (('start', 'int'), ('stop', 'int'),
+                      ('step', 'int'))}
         # Update the type lookups.
         self.update_type_lookups()
 
     def write(self, f, grp, name, data, type_string, options):
-        # data just needs to be converted to a dict and then pass it to
-        # the parent version of this function. The proper type_string
-        # needs to be grabbed now as the parent function will have a
-        # modified form of data to guess from if not given the right one
-        # explicitly.
+        # It is written as an HDF5 compound type if possible.
+        dset = self._write_compact(f, grp, name, data, type_string,
+                                   options)
+        if dset is not None:
+            return dset
+        # Otherwise, data just needs to be converted to a dict and then
+        # pass it to the parent version of this function. The proper
+        # type_string needs to be grabbed now as the parent function will
+        # have a modified form of data to guess from if not given the
+        # right one explicitly.
         return PythonDictMarshaller.write(
             self, f, grp, name,
             {'start': data.start, 'stop': data.stop, 'step': data.step},
@@ -1925,14 +2663,41 @@ class PythonDatetimeObjsMarshaller(PythonDictMarshaller):
         # As the parent class already has MATLAB strings handled, there
         # are no MATLAB classes that this marshaller should be used for.
         self.matlab_classes = ()
+        time_parts = (('hour', 'int'), ('minute', 'int'),
+                      ('second', 'int'), ('microsecond', 'int'),
+                      ('tzinfo', 'timezone'))
+        self._compact_parts = {
+            'datetime.timedelta': (('days', 'int'), ('seconds', 'int'),
+                                   ('microseconds', 'int')),
+            'datetime.timezone': (('offset', 'timedelta'), ),
+            'datetime.date': (('year', 'int'), ('month', 'int'),
+                              ('day', 'int')),
+            'datetime.time': time_parts,
+            'datetime.datetime': (('year', 'int'), ('month', 'int'),
+                                  ('day', 'int')) + time_parts}
         # Update the type lookups.
         self.update_type_lookups()
 
+    def _get_parts(self, data, parts):
+        # timezone doesn't have an attribute for its offset, and only
+        # ones without a name can be written as an HDF5 compound type.
+        if type(data) == datetime.timezone:
+            parts = data.__reduce__()[1]
+            if len(parts) != 1:
+                return None
+            return parts
+        return PythonDictMarshaller._get_parts(self, data, parts)
+
     def write(self, f, grp, name, data, type_string, options):
-        # data just needs to be converted to a dict and then pass it to
-        # the parent version of this function. We build a dict of the
-        # keyword arguments to pass to the constructors to rebuild the
-        # types. For all but timezone, it is just a matter of reading
+        # It is written as an HDF5 compound type if possible.
+        dset = self._write_compact(f, grp, name, data, type_string,
+                                   options)
+        if dset is not None:
+            return dset
+        # Otherwise, data just needs to be converted to a dict and then
+        # pass it to the parent version of this function. We build a dict
+        # of the keyword arguments to pass to the constructors to rebuild
+        # the types. For all but timezone, it is just a matter of reading
         # the right attributes and using their names as the
         # keys. timezone, unfortunately, does not have attributes for
         # the two arguments. While the offset can be gotten reliably,
@@ -1991,15 +2756,23 @@ class PythonFractionMarshaller(PythonDictMarshaller):
         # As the parent class already has MATLAB strings handled, there
         # are no MATLAB classes that this marshaller should be used for.
         self.matlab_classes = ()
+        self._compact_parts = {
+            'fractions.Fraction': (('numerator', 'int'),
+                                   ('denominator', 'int'))}
         # Update the type lookups.
         self.update_type_lookups()
 
     def write(self, f, grp, name, data, type_string, options):
-        # data just needs to be converted to a dict and then pass it to
-        # the parent version of this function. The proper type_string
-        # needs to be grabbed now as the parent function will have a
-        # modified form of data to guess from if not given the right one
-        # explicitly.
+        # It is written as an HDF5 compound type if possible.
+        dset = self._write_compact(f, grp, name, data, type_string,
+                                   options)
+        if dset is not None:
+            return dset
+        # Otherwise, data just needs to be converted to a dict and then
+        # pass it to the parent version of this function. The proper
+        # type_string needs to be grabbed now as the parent function will
+        # have a modified form of data to guess from if not given the
+        # right one explicitly.
         return PythonDictMarshaller.write(
             self, f, grp, name,
             {'numerator': data.numerator,
@@ -2126,3 +2899,179 @@ class PythonChainMapMarshaller(PythonListMarshaller):
         # Passing it through ChainMap does all the work of making it a
         # ChainMap again.
         return collections.ChainMap(*data)
+
+
+class ScipySparseMatrixMarshaller(TypeMarshaller):
+    def __init__(self):
+        TypeMarshaller.__init__(self)
+        # We will not import scipy right away and instead let the rest
+        # of the API import it if needed, since it is large and none of
+        # the rest of this package uses it.
+        self.required_parent_modules = ('scipy', )
+        self.required_modules = ('scipy', 'scipy.sparse')
+        self.matlab_attributes |= set(('MATLAB_class', 'MATLAB_sparse'))
+        # The sparse matrix classes live in private modules whose names
+        # changed in scipy 1.8 (scipy.sparse.csc became
+        # scipy.sparse._csc), so both are listed. The type strings use
+        # the public names.
+        self.__formats = ('bsr', 'coo', 'csc', 'csr', 'dia', 'dok',
+                          'lil')
+        self.types = tuple(['scipy.sparse.' + prefix + fmt + '.'
+                            + fmt + '_matrix'
+                            for prefix in ('', '_')
+                            for fmt in self.__formats])
+        self.python_type_strings = tuple(['scipy.sparse.' + fmt
+                                          + '_matrix'
+                                          for fmt in self.__formats])
+        # MATLAB sparse matrices have the MATLAB class of their elements
+        # and so are found by the MATLAB_sparse Attribute instead.
+        self.matlab_classes = ()
+        # Update the type lookups, which only pairs up the types with
+        # the old module names with the type strings, so the ones with
+        # the new module names have to be added.
+        self.update_type_lookups()
+        self.type_to_typestring.update(zip(
+            self.types[len(self.__formats):], self.python_type_strings))
+
+    def write(self, f, grp, name, data, type_string, options):
+        # MATLAB only has double and logical sparse matrices, so other
+        # dtypes skip being written or throw an error if appropriate.
+        if options.matlab_compatible \
+                and data.dtype.type not in (np.bool_, np.float64,
+                                            np.complex128):
+            if options.action_for_matlab_incompatible == 'error':
+                raise hdf5storage.exceptions.TypeNotMatlabCompatibleError(
+                    'Sparse matrices of ' + data.dtype.name
+                    + ' are not supported by MATLAB.')
+            elif options.action_for_matlab_incompatible == 'discard':
+                return None
+
+        # The proper type_string needs to be grabbed now as the data is
+        # about to be converted to CSC format, which is how MATLAB
+        # stores sparse matrices. The row indices in each column must be
+        # sorted and without duplicates for MATLAB.
+        type_string = self.get_type_string(data, type_string)
+        csc = data.tocsc()
+        if not csc.has_canonical_format:
+            csc = csc.copy()
+            csc.sum_duplicates()
+
+        # The values are stored as is except that bools may need to be
+        # converted to uint8 and complex values must be encoded with the
+        # right field names. MATLAB doesn't write the values or row
+        # indices if there are no non-zero elements.
+        values = csc.data
+        if values.dtype.type == np.bool_ \
+                and options.convert_bools_to_uint8:
+            values = np.uint8(values)
+        elif values.dtype.kind == 'c':
+            values = encode_complex(values, options.complex_names)
+        components = [('jc', csc.indptr.astype(np.uint64))]
+        if csc.nnz != 0 or not options.matlab_compatible:
+            components.extend([('data', values),
+                               ('ir', csc.indices.astype(np.uint64))])
+
+        # If the group doesn't exist, it needs to be created. If it
+        # already exists but is not a group, it needs to be deleted
+        # before being created. Anything in it not being written needs
+        # to be deleted.
+        try:
+            grp2 = grp[name]
+            if not isinstance(grp[name], h5py.Group):
+                del grp[name]
+                grp2 = grp.create_group(name)
+        except:
+            grp2 = grp.create_group(name)
+        for field in set([i for i in grp2]).difference(
+                set([k for k, v in components])):
+            del grp2[field]
+
+        # Write the components directly, overwriting the existing
+        # Datasets in place when they can be reused.
+        for k, v in components:
+            filters, choice = get_dataset_filters(v, options)
+            if k in grp2:
+                dset = grp2[k]
+                if isinstance(dset, h5py.Dataset) \
+                        and dset.dtype == v.dtype \
+                        and dset.shape == v.shape \
+                        and dataset_has_filters(dset, filters):
+                    with instrumentation.span('write_dataset', dset,
+                                              bytes_in=v.nbytes):
+                        dset[...] = v
+                    continue
+                del grp2[k]
+            with instrumentation.span('create_dataset', grp2, k,
+                                      bytes_in=v.nbytes,
+                                      objects_created=1):
+                create_dataset(grp2, k, v, filters)
+
+        # Write the metadata. The number of rows is always needed to
+        # read it back.
+        self.write_metadata(f, grp2, csc, type_string, options,
+                            attributes={'MATLAB_sparse': (
+                                'value', np.uint64(csc.shape[0]))})
+        return grp2
+
+    def write_metadata(self, f, dsetgrp, data, type_string, options,
+                       attributes=None):
+        if attributes is None:
+            attributes = dict()
+        # If we are making it MATLAB compatible, the MATLAB_class
+        # attribute needs to be set for the data type.
+        if options.matlab_compatible:
+            if data.dtype.type == np.bool_:
+                attributes['MATLAB_class'] = ('string', 'logical')
+            elif data.dtype.type in (np.float64, np.complex128):
+                attributes['MATLAB_class'] = ('string', 'double')
+        TypeMarshaller.write_metadata(self, f, dsetgrp, data,
+                                      type_string, options,
+                                      attributes=attributes)
+
+    def _read_components(self, dsetgrp, attributes, options):
+        # Reads the shape, values, row indices, and column pointers of
+        # the matrix in CSC format. MATLAB may allocate more space for
+        # the values and row indices than there are non-zero elements,
+        # so they must be truncated.
+        if not isinstance(dsetgrp, h5py.Group) \
+                or attributes['MATLAB_sparse'] is None \
+                or 'jc' not in dsetgrp:
+            raise NotImplementedError('Not a sparse matrix.')
+        jc = dsetgrp['jc'][...].ravel()
+        shape = (int(attributes['MATLAB_sparse']), jc.size - 1)
+        matlab_class = convert_attribute_to_string(
+            attributes['MATLAB_class'])
+        if 'data' in dsetgrp and 'ir' in dsetgrp:
+            nnz = int(jc[-1])
+            data = decode_complex(dsetgrp['data'][...],
+                                  options.complex_names).ravel()[:nnz]
+            ir = dsetgrp['ir'][...].ravel()[:nnz]
+        else:
+            data = np.float64([])
+            ir = np.uint64([])
+        if matlab_class == 'logical':
+            data = data.astype(np.bool_)
+        return shape, data, ir, jc
+
+    def read(self, f, dsetgrp, attributes, options):
+        shape, data, ir, jc = self._read_components(dsetgrp, attributes,
+                                                    options)
+        sparse = importlib.import_module('scipy.sparse')
+        out = sparse.csc_matrix((data, ir, jc), shape=shape)
+        # The type string determines which format to convert it to.
+        type_string = convert_attribute_to_string(
+            attributes['Python.Type'])
+        if type_string in self.typestring_to_type \
+                and type_string != 'scipy.sparse.csc_matrix':
+            out = out.asformat(type_string[13:-7])
+        return out
+
+    def read_approximate(self, f, dsetgrp, attributes, options):
+        # Without scipy, the best approximation is the dense array.
+        shape, data, ir, jc = self._read_components(dsetgrp, attributes,
+                                                    options)
+        out = np.zeros(shape, dtype=data.dtype)
+        out[ir.astype(np.intp),
+            np.repeat(np.arange(shape[1]),
+                      np.diff(jc.astype(np.intp)))] = data
+        return out
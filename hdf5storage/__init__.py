@@ -36,25 +36,34 @@ Version 0.2
 
 __version__ = "0.2"
 
+import atexit
+import collections
 import collections.abc
-import copy
+import concurrent.futures
+import contextlib
+import copy as copy_module
 import datetime
 import importlib
-import inspect
 import itertools
 import os
+import pickle
 import pkgutil
 import posixpath
+import shutil
 import sys
+import tempfile
 import threading
 
 import h5py
 
+from . import instrumentation
 from . import pathesc
 from . import plugins
 from . import utilities
 from . import Marshallers
 
+from .instrumentation import instrument
+
 
 class Options(object):
     """ Set of options governing how data is read/written to/from disk.
@@ -74,6 +83,11 @@ class Options(object):
     make_atleast_2d                     ``True``
     convert_numpy_bytes_to_utf16        ``True``
     convert_numpy_str_to_utf16          ``True``
+    convert_numpy_str_to_utf8           ``False``
+    ragged_arrays_as_vlen               ``False``
+    str_collections_as_vlen             ``False``
+    convert_datetime64_to_datenum       ``True``
+    fixed_field_objects_as_compound     ``False``
     convert_bools_to_uint8              ``True``
     reverse_dimension_order             ``True``
     store_shape_for_empty               ``True``
@@ -135,6 +149,34 @@ class Options(object):
         See Attributes.
     uncompressed_fletcher32_filter : bool, optional
         See Attributes.
+    adaptive_compression : bool, optional
+        See Attributes.
+    adaptive_compression_objective : str, optional
+        See Attributes.
+    adaptive_compression_min_throughput : float, optional
+        See Attributes.
+    adaptive_compression_sample_size : int, optional
+        See Attributes.
+    scaleoffset_filter : dict, optional
+        See Attributes.
+    nbit_filter : dict, optional
+        See Attributes.
+    garbage_collection_threshold : float or None, optional
+        See Attributes.
+    convert_numpy_str_to_utf8 : bool, optional
+        See Attributes.
+    ragged_arrays_as_vlen : bool, optional
+        See Attributes.
+    str_collections_as_vlen : bool, optional
+        See Attributes.
+    convert_datetime64_to_datenum : bool, optional
+        See Attributes.
+    fixed_field_objects_as_compound : bool, optional
+        See Attributes.
+    write_memory_budget : int, optional
+        See Attributes.
+    delta_checkpoints : bool, optional
+        See Attributes.
     marshaller_collection : MarshallerCollection, optional
         See Attributes.
     **keywords :
@@ -167,6 +209,20 @@ class Options(object):
     shuffle_filter : bool
     compressed_fletcher32_filter : bool
     uncompressed_fletcher32_filter : bool
+    adaptive_compression : bool
+    adaptive_compression_objective : {'size', 'throughput'}
+    adaptive_compression_min_throughput : float
+    adaptive_compression_sample_size : int
+    scaleoffset_filter : dict
+    nbit_filter : dict
+    garbage_collection_threshold : float or None
+    convert_numpy_str_to_utf8 : bool
+    ragged_arrays_as_vlen : bool
+    str_collections_as_vlen : bool
+    convert_datetime64_to_datenum : bool
+    fixed_field_objects_as_compound : bool
+    write_memory_budget : int
+    delta_checkpoints : bool
     marshaller_collection : MarshallerCollection
         Collection of marshallers to disk.
 
@@ -195,6 +251,20 @@ class Options(object):
                  shuffle_filter=True,
                  compressed_fletcher32_filter=True,
                  uncompressed_fletcher32_filter=False,
+                 adaptive_compression=False,
+                 adaptive_compression_objective='size',
+                 adaptive_compression_min_throughput=100.0,
+                 adaptive_compression_sample_size=256*1024,
+                 scaleoffset_filter=None,
+                 nbit_filter=None,
+                 garbage_collection_threshold=None,
+                 convert_numpy_str_to_utf8=False,
+                 ragged_arrays_as_vlen=False,
+                 str_collections_as_vlen=False,
+                 convert_datetime64_to_datenum=False,
+                 fixed_field_objects_as_compound=False,
+                 write_memory_budget=256*1024*1024,
+                 delta_checkpoints=False,
                  marshaller_collection=None,
                  **keywords):
         # Set the defaults.
@@ -222,6 +292,20 @@ class Options(object):
         self._shuffle_filter = True
         self._compressed_fletcher32_filter = True
         self._uncompressed_fletcher32_filter = False
+        self._adaptive_compression = False
+        self._adaptive_compression_objective = 'size'
+        self._adaptive_compression_min_throughput = 100.0
+        self._adaptive_compression_sample_size = 256*1024
+        self._scaleoffset_filter = dict()
+        self._nbit_filter = dict()
+        self._garbage_collection_threshold = None
+        self._convert_numpy_str_to_utf8 = False
+        self._ragged_arrays_as_vlen = False
+        self._str_collections_as_vlen = False
+        self._convert_datetime64_to_datenum = False
+        self._fixed_field_objects_as_compound = False
+        self._write_memory_budget = 256*1024*1024
+        self._delta_checkpoints = False
         self._matlab_compatible = True
 
         # Apply all the given options using the setters, making sure to
@@ -254,6 +338,26 @@ class Options(object):
         self.compressed_fletcher32_filter = compressed_fletcher32_filter
         self.uncompressed_fletcher32_filter = \
             uncompressed_fletcher32_filter
+        self.adaptive_compression = adaptive_compression
+        self.adaptive_compression_objective = \
+            adaptive_compression_objective
+        self.adaptive_compression_min_throughput = \
+            adaptive_compression_min_throughput
+        self.adaptive_compression_sample_size = \
+            adaptive_compression_sample_size
+        self.scaleoffset_filter = scaleoffset_filter
+        self.nbit_filter = nbit_filter
+        self.garbage_collection_threshold = \
+            garbage_collection_threshold
+        self.convert_numpy_str_to_utf8 = convert_numpy_str_to_utf8
+        self.ragged_arrays_as_vlen = ragged_arrays_as_vlen
+        self.str_collections_as_vlen = str_collections_as_vlen
+        self.convert_datetime64_to_datenum = \
+            convert_datetime64_to_datenum
+        self.fixed_field_objects_as_compound = \
+            fixed_field_objects_as_compound
+        self.write_memory_budget = write_memory_budget
+        self.delta_checkpoints = delta_checkpoints
         self.matlab_compatible = matlab_compatible
 
         # Use the given marshaller collection if it was
@@ -334,6 +438,11 @@ class Options(object):
         make_atleast_2d                     ``True``
         convert_numpy_bytes_to_utf16        ``True``
         convert_numpy_str_to_utf16          ``True``
+        convert_numpy_str_to_utf8           ``False``
+        ragged_arrays_as_vlen               ``False``
+        str_collections_as_vlen             ``False``
+        convert_datetime64_to_datenum       ``True``
+        fixed_field_objects_as_compound     ``False``
         convert_bools_to_uint8              ``True``
         reverse_dimension_order             ``True``
         store_shape_for_empty               ``True``
@@ -361,7 +470,12 @@ class Options(object):
                 self._make_atleast_2d = True
                 self._convert_numpy_bytes_to_utf16 = True
                 self._convert_numpy_str_to_utf16 = True
+                self._convert_numpy_str_to_utf8 = False
+                self._ragged_arrays_as_vlen = False
+                self._str_collections_as_vlen = False
+                self._fixed_field_objects_as_compound = False
                 self._convert_bools_to_uint8 = True
+                self._convert_datetime64_to_datenum = True
                 self._reverse_dimension_order = True
                 self._store_shape_for_empty = True
                 self._complex_names = ('real', 'imag')
@@ -979,6 +1093,542 @@ class Options(object):
             self._uncompressed_fletcher32_filter = value
 
 
+    @property
+    def adaptive_compression(self):
+        """ Whether to choose the compression for each object by sampling.
+
+        bool
+
+        If ``True`` (default is ``False``), python objects (datasets)
+        that are to be compressed (``compress`` is set and they are at
+        least ``compress_size_threshold`` in size) have a sample of
+        their data compressed with several candidate settings, and the
+        setting that best meets ``adaptive_compression_objective`` is
+        used instead of ``compression_algorithm``,
+        ``gzip_compression_level``, and ``shuffle_filter``. The
+        candidates are no compression, and the ``'gzip'`` algorithm at
+        levels 1, 4, and 9 and the ``'lzf'`` algorithm each with and
+        without the shuffle filter. Only the ``'gzip'`` candidates (and
+        no compression) are used if doing MATLAB compatibility. The
+        setting chosen is stored in the ``'Python.Compression'``
+        Attribute of the Dataset if ``store_python_metadata`` is set.
+
+        Data that doesn't compress well (random numbers, already
+        compressed bytes, etc.) is then stored uncompressed rather than
+        paying the cost of compressing and decompressing it for little
+        or no gain.
+
+        See Also
+        --------
+        compress
+        adaptive_compression_objective
+        adaptive_compression_sample_size
+        utilities.get_dataset_filters
+
+        """
+        return self._adaptive_compression
+
+    @adaptive_compression.setter
+    def adaptive_compression(self, value):
+        # Check that it is a bool, and then set it. This option does not
+        # effect MATLAB compatibility.
+        if isinstance(value, bool):
+            self._adaptive_compression = value
+
+    @property
+    def adaptive_compression_objective(self):
+        """ What adaptive compression chooses the compression by.
+
+        {'size', 'throughput'}
+
+        The objective used to choose the compression setting when
+        ``adaptive_compression`` is set. ``'size'`` (default) chooses
+        the setting that makes the sample the smallest. ``'throughput'``
+        chooses the setting that makes the sample the smallest out of
+        those that write it at least as fast as
+        ``adaptive_compression_min_throughput`` (the fastest setting is
+        chosen if none are fast enough).
+
+        See Also
+        --------
+        adaptive_compression
+        adaptive_compression_min_throughput
+
+        """
+        return self._adaptive_compression_objective
+
+    @adaptive_compression_objective.setter
+    def adaptive_compression_objective(self, value):
+        # Check that it is one of the allowed values, and then set
+        # it. This option does not effect MATLAB compatibility.
+        if value in ('size', 'throughput'):
+            self._adaptive_compression_objective = value
+
+    @property
+    def adaptive_compression_min_throughput(self):
+        """ Minimum write throughput for adaptive compression in MB/s.
+
+        float
+
+        The minimum speed, in MB/s (1e6 bytes per second of
+        uncompressed data), a compression setting must write the sample
+        at to be chosen when ``adaptive_compression_objective`` is
+        ``'throughput'``. Must be positive. The default is 100.
+
+        See Also
+        --------
+        adaptive_compression
+        adaptive_compression_objective
+
+        """
+        return self._adaptive_compression_min_throughput
+
+    @adaptive_compression_min_throughput.setter
+    def adaptive_compression_min_throughput(self, value):
+        # Check that it is a positive number, and then set it. This
+        # option does not effect MATLAB compatibility.
+        if isinstance(value, (int, float)) \
+                and not isinstance(value, bool) and value > 0:
+            self._adaptive_compression_min_throughput = float(value)
+
+    @property
+    def adaptive_compression_sample_size(self):
+        """ Size of the sample used by adaptive compression in bytes.
+
+        int
+
+        The maximum number of bytes of the data that is compressed with
+        each candidate setting when ``adaptive_compression`` is set. The
+        sample is made of evenly spaced blocks of the data. Larger
+        samples make better choices but take longer. Must be
+        positive. The default is 256 KiB.
+
+        See Also
+        --------
+        adaptive_compression
+
+        """
+        return self._adaptive_compression_sample_size
+
+    @adaptive_compression_sample_size.setter
+    def adaptive_compression_sample_size(self, value):
+        # Check that it is a positive integer, and then set it. This
+        # option does not effect MATLAB compatibility.
+        if isinstance(value, int) and not isinstance(value, bool) \
+                and value > 0:
+            self._adaptive_compression_sample_size = value
+
+    @property
+    def scaleoffset_filter(self):
+        """ Per-dtype rules for using the scale-offset filter.
+
+        dict
+
+        ``dict`` (default is empty) mapping numpy dtypes (anything
+        ``numpy.dtype`` accepts, such as ``'int16'`` or
+        ``numpy.float32``) of integer, ``numpy.float32``, and
+        ``numpy.float64`` data to the
+        setting to use the HDF5 scale-offset filter with for Datasets of
+        that dtype (as stored, so after conversions such as ``bool`` to
+        ``numpy.uint8`` when doing MATLAB compatibility). The filter
+        stores each chunk as offsets from its minimum using as few bits
+        as needed, and is built into HDF5 (no plugins are needed to read
+        it).
+
+        For integer dtypes, the setting is the minimum number of bits to
+        store each element with, or ``0`` to work it out from the
+        data. The setting is lossless; ``0`` is used if the data doesn't
+        fit in the given number of bits. For floating point dtypes, the
+        setting is the number of decimal digits after the decimal point
+        to keep, which is LOSSY. It is not used for floating point data
+        that has NaNs or infinities. Setting it turns off the fletcher32
+        filter for those Datasets, which HDF5 can't use with it.
+
+        Setting it to ``None`` or anything invalid is the same as
+        leaving it unchanged, except when making the ``Options``
+        where ``None`` gives the default. It has no effect on scalars and
+        empty arrays, and does not affect MATLAB compatibility since the
+        filter is part of every HDF5 library. Takes precedence over
+        ``nbit_filter``.
+
+        See Also
+        --------
+        nbit_filter
+        utilities.get_dataset_filters
+
+        """
+        return dict(self._scaleoffset_filter)
+
+    @scaleoffset_filter.setter
+    def scaleoffset_filter(self, value):
+        # Check that it is a dict of valid rules, and then set it. This
+        # option does not effect MATLAB compatibility.
+        rules = utilities.normalize_filter_rules(value, 'iuf')
+        if rules is not None:
+            self._scaleoffset_filter = rules
+
+    @property
+    def nbit_filter(self):
+        """ Per-dtype rules for using the n-bit filter.
+
+        dict
+
+        ``dict`` (default is empty) mapping numpy integer dtypes
+        (anything ``numpy.dtype`` accepts, such as ``'int16'``) to the
+        number of bits of precision to store Datasets of that dtype (as
+        stored, so after conversions such as ``bool`` to ``numpy.uint8``
+        when doing MATLAB compatibility) with using the HDF5 n-bit
+        filter. For example, ``{'int16': 12}`` stores the samples of a
+        12-bit ADC held in ``numpy.int16`` arrays in 12 bits each. The
+        Dataset keeps its dtype, so it reads back the same, and the
+        filter is built into HDF5 (no plugins are needed to read it).
+
+        The setting is lossless; data that doesn't fit in the given
+        number of bits is stored at full precision. Setting it to
+        ``None`` or anything invalid is the same as leaving it
+        unchanged, except when making the ``Options`` where ``None``
+        gives the default. It has no effect on scalars and empty
+        arrays, and does not affect MATLAB compatibility since the
+        filter is part of every HDF5 library.
+
+        See Also
+        --------
+        scaleoffset_filter
+        utilities.get_dataset_filters
+
+        """
+        return dict(self._nbit_filter)
+
+    @nbit_filter.setter
+    def nbit_filter(self, value):
+        # Check that it is a dict of valid rules, and then set it. This
+        # option does not effect MATLAB compatibility.
+        rules = utilities.normalize_filter_rules(value, 'iu')
+        if rules is not None:
+            self._nbit_filter = rules
+
+    @property
+    def garbage_collection_threshold(self):
+        """ Orphan ratio at which to collect garbage when closing.
+
+        float or None
+
+        If not ``None`` (the default), ``File.collect_garbage`` is run
+        when a writable ``File`` is closed if the fraction of the
+        objects in ``group_for_references`` (other than the canonical
+        empty ``'a'``) that nothing points to anymore is at least
+        this. Must be between 0 and 1 (a float or an ``int``), with 0
+        collecting garbage on every close.
+
+        See Also
+        --------
+        File.collect_garbage
+        group_for_references
+
+        """
+        return self._garbage_collection_threshold
+
+    @garbage_collection_threshold.setter
+    def garbage_collection_threshold(self, value):
+        # Check that it is None or a number between 0 and 1, and then
+        # set it. This option does not effect MATLAB compatibility.
+        if value is None:
+            self._garbage_collection_threshold = None
+        elif isinstance(value, (int, float)) \
+                and not isinstance(value, bool) and 0 <= value <= 1:
+            self._garbage_collection_threshold = float(value)
+
+    @property
+    def convert_numpy_str_to_utf8(self):
+        """ Whether or not to store ``numpy.unicode_`` as UTF-8.
+
+        bool
+
+        If ``True`` (defaults to ``False``), ``numpy.unicode_`` and
+        arrays of them are encoded to UTF-8 and written as fixed length
+        HDF5 strings with the UTF-8 character set, each string taking
+        as many bytes as the longest encoded string. This is a quarter
+        of the size of the UTF-32 form for ASCII text and is used
+        instead of `convert_numpy_str_to_utf16`. The original
+        ``numpy.unicode_`` dtype is restored when read back.
+
+        Must be ``False`` if doing MATLAB compatibility since MATLAB
+        can't read it. Setting it to ``True`` turns MATLAB
+        compatibility off.
+
+        .. versionadded:: 0.2
+
+        See Also
+        --------
+        convert_numpy_str_to_utf16
+        matlab_compatible
+
+        """
+        return self._convert_numpy_str_to_utf8
+
+    @convert_numpy_str_to_utf8.setter
+    def convert_numpy_str_to_utf8(self, value):
+        # Check that it is a bool, and then set it. If it is true, we
+        # are not doing MATLAB compatible formatting.
+        if isinstance(value, bool):
+            self._convert_numpy_str_to_utf8 = value
+        if self._convert_numpy_str_to_utf8:
+            self._matlab_compatible = False
+
+    @property
+    def ragged_arrays_as_vlen(self):
+        """ Whether to write sequences of 1D arrays as one vlen Dataset.
+
+        bool
+
+        If ``True`` (defaults to ``False``), ``list``, ``tuple``, and
+        other sequences as well as object ``numpy.ndarray`` whose
+        elements are all 1D
+        ``numpy.ndarray`` of the same integer or floating point dtype
+        (but possibly different lengths) are written as a single
+        Dataset of the HDF5 variable length type instead of writing
+        each element to its own Dataset in `group_for_references` and
+        pointing to them with an array of HDF5 References. Writing and
+        reading them is then much faster when there are many elements.
+        They are read back as the same container holding the arrays.
+        Versions of this package before 0.2 can't read them, which is
+        why it is off by default.
+
+        Must be ``False`` if doing MATLAB compatibility since MATLAB
+        can't read HDF5 variable length types. Setting it to ``True``
+        turns MATLAB compatibility off.
+
+        .. versionadded:: 0.2
+
+        See Also
+        --------
+        group_for_references
+        h5py.vlen_dtype
+
+        """
+        return self._ragged_arrays_as_vlen
+
+    @ragged_arrays_as_vlen.setter
+    def ragged_arrays_as_vlen(self, value):
+        # Check that it is a bool, and then set it. If it is true, we
+        # are not doing MATLAB compatible formatting.
+        if isinstance(value, bool):
+            self._ragged_arrays_as_vlen = value
+        if self._ragged_arrays_as_vlen:
+            self._matlab_compatible = False
+
+    @property
+    def str_collections_as_vlen(self):
+        """ Whether to write collections of ``str`` as one vlen Dataset.
+
+        bool
+
+        If ``True`` (defaults to ``False``), ``list``, ``tuple``,
+        ``set``, and other collections as well as object
+        ``numpy.ndarray`` whose elements are all ``str``
+        (not subclasses such as ``numpy.unicode_``) are written as a
+        single Dataset of HDF5 variable length UTF-8 strings instead of
+        writing each string to its own Dataset in
+        `group_for_references` and pointing to them with an array of
+        HDF5 References. Collections with strings that have null
+        characters or can't be encoded to UTF-8 (lone surrogates) are
+        still written the other way. They are read back as the same
+        container holding the strings. Versions of this package before
+        0.2 read them back as the container holding ``bytes`` instead,
+        which is why it is off by default.
+
+        Must be ``False`` if doing MATLAB compatibility since MATLAB
+        can't read HDF5 variable length types. Setting it to ``True``
+        turns MATLAB compatibility off.
+
+        .. versionadded:: 0.2
+
+        See Also
+        --------
+        group_for_references
+        ragged_arrays_as_vlen
+        h5py.string_dtype
+
+        """
+        return self._str_collections_as_vlen
+
+    @str_collections_as_vlen.setter
+    def str_collections_as_vlen(self, value):
+        # Check that it is a bool, and then set it. If it is true, we
+        # are not doing MATLAB compatible formatting.
+        if isinstance(value, bool):
+            self._str_collections_as_vlen = value
+        if self._str_collections_as_vlen:
+            self._matlab_compatible = False
+
+    @property
+    def convert_datetime64_to_datenum(self):
+        """ Whether or not to store ``numpy.datetime64`` as datenums.
+
+        bool
+
+        If ``True`` (defaults to ``False`` unless MATLAB compatibility
+        is being done), ``numpy.datetime64`` and arrays of them are
+        converted to MATLAB datenums (``numpy.float64`` days since
+        January 0, year 0000) and ``numpy.timedelta64`` to
+        ``numpy.float64`` days before being written to file. ``NaT``
+        becomes ``NaN``. Datenums have a resolution of about 10
+        microseconds for present day dates. Otherwise, they are written
+        as the ``numpy.int64`` counts of their unit. Either way, the
+        dtype including the unit is stored in the
+        ``'hdf5storage.TimeUnit'`` Attribute so that they are read back
+        into the original dtype. ``numpy.timedelta64`` in years or
+        months can't be converted to days and are not MATLAB
+        compatible.
+
+        Must be ``True`` if doing MATLAB compatibility. MATLAB doesn't
+        know the units of the counts.
+
+        .. versionadded:: 0.2
+
+        See Also
+        --------
+        hdf5storage.utilities.convert_datetime64_to_datenum
+
+        """
+        return self._convert_datetime64_to_datenum
+
+    @convert_datetime64_to_datenum.setter
+    def convert_datetime64_to_datenum(self, value):
+        # Check that it is a bool, and then set it. If it is false, we
+        # are not doing MATLAB compatible formatting.
+        if isinstance(value, bool):
+            self._convert_datetime64_to_datenum = value
+        if not self._convert_datetime64_to_datenum:
+            self._matlab_compatible = False
+
+    @property
+    def fixed_field_objects_as_compound(self):
+        """ Whether to write fixed field objects as compound Datasets.
+
+        bool
+
+        If ``True`` (defaults to ``False``), ``slice``, ``range``,
+        ``fractions.Fraction``, and the
+        ``datetime`` types (``timedelta``, ``timezone``, ``date``,
+        ``time``, and ``datetime``) are each written as a single
+        Dataset of an HDF5 compound type with an ``int64`` field for
+        each of their attributes instead of as a Group with a Dataset
+        for each attribute. Collections and object ``numpy.ndarray``
+        whose elements are all the same one of these types are written
+        columnar as a single compound Dataset as well instead of
+        writing each element to `group_for_references`. The type of the
+        elements is put in the ``'hdf5storage.CompactType'`` Attribute.
+        Objects that don't fit, such as ``slice`` with non-integer
+        parts, ``int`` parts too big for ``int64``, or times whose
+        ``tzinfo`` isn't ``None`` or an unnamed
+        ``datetime.timezone``, are written the other way, as is
+        everything if `store_python_metadata` is ``False`` since the
+        type is needed to decode them. Versions of this package before
+        0.2 can't read them, which is why it is off by default.
+
+        Must be ``False`` if doing MATLAB compatibility since MATLAB
+        would not know what they are. Setting it to ``True`` turns
+        MATLAB compatibility off.
+
+        .. versionadded:: 0.2
+
+        See Also
+        --------
+        group_for_references
+        store_python_metadata
+        hdf5storage.Marshallers.TypeMarshaller.encode_compact
+
+        """
+        return self._fixed_field_objects_as_compound
+
+    @fixed_field_objects_as_compound.setter
+    def fixed_field_objects_as_compound(self, value):
+        # Check that it is a bool, and then set it. If it is true, we
+        # are not doing MATLAB compatible formatting.
+        if isinstance(value, bool):
+            self._fixed_field_objects_as_compound = value
+        if self._fixed_field_objects_as_compound:
+            self._matlab_compatible = False
+
+    @property
+    def write_memory_budget(self):
+        """ Memory to use at most when writing an array, in bytes.
+
+        int
+
+        numpy arrays (including ``numpy.memmap`` and views of other big
+        buffers) larger than this many bytes are written in blocks
+        instead of all at once, so that the conversions done before
+        writing (such as transposing, ``bool`` to ``numpy.uint8``, and
+        encoding complex numbers) and the contiguous copy HDF5 needs are
+        never done on more than a block at a time. The blocks are taken
+        along the axis that is slowest in memory so each one is read
+        sequentially from the source, and are aligned to the chunks of
+        the Dataset if it is chunked (compressed or filtered) so no
+        chunk is written more than once. Deciding the filters to use
+        (``adaptive_compression``, ``scaleoffset_filter``, and
+        ``nbit_filter``) is done in blocks the same way. Only arrays of
+        booleans, numbers, ``numpy.datetime64``, and
+        ``numpy.timedelta64`` are written in blocks. Must be
+        positive. The default is 256 MiB.
+
+        .. versionadded:: 0.2
+
+        See Also
+        --------
+        utilities.get_array_blocks
+
+        """
+        return self._write_memory_budget
+
+    @write_memory_budget.setter
+    def write_memory_budget(self, value):
+        # Check that it is a positive integer, and then set it. This
+        # option does not effect MATLAB compatibility.
+        if isinstance(value, int) and not isinstance(value, bool) \
+                and value > 0:
+            self._write_memory_budget = value
+
+    @property
+    def delta_checkpoints(self):
+        """ Whether to only rewrite the chunks of arrays that changed.
+
+        bool
+
+        If ``True``, non-scalar arrays of bools, numbers,
+        ``numpy.datetime64``, and ``numpy.timedelta64`` are always
+        written to chunked Datasets, and a hash of each chunk is stored
+        in a Dataset in `group_for_references` that the
+        ``'hdf5storage.ChunkHashes'`` Attribute of the Dataset refers to.
+        When such an array is written over an existing Dataset with the
+        same dtype, shape, and filters (for example, saving the state of
+        a simulation at each checkpoint), each chunk of the new data is
+        hashed and only the chunks whose hashes differ from the stored
+        ones are written, so the I/O is proportional to what changed
+        instead of to the size of the array. Chunks compressed with only
+        the gzip and shuffle filters are compressed by hdf5storage and
+        written directly, bypassing the HDF5 filter pipeline. The hashes
+        are discarded by any write done with this option off. Data
+        written to the Dataset by other means makes the hashes stale.
+        The default is ``False``.
+
+        .. versionadded:: 0.2
+
+        See Also
+        --------
+        write_memory_budget
+
+        """
+        return self._delta_checkpoints
+
+    @delta_checkpoints.setter
+    def delta_checkpoints(self, value):
+        # Check that it is a bool, and then set it. This option does not
+        # effect MATLAB compatibility.
+        if isinstance(value, bool):
+            self._delta_checkpoints = value
+
 class MarshallerCollection(object):
     """ Represents, maintains, and retreives a set of marshallers.
 
@@ -1071,15 +1721,11 @@ class MarshallerCollection(object):
         # builtin ones in the Marshallers module, and another for user
         # supplied ones.
 
-        # Grab all the marshallers in the Marshallers module (they are
-        # the classes that inherit from TypeMarshaller) by inspection.
-        self._builtin_marshallers = [
-            m()
-            for key, m in dict(inspect.getmembers(
-                    Marshallers,
-                    lambda x: inspect.isclass(x)
-                    and Marshallers.TypeMarshaller
-                    in inspect.getmro(x))).items()]
+        # Instantiate all the marshallers in the Marshallers module (they
+        # are the classes that inherit from TypeMarshaller). Finding
+        # them is only done once per process.
+        self._builtin_marshallers = [m() for m in
+                                     _get_builtin_marshaller_classes()]
 
         # If loading marshallers from plugins, grab all the entry points
         # by version and then go through them in version order, load the
@@ -1465,6 +2111,109 @@ class MarshallerCollection(object):
             return None, False
 
 
+# Counter to give each in memory file a unique name, since HDF5 treats
+# files with the same name as the same file.
+_in_memory_file_counter = itertools.count()
+
+
+def _is_file_like(obj):
+    # Whether obj is a file-like object h5py can open a file in.
+    return hasattr(obj, 'read') and hasattr(obj, 'seek')
+
+
+def _file_exists(filename):
+    # Whether a file exists, which for file-like objects is whether
+    # they are non-empty.
+    if isinstance(filename, str):
+        return os.path.isfile(filename)
+    filename.seek(0, 2)
+    return filename.tell() > 0
+
+
+def _write_at_start(filename, data, truncate=False):
+    # Writes data to the start of a file or file-like object, truncating
+    # it after the data if indicated.
+    if isinstance(filename, str):
+        with open(filename, 'wb' if truncate else 'r+b') as f:
+            f.write(data)
+    else:
+        filename.seek(0)
+        filename.write(data)
+        if truncate:
+            filename.truncate()
+
+
+# The HDF5 signature, which is at the start of the superblock. It is
+# looked for at 0, 512, 1024, 2048, etc.
+_hdf5_signature = b'\x89HDF\r\n\x1a\n'
+
+
+def _find_userblock_size(filename):
+    # Finds the size of the userblock of an HDF5 file (or file-like
+    # object) from where the superblock is, or None if it isn't an HDF5
+    # file.
+    if isinstance(filename, str):
+        with open(filename, 'rb') as f:
+            return _find_userblock_size(f)
+    size = filename.seek(0, 2)
+    if size is None:
+        size = filename.tell()
+    offset = 0
+    while offset + len(_hdf5_signature) <= size:
+        filename.seek(offset)
+        if filename.read(len(_hdf5_signature)) == _hdf5_signature:
+            return offset
+        offset = max(512, 2 * offset)
+    return None
+
+
+# The image of an empty HDF5 file (without its userblock), which is
+# made on first use. It must be packed into a list so that it can be
+# set.
+_empty_file_image = [None]
+
+
+def _get_empty_file_image():
+    # Gets the image of an empty HDF5 file with a 512 byte userblock
+    # (the image doesn't include the userblock itself), making it if it
+    # hasn't been made yet.
+    if _empty_file_image[0] is None:
+        name = '<in memory {0}>'.format(next(_in_memory_file_counter))
+        with h5py.File(name, mode='w', driver='core',
+                       backing_store=False, userblock_size=512) as f:
+            f.flush()
+            _empty_file_image[0] = f.id.get_file_image()
+    return _empty_file_image[0]
+
+
+def _make_matlab_header():
+    # Makes the 128 byte header MATLAB puts at the beginning of the
+    # userblock of MAT files.
+    #
+    # Get the time.
+    now = datetime.datetime.now()
+    # Construct the leading string. The MATLAB one looks like
+    #
+    # s = 'MATLAB 7.3 MAT-file, Platform: GLNXA64, ' \
+    #     'Created on: ' \
+    #     + now.strftime('%a %b %d %H:%M:%S %Y') \
+    #     + ' HDF5 schema 1.00 .'
+    #
+    # Platform is going to be changed to hdf5storage version.
+    s = 'MATLAB 7.3 MAT-file, Platform: hdf5storage ' \
+        + __version__ + ', Created on: ' \
+        + now.strftime('%a %b %d %H:%M:%S %Y') \
+        + ' HDF5 schema 1.00 .'
+
+    # Make the bytearray while padding with spaces up to 128-12 (the
+    # minus 12 is there since the last 12 bytes are special).
+    b = bytearray(s + (128-12-len(s))*' ', encoding='utf-8')
+    # Add 8 nulls (0) and the magic number (or something) that MATLAB
+    # uses.
+    b.extend(bytearray.fromhex('00000000 00000000 0002494D'))
+    return bytes(b)
+
+
 class File(collections.abc.MutableMapping):
     """ Wrapper that allows writing and reading data from an HDF5 file.
 
@@ -1532,8 +2281,18 @@ class File(collections.abc.MutableMapping):
 
     Parameters
     ----------
-    filename : str, optional
-        The path to the HDF5 file to open. The default is ``'data.h5'``.
+    filename : str or file-like, optional
+        The path to the HDF5 file to open, or a binary file-like object
+        (such as ``io.BytesIO`` or ``blockcache.BlockCache``) holding
+        it, which must have ``read`` (or ``readinto``), ``seek``, and
+        ``tell`` methods and also ``write``, ``truncate``, and
+        ``flush`` methods if `writable` is ``True``. A file-like object
+        is considered to not exist yet if it is empty, and is not
+        closed when the file is. The default is ``'data.h5'``.
+
+        .. versionchanged:: 0.2
+           File-like objects are supported.
+
     writable : bool, optional
         Whether the writing should be allowed or not. The default is
         ``False`` (readonly).
@@ -1549,6 +2308,22 @@ class File(collections.abc.MutableMapping):
         The options to use when reading and/or writing. Is mutually
         exclusive with any additional keyword arguments given (set to
         ``None`` or don't provide the argument at all to use them).
+    in_memory : bool, optional
+        Whether the file should only be in memory (using HDF5's core
+        driver) instead of on disk, in which case `filename` is
+        ignored. Its contents can be gotten with ``to_bytes``. The
+        default is ``False``.
+
+        .. versionadded:: 0.2
+
+    image : bytes-like or None, optional
+        If `in_memory` is ``True``, the contents of a whole HDF5 file
+        (such as from ``to_bytes`` or ``dumps``) to start the file from,
+        which is required if `writable` is ``False``. Changes are not
+        written back to it. The default is ``None``.
+
+        .. versionadded:: 0.2
+
     **keywords :
         If `options` was not provided or was ``None``, these are used as
         arguments to make a ``Options``.
@@ -1577,7 +2352,8 @@ class File(collections.abc.MutableMapping):
 
     def __init__(self, filename='data.h5', writable=False,
                  truncate_existing=False, truncate_invalid_matlab=False,
-                 options=None, **keywords):
+                 options=None, in_memory=False, image=None,
+                 **keywords):
         # Before we do anything else, we need to make the attributes for
         # the file handle, the options, and a lock. This way, these
         # attributes are available in __del__ even if there is an
@@ -1585,9 +2361,24 @@ class File(collections.abc.MutableMapping):
         self._file = None
         self._options = None
         self._lock = threading.Lock()
+        # The userblock of in memory files, which HDF5 doesn't keep in
+        # the file image, and the file-like object if given one.
+        self._userblock = None
+        self._fileobj = None if isinstance(filename, str) else filename
         # Check the types of the arguments.
-        if not isinstance(filename, str):
-            raise TypeError('filename must be str.')
+        if not isinstance(filename, str) \
+                and not _is_file_like(filename):
+            raise TypeError('filename must be str or a file-like '
+                            'object.')
+        if not isinstance(in_memory, bool):
+            raise TypeError('in_memory must be bool.')
+        if image is not None:
+            if not in_memory:
+                raise ValueError('image can only be given if in_memory.')
+            image = bytes(memoryview(image))
+        elif in_memory and not writable:
+            raise ValueError('image must be given if in_memory and not '
+                             'writable.')
         if not isinstance(writable, bool):
             raise TypeError('writable must be bool.')
         if not isinstance(truncate_existing, bool):
@@ -1604,77 +2395,97 @@ class File(collections.abc.MutableMapping):
             raise ValueError('Extra keyword arguments cannot be passed '
                              'if options is not None.')
         else:
-            options = copy.copy(options)
+            options = copy_module.copy(options)
         # Store the required arguments.
-        self._writable = True
+        self._writable = writable
         self._options = options
-        # Open the file. If writable is False, we can just open it. If
-        # it is True, the process is longer.
-        if not writable:
+        # Open the file. In memory files are done separately. If
+        # writable is False, we can just open it. If it is True, the
+        # process is longer.
+        if in_memory:
+            self._open_in_memory(image, writable, truncate_existing,
+                                 truncate_invalid_matlab)
+        elif not writable:
             self._file = h5py.File(filename, mode='r')
         else:
             # If the file doesn't already exist or the option is set to
-            # truncate it if it does, just open it truncating whatever
-            # is there. Otherwise, open it for read/write access without
-            # truncating. Now, if we are doing matlab compatibility and
-            # it doesn't have a big enough userblock (for metadata for
-            # MATLAB to be able to tell it is a valid .mat file) and the
-            # truncate_invalid_matlab is set, then it needs to be closed
-            # and re-opened with truncation. Whenever we create the file
-            # from scratch, even if matlab compatibility isn't being
-            # done, a sufficiently sized userblock is going to be
-            # allocated (smallest size is 512) for future use (after
-            # all, someone might want to turn it to a .mat file later
-            # and need it and it is only 512 bytes).
-            if truncate_existing or not os.path.isfile(filename):
+            # truncate it if it does, it is made from scratch. If we are
+            # doing matlab compatibility and it doesn't have a big
+            # enough userblock (for metadata for MATLAB to be able to
+            # tell it is a valid .mat file) and the
+            # truncate_invalid_matlab is set, it is also made from
+            # scratch. Otherwise, open it for read/write access without
+            # truncating. Whenever we create the file from scratch, even
+            # if matlab compatibility isn't being done, a sufficiently
+            # sized userblock is going to be allocated (smallest size is
+            # 512) for future use (after all, someone might want to turn
+            # it to a .mat file later and need it and it is only 512
+            # bytes).
+            #
+            # If matlab_compatible is set, the header goes in the
+            # userblock. It is written before HDF5 opens the file so
+            # that the file is only opened once. The size of the
+            # userblock of an existing file is found by looking for the
+            # HDF5 signature, and new files are made by writing the
+            # header and the image of an empty HDF5 file.
+            create = truncate_existing or not _file_exists(filename)
+            userblock_size = None
+            if not create and options.matlab_compatible:
+                userblock_size = _find_userblock_size(filename)
+                if truncate_invalid_matlab \
+                        and userblock_size is not None \
+                        and userblock_size < 128:
+                    create = True
+            if not create:
+                if userblock_size is not None and userblock_size >= 128:
+                    _write_at_start(filename, _make_matlab_header())
+                self._file = h5py.File(filename, mode='a')
+            elif options.matlab_compatible:
+                header = _make_matlab_header()
+                _write_at_start(filename,
+                                header + bytes(512 - len(header))
+                                + _get_empty_file_image(),
+                                truncate=True)
+                self._file = h5py.File(filename, mode='r+')
+            else:
                 self._file = h5py.File(filename, mode='w',
                                        userblock_size=512)
-            else:
-                self._file = h5py.File(filename, mode='a')
-                if options.matlab_compatible \
-                        and truncate_invalid_matlab \
-                        and self._file.userblock_size < 128:
-                    self._file.close()
-                    self._file = None
-                    self._file = h5py.File(filename, mode='w',
-                                           userblock_size=512)
-            # If matlab_compatible is set and we have a big enough
-            # userblock, get the userblock size, close  the file, set
-            # the userblock, and then reopen the file.
-            if options.matlab_compatible \
-                    and self._file.userblock_size >= 128:
+
+    def _open_in_memory(self, image, writable, truncate_existing,
+                        truncate_invalid_matlab):
+        # Opens the file in memory with HDF5's core driver without a
+        # backing store, starting from the file image if one is given
+        # (and not being truncated). The userblock is kept separately,
+        # as HDF5 leaves it out of file images, with the MATLAB header
+        # written into it the same as for files on disk.
+        name = '<in memory {0}>'.format(next(_in_memory_file_counter))
+        if image is None or (writable and truncate_existing):
+            self._file = h5py.File(name, mode='w', driver='core',
+                                   backing_store=False,
+                                   userblock_size=512)
+        else:
+            fapl = h5py.h5p.create(h5py.h5p.FILE_ACCESS)
+            fapl.set_fapl_core(backing_store=False)
+            fapl.set_file_image(image)
+            flags = h5py.h5f.ACC_RDWR if writable else h5py.h5f.ACC_RDONLY
+            self._file = h5py.File(h5py.h5f.open(name.encode('utf-8'),
+                                                 flags, fapl=fapl))
+            if writable and self._options.matlab_compatible \
+                    and truncate_invalid_matlab \
+                    and self._file.userblock_size < 128:
                 self._file.close()
                 self._file = None
-                # Get the time.
-                now = datetime.datetime.now()
-                # Construct the leading string. The MATLAB one looks
-                # like
-                #
-                # s = 'MATLAB 7.3 MAT-file, Platform: GLNXA64, ' \
-                #     'Created on: ' \
-                #     + now.strftime('%a %b %d %H:%M:%S %Y') \
-                #     + ' HDF5 schema 1.00 .'
-                #
-                # Platform is going to be changed to hdf5storage
-                # version.
-                s = 'MATLAB 7.3 MAT-file, Platform: hdf5storage ' \
-                    + __version__ + ', Created on: ' \
-                    + now.strftime('%a %b %d %H:%M:%S %Y') \
-                    + ' HDF5 schema 1.00 .'
-
-                # Make the bytearray while padding with spaces up to
-                # 128-12 (the minus 12 is there since the last 12 bytes
-                # are special).
-                b = bytearray(s + (128-12-len(s))*' ', encoding='utf-8')
-                # Add 8 nulls (0) and the magic number (or something)
-                # that MATLAB uses.
-                b.extend(bytearray.fromhex('00000000 00000000 0002494D'))
-                # Now, write it to the beginning of the file.
-                with open(filename, 'r+b') as f:
-                    f.write(b)
-                # Done writing the userblock, so we can re-open the
-                # file.
-                self._file = h5py.File(filename, mode='a')
+                self._file = h5py.File(name, mode='w', driver='core',
+                                       backing_store=False,
+                                       userblock_size=512)
+                image = None
+        userblock = bytearray(self._file.userblock_size)
+        if image is not None:
+            userblock[:] = image[:len(userblock)]
+        if writable and self._options.matlab_compatible \
+                and len(userblock) >= 128:
+            userblock[:128] = _make_matlab_header()
+        self._userblock = bytes(userblock)
 
     def __enter__(self):
         return self
@@ -1693,10 +2504,28 @@ class File(collections.abc.MutableMapping):
         return (self._file is None)
 
     def close(self):
-        """ Closes the file. """
+        """ Closes the file.
+
+        If the file is writable and
+        ``Options.garbage_collection_threshold`` is set, garbage is
+        collected first if enough of the objects in
+        ``Options.group_for_references`` are unreachable.
+
+        See Also
+        --------
+        collect_garbage
+        Options.garbage_collection_threshold
+
+        """
         with self._lock:
-            self._file.close()
-            self._file = None
+            try:
+                threshold = self._options.garbage_collection_threshold
+                if self._writable and threshold is not None \
+                        and self._file is not None:
+                    self._collect_garbage(threshold)
+            finally:
+                self._file.close()
+                self._file = None
 
     def flush(self):
         """ Flush contents to disk.
@@ -1713,26 +2542,67 @@ class File(collections.abc.MutableMapping):
             if self._writable:
                 self._file.flush()
 
-    def write(self, data, path='/'):
-        """ Writes one piece of data into the file.
+    def to_bytes(self):
+        """ Gets the whole file as bytes.
 
-        A wrapper around the ``writes`` method to write a single piece
-        of data, `data`, to a single location, `path`.
+        Flushes the file and gets its contents, userblock included (so
+        the bytes are a valid MAT file if doing MATLAB compatibility),
+        as they would be on disk. This is mainly for in memory files
+        (``in_memory=True``), where it is the only way to get the data
+        out.
 
-        Parameters
-        ----------
-        data : any
-            The python object to write.
-        path : str or bytes pathlib.PurePath or Iterable, optional
-            The path to write the data to.  ``str`` and ``bytes`` paths
-            must be POSIX style. The directory name is the Group to put
-            it in and the basename is the Dataset/Group name to write it
-            to. The default is ``'/'``.
+        .. versionadded:: 0.2
+
+        Returns
+        -------
+        data : bytes
+            The contents of the file.
 
         Raises
         ------
         IOError
-            If the file is closed or it isn't writable.
+            If the file is closed.
+
+        See Also
+        --------
+        dumps
+
+        """
+        with self._lock:
+            if self._file is None:
+                raise IOError('File is closed.')
+            if self._writable:
+                self._file.flush()
+            if self._userblock is not None:
+                userblock = self._userblock
+            elif self._fileobj is not None:
+                self._fileobj.seek(0)
+                userblock = self._fileobj.read(self._file.userblock_size)
+            else:
+                with open(self._file.filename, 'rb') as f:
+                    userblock = f.read(self._file.userblock_size)
+            return userblock + self._file.id.get_file_image()
+
+    def write(self, data, path='/'):
+        """ Writes one piece of data into the file.
+
+        A wrapper around the ``writes`` method to write a single piece
+        of data, `data`, to a single location, `path`.
+
+        Parameters
+        ----------
+        data : any
+            The python object to write.
+        path : str or bytes pathlib.PurePath or Iterable, optional
+            The path to write the data to.  ``str`` and ``bytes`` paths
+            must be POSIX style. The directory name is the Group to put
+            it in and the basename is the Dataset/Group name to write it
+            to. The default is ``'/'``.
+
+        Raises
+        ------
+        IOError
+            If the file is closed or it isn't writable.
         TypeError
             If `path` is an invalid type.
         NotImplementedError
@@ -1816,12 +2686,13 @@ class File(collections.abc.MutableMapping):
                 raise IOError('File is closed.')
             # Go through each element of towrite and write them with the
             # low level write function.
-            for groupname, targetname, data in towrite:
-                utilities.write_data(
-                    self._file,
-                    self._file.require_group(groupname),
-                    targetname, data,
-                    None, self._options)
+            with instrumentation.span('File.writes', self._file.filename):
+                for groupname, targetname, data in towrite:
+                    utilities.write_data(
+                        self._file,
+                        self._file.require_group(groupname),
+                        targetname, data,
+                        None, self._options)
 
     def read(self, path='/'):
         """ Reads one piece of data from the file.
@@ -1907,23 +2778,401 @@ class File(collections.abc.MutableMapping):
                 raise IOError('File is closed.')
             # Read the data item by item
             datas = []
-            for groupname, targetname in toread:
-                # Check that the containing group is in the file and is
-                # indeed a group. If it isn't an error needs to be
-                # thrown.
+            with instrumentation.span('File.reads', self._file.filename):
+                for groupname, targetname in toread:
+                    # Check that the containing group is in the file and
+                    # is indeed a group. If it isn't an error needs to be
+                    # thrown.
+                    if groupname not in self._file \
+                            or not isinstance(self._file[groupname],
+                                              h5py.Group):
+                        raise KeyError(
+                            'Could not find containing Group '
+                            + groupname + '.')
+                    # Hand off everything to the low level reader.
+                    datas.append(utilities.read_data(
+                        self._file, self._file[groupname], targetname,
+                        self._options))
+        # Return it all.
+        return datas
+
+    def read_to_memmap(self, path, out_filename):
+        """ Reads an array into a new ``numpy.memmap`` in blocks.
+
+        Reads an array of bools, numbers, ``numpy.datetime64``, or
+        ``numpy.timedelta64`` that would be read as a ``numpy.ndarray``
+        into a new ``numpy.memmap`` backed by the file `out_filename`
+        without ever having the whole array in memory. It is read chunk
+        by chunk (decompressing each one once) in blocks of at most a
+        quarter of ``Options.write_memory_budget`` bytes, and the same
+        conversions as ``read`` (transposing, decoding complex numbers,
+        converting to ``bool``, etc.) are done to each block. This is
+        for arrays too big to read into memory.
+
+        .. versionadded:: 0.2
+
+        Parameters
+        ----------
+        path : str or bytes or pathlib.PurePath or Iterable
+            The path to read from. ``str`` and ``bytes`` paths must be
+            POSIX style.
+        out_filename : str or pathlib.Path
+            The file to make the ``numpy.memmap`` with, which is
+            overwritten if it exists.
+
+        Returns
+        -------
+        data : numpy.memmap
+            The data that is read, which is open in ``'r+'`` mode.
+
+        Raises
+        ------
+        IOError
+            If the file is closed.
+        KeyError
+            If the `path` cannot be found.
+        exceptions.CantReadError
+            If the data at `path` isn't a non-empty array of bools,
+            numbers, or times that would be read as a ``numpy.ndarray``.
+
+        See Also
+        --------
+        read
+        Options.write_memory_budget
+        utilities.read_data_to_memmap
+
+        """
+        groupname, targetname = pathesc.process_path(path)
+        if posixpath.isabs(groupname):
+            prefix = ''
+        else:
+            prefix = '/'
+        if '/' != posixpath.commonpath(
+                (self._options.group_for_references,
+                 posixpath.join(prefix, groupname, targetname))):
+            raise ValueError('Cannot read from paths inside the the '
+                             'Group specified by the '
+                             'group_for_references option.')
+        # File operations must be synchronized.
+        with self._lock:
+            # Check that the file is open.
+            if self._file is None:
+                raise IOError('File is closed.')
+            with instrumentation.span('File.read_to_memmap',
+                                      self._file.filename):
                 if groupname not in self._file \
                         or not isinstance(self._file[groupname],
                                           h5py.Group):
-                    raise KeyError(
-                        'Could not find containing Group '
-                        + groupname + '.')
-                # Hand off everything to the low level reader.
-                datas.append(utilities.read_data(self._file,
-                                                 self._file[groupname],
-                                                 targetname,
-                                                 self._options))
-        # Return it all.
-        return datas
+                    raise KeyError('Could not find containing Group '
+                                   + groupname + '.')
+                return utilities.read_data_to_memmap(
+                    self._file, self._file[groupname], targetname,
+                    out_filename, self._options)
+
+    def copy(self, paths, dst_paths=None, src=None):
+        """ Copies data into this file from this or another file.
+
+        Copies the Datasets and Groups at `paths` in `src` to
+        `dst_paths` in this file with HDF5's object copy, so their data
+        is not decoded and encoded again. The HDF5 References in the
+        copies that point into the Group for references of `src`
+        (``Options.group_for_references``) are rewritten to point to
+        copies of what they pointed to in the Group for references of
+        this file, which are copied along with them. Anything already at
+        a destination path is replaced. If a destination path is the
+        root (``'/'``), the source must be a Group and everything in it
+        is copied into the root instead, which is how to merge the
+        contents of files.
+
+        .. versionadded:: 0.2
+
+        Parameters
+        ----------
+        paths : Iterable
+            An iterable of paths to copy from in `src`. ``str`` and
+            ``bytes`` paths must be POSIX style.
+        dst_paths : Iterable or None, optional
+            An iterable of the paths to copy each path in `paths` to in
+            this file, or ``None`` (default) to use the same paths,
+            which requires `src` to be another file.
+        src : File or None, optional
+            The open file to copy from, or ``None`` (default) to copy
+            within this file.
+
+        Raises
+        ------
+        IOError
+            If a file is closed or this file isn't writable.
+        TypeError
+            If an argument has an invalid type.
+        ValueError
+            If `paths` and `dst_paths` have different lengths, a path is
+            inside the Group for references, or, when copying within
+            this file, a path would be copied to itself, inside itself,
+            or over something containing it.
+        KeyError
+            If a path cannot be found in `src`.
+
+        See Also
+        --------
+        hdf5storage.copy : Copying between files by name.
+        utilities.ObjectCopier
+
+        """
+        if src is None:
+            src = self
+        if not isinstance(src, File):
+            raise TypeError('src must be a File or None.')
+        if not isinstance(paths, collections.abc.Iterable):
+            raise TypeError('paths must be an Iterable.')
+        paths = list(paths)
+        if dst_paths is None:
+            dst_paths = paths
+        elif not isinstance(dst_paths, collections.abc.Iterable):
+            raise TypeError('dst_paths must be an Iterable or None.')
+        dst_paths = list(dst_paths)
+        if len(paths) != len(dst_paths):
+            raise ValueError('paths and dst_paths must be the same '
+                             'length.')
+        # File had to be opened writable.
+        if not self._writable:
+            raise IOError('File is not writable.')
+        # Process the paths into absolute ones, which must not be inside
+        # the Groups specified by options.group_for_references. Within
+        # the file, a path can't be copied to itself or inside itself,
+        # or over something containing it (it would be deleted first).
+        tocopy = []
+        for p, dst_p in zip(paths, dst_paths):
+            names = []
+            for f, path in ((src, p), (self, dst_p)):
+                name = posixpath.normpath(posixpath.join(
+                    '/', *pathesc.process_path(path)))
+                if '/' != posixpath.commonpath(
+                        (f._options.group_for_references, name)):
+                    raise ValueError('Cannot copy paths inside the the '
+                                     'Group specified by the '
+                                     'group_for_references option.')
+                names.append(name)
+            if src is self and posixpath.commonpath(names) in names:
+                raise ValueError('Cannot copy ' + names[0] + ' to '
+                                 + names[1] + ' in the same file.')
+            tocopy.append(tuple(names))
+        # File operations must be synchronized, which requires the locks
+        # of both files (taken in the same order every time).
+        locks = sorted({id(self): self._lock, id(src): src._lock}.items())
+        with contextlib.ExitStack() as stack:
+            for _, lock in locks:
+                stack.enter_context(lock)
+            # Check that the files are open.
+            if self._file is None or src._file is None:
+                raise IOError('File is closed.')
+            with instrumentation.span('File.copy', self._file.filename):
+                src_refs = posixpath.join(
+                    '/', src._options.group_for_references)
+                copier = utilities.ObjectCopier(
+                    src._file, self._file, src_refs,
+                    self._options.group_for_references)
+                for name, dst_name in tocopy:
+                    if name not in src._file:
+                        raise KeyError('Could not find ' + name + '.')
+                    obj = src._file[name]
+                    groupname, targetname = posixpath.split(dst_name)
+                    grp = self._file.require_group(groupname)
+                    if targetname == '':
+                        # Copying into the root.
+                        if not isinstance(obj, h5py.Group):
+                            raise ValueError('Only a Group can be copied '
+                                             'to the root.')
+                        for k in obj:
+                            if posixpath.join(obj.name, k) != src_refs \
+                                    and k in grp:
+                                del grp[k]
+                        copier.copy_children(obj, grp)
+                    else:
+                        if targetname in grp:
+                            del grp[targetname]
+                        copier.copy(obj, grp, targetname)
+                copier.finish()
+
+    def storage_report(self, path='/'):
+        """ Report how much storage the data in the file uses.
+
+        Reports, for each variable (Dataset or Group) in the Group at
+        `path` (or just the one at `path` if it isn't a Group), how much
+        storage it uses including everything it points to with HDF5
+        References (which are normally in the Group
+        ``Options.group_for_references``). Also reports on the whole
+        file: its size, the free space in it, and the objects in the
+        Group ``Options.group_for_references`` that no variable in the
+        file points to anymore (left over from deleted or overwritten
+        variables).
+
+        .. versionadded:: 0.2
+
+        Parameters
+        ----------
+        path : str or bytes or pathlib.PurePath or Iterable, optional
+            The path to report on. ``str`` and ``bytes`` paths must be
+            POSIX style. The default is ``'/'``.
+
+        Returns
+        -------
+        report : dict
+            The report, with the following keys.
+
+            =========================  ================================
+            key                        value
+            =========================  ================================
+            ``'variables'``            ``dict`` of the path of each
+                                       variable (escaped) to the
+                                       ``dict`` returned by
+                                       ``utilities.get_storage_info``
+                                       for it.
+            ``'file_size'``            Size of the file in bytes.
+            ``'userblock_size'``       Size of the userblock in bytes.
+            ``'free_space'``           Bytes of free space in the file
+                                       that HDF5 is keeping track of.
+            ``'unreachable_objects'``  Number of Datasets and Groups in
+                                       ``Options.group_for_references``
+                                       not pointed to by any variable
+                                       (other than the canonical empty
+                                       ``'a'``).
+            ``'unreachable_bytes'``    Bytes of the data and headers of
+                                       the unreachable objects.
+            ``'other_bytes'``          Bytes of the file not in any of
+                                       the above or in any variable,
+                                       which is the HDF5 superblock,
+                                       the headers and indexes of the
+                                       root and references Groups, and
+                                       space lost from deleted objects
+                                       that HDF5 did not keep track
+                                       of.
+            =========================  ================================
+
+        Raises
+        ------
+        IOError
+            If the file is closed.
+        KeyError
+            If the `path` cannot be found.
+
+        See Also
+        --------
+        utilities.get_storage_info
+
+        """
+        groupname, targetname = pathesc.process_path(path)
+        fullpath = posixpath.join(groupname, targetname)
+        # File operations must be synchronized.
+        with self._lock:
+            # Check that the file is open.
+            if self._file is None:
+                raise IOError('File is closed.')
+            f = self._file
+            if fullpath not in f:
+                raise KeyError('Could not find ' + fullpath)
+            refs_name = self._options.group_for_references
+            # Make the report for each variable requested.
+            obj = f[fullpath]
+            if isinstance(obj, h5py.Group):
+                names = [posixpath.join(obj.name, k) for k in obj
+                         if posixpath.join(obj.name, k) != refs_name]
+            else:
+                names = [obj.name]
+            variables = dict()
+            for name in names:
+                variables[name] = utilities.get_storage_info(f, f[name])
+            # Find everything reachable from all the variables in the
+            # file so that what isn't in the references Group can be
+            # found.
+            visited = set()
+            reachable_bytes = 0
+            for name, obj in f.items():
+                if posixpath.join('/', name) != refs_name:
+                    info = utilities.get_storage_info(f, obj, visited)
+                    reachable_bytes += info['storage_bytes'] \
+                        + info['header_bytes']
+            unreachable_objects = 0
+            unreachable_bytes = 0
+            if refs_name in f and isinstance(f[refs_name], h5py.Group):
+                for name, obj in f[refs_name].items():
+                    # The canonical empty 'a' is always kept.
+                    if name == 'a':
+                        continue
+                    info = utilities.get_storage_info(f, obj, visited)
+                    unreachable_objects += info['objects']
+                    unreachable_bytes += info['storage_bytes'] \
+                        + info['header_bytes']
+            file_size = f.id.get_filesize()
+            free_space = f.id.get_freespace()
+            other_bytes = file_size - f.userblock_size - free_space \
+                - reachable_bytes - unreachable_bytes
+        return {'variables': variables, 'file_size': file_size,
+                'userblock_size': f.userblock_size,
+                'free_space': free_space,
+                'unreachable_objects': unreachable_objects,
+                'unreachable_bytes': unreachable_bytes,
+                'other_bytes': max(0, other_bytes)}
+
+    def collect_garbage(self):
+        """ Deletes what nothing points to in the Group for references.
+
+        Data that can't be stored directly (cell arrays, lists, object
+        fields, etc.) is stored in ``Options.group_for_references`` and
+        pointed to with HDF5 References. When that data is deleted or
+        overwritten, what it pointed to is left behind. This marks
+        everything reachable from the root of the file through Groups
+        and References, and deletes the objects in the Group for
+        references that weren't reached (other than the canonical empty
+        ``'a'``). The space they used gets reused by later writes while
+        the file is open, but the file does not shrink (use ``repack``
+        for that).
+
+        .. versionadded:: 0.2
+
+        Returns
+        -------
+        deleted : int
+            The number of objects deleted from the Group for references.
+
+        Raises
+        ------
+        IOError
+            If the file is closed or it isn't writable.
+
+        See Also
+        --------
+        storage_report
+        Options.garbage_collection_threshold
+        utilities.find_unreachable_references
+        hdf5storage.repack
+
+        """
+        # File had to be opened writable.
+        if not self._writable:
+            raise IOError('File is not writable.')
+        # File operations must be synchronized.
+        with self._lock:
+            # Check that the file is open.
+            if self._file is None:
+                raise IOError('File is closed.')
+            return self._collect_garbage(0.0)
+
+    def _collect_garbage(self, threshold):
+        # Does the work of collect_garbage if at least threshold of the
+        # objects are unreachable, assuming the lock is held.
+        refs_name = self._options.group_for_references
+        with instrumentation.span('File.collect_garbage',
+                                  self._file.filename):
+            unreachable, total = utilities.find_unreachable_references(
+                self._file, refs_name)
+            if len(unreachable) == 0 \
+                    or len(unreachable) < threshold * total:
+                return 0
+            grp = self._file[refs_name]
+            for name in unreachable:
+                del grp[name]
+        return len(unreachable)
 
     def __len__(self):
         """ Get the number of objects stored in the file root.
@@ -2123,6 +3372,286 @@ class File(collections.abc.MutableMapping):
                 raise IOError('File is closed.')
             del self._file[posixpath.join(groupname, targetname)]
 
+class _FilePool(object):
+    """ LRU pool of open ``File`` for the module level functions.
+
+    At most one ``File`` is kept open per file (HDF5 does not allow a
+    file to be opened more than once in a process with different access
+    modes). An open ``File`` is only reused if it was opened with the
+    same access mode and ``Options`` and the file on disk is still the
+    same one (same device and inode) and, when read only, has not been
+    modified since (same modification time and size).
+
+    Parameters
+    ----------
+    max_open_files : int
+        The maximum number of files to keep open.
+
+    """
+    def __init__(self, max_open_files):
+        self.max_open_files = max_open_files
+        self.lock = threading.RLock()
+        # Maps the real path of each file to a tuple of the key it was
+        # opened with, the File, and the stat signature of the file.
+        self.files = collections.OrderedDict()
+
+    def get(self, filename, writable, truncate_existing,
+            truncate_invalid_matlab, options):
+        """ Get an open ``File``, opening it if needed.
+
+        Must be called with `lock` held.
+
+        """
+        path = os.path.realpath(filename)
+        key = (writable, _options_key(options))
+        entry = self.files.pop(path, None)
+        if entry is not None and (truncate_existing
+                                  or entry[0] != key
+                                  or entry[1].closed
+                                  or entry[2] != _stat_signature(
+                                      path, writable)):
+            _close_quietly(entry[1])
+            entry = None
+        if entry is None:
+            f = File(filename, writable=writable,
+                     truncate_existing=truncate_existing,
+                     truncate_invalid_matlab=truncate_invalid_matlab,
+                     options=options)
+            entry = (key, f, _stat_signature(path, writable))
+        self.files[path] = entry
+        self.trim()
+        return entry[1]
+
+    def trim(self):
+        """ Close the least recently used files over the limit. """
+        while len(self.files) > self.max_open_files:
+            _close_quietly(self.files.popitem(last=False)[1][1])
+
+    def flush(self, filename=None):
+        """ Flush the writable files (or just `filename`). """
+        with self.lock:
+            for path, entry in self.files.items():
+                if entry[0][0] and (filename is None or path
+                                    == os.path.realpath(filename)):
+                    entry[1].flush()
+
+    def close(self, filename=None):
+        """ Close the files (or just `filename`). """
+        with self.lock:
+            if filename is None:
+                paths = list(self.files)
+            else:
+                paths = [os.path.realpath(filename)]
+            for path in paths:
+                entry = self.files.pop(path, None)
+                if entry is not None:
+                    entry[1].close()
+
+
+def _options_key(options):
+    # Options are compared by the values of all their attributes. Any
+    # that are unhashable are compared by their repr.
+    return tuple(sorted(
+        (k, v if isinstance(v, collections.abc.Hashable) else repr(v))
+        for k, v in vars(options).items()))
+
+
+def _stat_signature(path, writable):
+    # Writable files are modified by the File itself, so only whether
+    # it is still the same file can be checked.
+    st = os.stat(path)
+    if writable:
+        return (st.st_dev, st.st_ino)
+    return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _close_quietly(f):
+    try:
+        f.close()
+    except:
+        pass
+
+
+# The pool of open files used by the module level functions, which is
+# None if pooling is disabled. It must be packed into a list so that it
+# can be set from functions inside this module without scoping problems.
+_file_pool = [None]
+_file_pool_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _open_file(filename='data.h5', writable=False,
+               truncate_existing=False, truncate_invalid_matlab=False,
+               options=None, **keywords):
+    """ Context manager for the ``File`` used by the module functions.
+
+    Takes the same arguments as ``File``. If file pooling is disabled,
+    a new ``File`` is opened and then closed on exit. Otherwise, the
+    ``File`` is taken from the pool (opening it if needed) and is left
+    open on exit.
+
+    See Also
+    --------
+    File
+    enable_file_pool
+
+    """
+    pool = _file_pool[0]
+    if pool is None or not isinstance(filename, str):
+        with File(filename, writable=writable,
+                  truncate_existing=truncate_existing,
+                  truncate_invalid_matlab=truncate_invalid_matlab,
+                  options=options, **keywords) as f:
+            yield f
+        return
+    # Make the Options the same way File would so that they can be
+    # compared with those of the pooled files.
+    if options is None:
+        options = Options(**keywords)
+    elif not isinstance(options, Options):
+        raise TypeError('options must be an Options or None.')
+    elif len(keywords) != 0:
+        raise ValueError('Extra keyword arguments cannot be passed '
+                         'if options is not None.')
+    # The pool lock is held while the File is used so that it can't be
+    # closed by another thread in the middle.
+    with pool.lock:
+        yield pool.get(filename, writable, truncate_existing,
+                       truncate_invalid_matlab, options)
+
+
+def enable_file_pool(max_open_files=8):
+    """ Enables pooling of open files by the module level functions.
+
+    Normally, ``write``, ``writes``, ``read``, ``reads``, ``savemat``,
+    and ``loadmat`` open the file, do their work, and then close it on
+    every call, which is slow when they are called many times on the
+    same file. With pooling enabled, they instead leave their files
+    open in a process wide least recently used pool of at most
+    `max_open_files` files and reuse them on later calls.
+
+    An open file is reused if the same file is used with the same
+    access (read only or writable) and options. Otherwise, it is closed
+    and the file re-opened. Read only files are also re-opened if the
+    file has been modified (its modification time or size changed) or
+    replaced (a different inode) since it was opened. Truncating a file
+    (``truncate_existing=True``) always re-opens it.
+
+    Warning
+    -------
+    Data written to a pooled file is not guaranteed to be on disk till
+    ``flush_file_pool`` or ``close_file_pool`` is called, pooling is
+    disabled, or the file is evicted from the pool. Changes made to a
+    pooled writable file by other processes are not detected. A file
+    must not be opened with ``File`` while it is in the pool (close it
+    with ``close_file_pool`` first).
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    max_open_files : int, optional
+        The maximum number of files to keep open at once. If pooling
+        is already enabled, the limit is changed to this.
+
+    Raises
+    ------
+    TypeError
+        If `max_open_files` is not an ``int``.
+    ValueError
+        If `max_open_files` is less than one.
+
+    See Also
+    --------
+    disable_file_pool
+    flush_file_pool
+    close_file_pool
+
+    """
+    if not isinstance(max_open_files, int) \
+            or isinstance(max_open_files, bool):
+        raise TypeError('max_open_files must be int.')
+    if max_open_files < 1:
+        raise ValueError('max_open_files must be at least one.')
+    with _file_pool_lock:
+        if _file_pool[0] is None:
+            _file_pool[0] = _FilePool(max_open_files)
+        else:
+            with _file_pool[0].lock:
+                _file_pool[0].max_open_files = max_open_files
+                _file_pool[0].trim()
+
+
+def disable_file_pool():
+    """ Disables pooling of open files by the module level functions.
+
+    All the files in the pool are closed.
+
+    .. versionadded:: 0.2
+
+    See Also
+    --------
+    enable_file_pool
+
+    """
+    with _file_pool_lock:
+        pool = _file_pool[0]
+        _file_pool[0] = None
+    if pool is not None:
+        pool.close()
+
+
+def flush_file_pool(filename=None):
+    """ Flushes the writable files in the file pool to disk.
+
+    Does nothing if file pooling is not enabled.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    filename : str or None, optional
+        The file to flush, or ``None`` (default) to flush all of them.
+
+    See Also
+    --------
+    enable_file_pool
+    close_file_pool
+
+    """
+    pool = _file_pool[0]
+    if pool is not None:
+        pool.flush(filename)
+
+
+def close_file_pool(filename=None):
+    """ Closes files in the file pool, removing them from it.
+
+    Pooling stays enabled, so files will be opened again as needed by
+    later calls. Does nothing if file pooling is not enabled. This is
+    called automatically when the interpreter exits.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    filename : str or None, optional
+        The file to close, or ``None`` (default) to close all of them.
+
+    See Also
+    --------
+    enable_file_pool
+    flush_file_pool
+    disable_file_pool
+
+    """
+    pool = _file_pool[0]
+    if pool is not None:
+        pool.close(filename)
+
+
+atexit.register(close_file_pool)
+
 
 def writes(mdict, **keywords):
     """ Writes data into an HDF5 file.
@@ -2164,9 +3693,10 @@ def writes(mdict, **keywords):
     --------
     File
     File.writes
+    enable_file_pool
 
     """
-    with File(writable=True, **keywords) as f:
+    with _open_file(writable=True, **keywords) as f:
         f.writes(mdict)
 
 
@@ -2216,9 +3746,10 @@ def write(data, path='/', **keywords):
     --------
     File
     File.write
+    enable_file_pool
 
     """
-    with File(writable=True, **keywords) as f:
+    with _open_file(writable=True, **keywords) as f:
         f.write(data, path)
 
 
@@ -2272,6 +3803,7 @@ def reads(paths, **keywords):
     --------
     File
     File.read
+    enable_file_pool
 
     """
     if 'matlab_compatible' in keywords or (
@@ -2280,7 +3812,7 @@ def reads(paths, **keywords):
         extra_kws = dict()
     else:
         extra_kws = {'matlab_compatible': False}
-    with File(writable=False, **extra_kws, **keywords) as f:
+    with _open_file(writable=False, **extra_kws, **keywords) as f:
         return f.reads(paths)
 
 
@@ -2328,6 +3860,7 @@ def read(path='/', **keywords):
     --------
     File
     File.reads
+    enable_file_pool
 
     """
     if 'matlab_compatible' in keywords or (
@@ -2336,7 +3869,7 @@ def read(path='/', **keywords):
         extra_kws = dict()
     else:
         extra_kws = {'matlab_compatible': False}
-    with File(writable=False, **extra_kws, **keywords) as f:
+    with _open_file(writable=False, **extra_kws, **keywords) as f:
         return f.read(path)
 
 
@@ -2423,6 +3956,7 @@ def savemat(file_name, mdict, appendmat=True, format='7.3',
         dispatches to.
     Options
     writes : Function used to do the actual writing.
+    enable_file_pool
 
     """
     # If format is a number less than 7.3, the call needs to be
@@ -2458,6 +3992,208 @@ def savemat(file_name, mdict, appendmat=True, format='7.3',
            options=options)
 
 
+# The keywords and Options used by the savemat_many worker processes.
+# They are made once per worker, on its first file, so that the
+# marshaller collection doesn't have to be rebuilt for every file.
+_savemat_many_options = [None, None]
+
+
+def _savemat_many_get_options(keywords):
+    if _savemat_many_options[1] is None \
+            or _savemat_many_options[0] != keywords:
+        options = Options(**keywords)
+        # Make the marshaller collection now rather than on the first
+        # write.
+        options.marshaller_collection
+        _savemat_many_options[:] = [keywords, options]
+    return _savemat_many_options[1]
+
+
+def _savemat_many_write(keywords, file_name, mdict, truncate_existing,
+                        truncate_invalid_matlab):
+    # Writes one file, returning the exception instead of raising it so
+    # that one bad file doesn't stop the rest of the batch. Exceptions
+    # that can't be pickled to be sent back to the parent process are
+    # replaced by a RuntimeError with the same message.
+    try:
+        writes(mdict=mdict, filename=file_name,
+               truncate_existing=truncate_existing,
+               truncate_invalid_matlab=truncate_invalid_matlab,
+               options=_savemat_many_get_options(keywords))
+    except Exception as exc:
+        try:
+            pickle.dumps(exc)
+        except Exception:
+            return RuntimeError('{0}: {1}'.format(type(exc).__name__,
+                                                  exc))
+        return exc
+    return None
+
+
+def _savemat_many_file_name(file_name, appendmat):
+    # Append .mat if it isn't on the end of the file name and we are
+    # supposed to, just like savemat.
+    if appendmat:
+        if isinstance(file_name, str) \
+                and not file_name.endswith('.mat'):
+            file_name = file_name + '.mat'
+        elif isinstance(file_name, bytes) \
+                and not file_name.endswith(b'.mat'):
+            file_name = file_name + b'.mat'
+    return file_name
+
+
+def savemat_many(items, workers=None, appendmat=True, oned_as='row',
+                 store_python_metadata=True,
+                 action_for_matlab_incompatible='error',
+                 truncate_existing=False, truncate_invalid_matlab=False,
+                 **keywords):
+    """ Save many dictionaries to MATLAB MAT files in parallel.
+
+    Writes each ``(file_name, mdict)`` pair in `items` to its own
+    version 7.3 MAT file like ``savemat`` does, spreading the files
+    over `workers` processes. Each worker makes its ``Options`` (and
+    the marshaller collection in it) once, on its first file, and
+    reuses it for all the files it writes. A failure writing one file
+    (including its `mdict` not being picklable or the worker writing it
+    dying) does not stop the others from being written; the exception
+    is returned in the place of that file instead. If a worker dies,
+    the other files waiting to be written by the pool at the time get
+    a ``concurrent.futures.process.BrokenProcessPool`` error too.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    items : iterable of pairs
+        The ``(file_name, mdict)`` pairs to write. They are taken from
+        it only as the workers are ready for them, so it can be a
+        generator. Each `mdict` is pickled and sent to a worker
+        process, so its contents must be picklable.
+    workers : int or None, optional
+        The number of processes to write with. ``None`` uses the number
+        of CPUs. ``0`` or ``1`` writes the files one after another in
+        this process.
+    appendmat : bool, optional
+        Whether to append the '.mat' extension to each file name if it
+        doesn't already end in it or not.
+    oned_as : {'row', 'column'}, optional
+        Whether 1D arrays should be turned into row or column vectors.
+    store_python_metadata : bool, optional
+        Whether or not to store Python type information.
+    action_for_matlab_incompatible: str, optional
+        The action to perform writing data that is not MATLAB
+        compatible. See ``savemat``.
+    truncate_existing : bool, optional
+        Whether to truncate a file if it already exists before writing
+        to it.
+    truncate_invalid_matlab : bool, optional
+        Whether to truncate a file if the file doesn't have the proper
+        header (userblock in HDF5 terms) setup for MATLAB metadata to be
+        placed.
+    **keywords :
+        Additional keyword arguments to make the ``Options`` with in
+        each worker, such as the compression options.
+        ``matlab_compatible`` is always forced to ``True``. A
+        ``marshaller_collection`` cannot be given since it can't be
+        sent to the worker processes.
+
+    Returns
+    -------
+    errors : list
+        One element per pair in `items`, in the same order, which is
+        ``None`` if the file was written successfully and the exception
+        raised while writing it otherwise.
+
+    Raises
+    ------
+    TypeError
+        If ``marshaller_collection`` or ``options`` is given.
+
+    See Also
+    --------
+    savemat
+    writes
+    Options
+
+    """
+    if 'marshaller_collection' in keywords or 'options' in keywords:
+        raise TypeError('savemat_many cannot take marshaller_collection '
+                        'or options.')
+    keywords = dict(keywords)
+    keywords.update(
+        store_python_metadata=store_python_metadata,
+        matlab_compatible=True, oned_as=oned_as,
+        action_for_matlab_incompatible=action_for_matlab_incompatible)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    # The pairs are taken from items lazily so that a large batch never
+    # has to be held in memory all at once.
+    items = ((_savemat_many_file_name(file_name, appendmat), mdict)
+             for file_name, mdict in items)
+
+    # Without more than one worker, there is nothing to gain from
+    # starting processes, so the files are just written here with the
+    # same code path as the workers use.
+    errors = []
+    if workers <= 1:
+        old = list(_savemat_many_options)
+        try:
+            for file_name, mdict in items:
+                errors.append(_savemat_many_write(
+                    keywords, file_name, mdict, truncate_existing,
+                    truncate_invalid_matlab))
+            return errors
+        finally:
+            _savemat_many_options[:] = old
+
+    # Each file gets its own future so that an mdict that can't be
+    # pickled, or a worker process dying (which breaks the pool and
+    # fails every file waiting in it), only becomes the error of the
+    # files involved. A broken pool is replaced by a new one for the
+    # files after it. Only a few files per worker are kept waiting at a
+    # time.
+    max_pending = 2 * workers
+    pending = collections.deque()
+    executor = None
+
+    def collect():
+        index, future = pending.popleft()
+        try:
+            errors[index] = future.result()
+        except Exception as exc:
+            errors[index] = exc
+
+    try:
+        for index, (file_name, mdict) in enumerate(items):
+            errors.append(None)
+            args = (keywords, file_name, mdict, truncate_existing,
+                    truncate_invalid_matlab)
+            for attempt in range(2):
+                if executor is None:
+                    executor = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=workers)
+                try:
+                    pending.append((index, executor.submit(
+                        _savemat_many_write, *args)))
+                    break
+                except concurrent.futures.process.BrokenProcessPool \
+                        as exc:
+                    errors[index] = exc
+                    executor.shutdown(wait=False)
+                    executor = None
+            while len(pending) >= max_pending:
+                collect()
+        while len(pending) > 0:
+            collect()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return errors
+
+
 def loadmat(file_name, mdict=None, appendmat=True,
             variable_names=None,
             marshaller_collection=None, **keywords):
@@ -2530,6 +4266,7 @@ def loadmat(file_name, mdict=None, appendmat=True,
         dispatches to.
     Options
     reads : Function used to do the actual reading.
+    enable_file_pool
 
     """
     # Will first assume that it is the HDF5 based 7.3 format. If an
@@ -2554,7 +4291,8 @@ def loadmat(file_name, mdict=None, appendmat=True,
             filename = file_name
 
         # Read everything if we were instructed.
-        with File(filename, writable=False, options=options) as f:
+        with _open_file(filename, writable=False,
+                        options=options) as f:
             if variable_names is None:
                 data = {pathesc.unescape_path(k): v for k, v in f.items()}
             else:
@@ -2577,11 +4315,294 @@ def loadmat(file_name, mdict=None, appendmat=True,
             **keywords)
 
 
+def dumps(mdict, **keywords):
+    """ Writes data into an HDF5 file in memory and returns its bytes.
+
+    Wrapper around ``File`` with ``in_memory=True`` and
+    ``File.writes``. Nothing is written to disk. The bytes are a whole
+    HDF5 file, userblock included, so they are a valid MAT file if
+    doing MATLAB compatibility (the default). Specifically, this
+    function is
+
+        >>> with File(writable=True, in_memory=True, **keywords) as f:
+        >>>     f.writes(mdict)
+        >>>     data = f.to_bytes()
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    mdict : Mapping
+        The ``dict`` or other dictionary type object of paths
+        and data to write to the file. The paths are the keys (``str``
+        and ``bytes`` paths must be POSIX style) where the directory
+        name is the Group to put it in and the basename is the name to
+        write it to. The values are the data to write.
+    **keywords :
+        Extra keyword arguments to pass to ``File``.
+
+    Returns
+    -------
+    data : bytes
+        The contents of the file.
+
+    Raises
+    ------
+    TypeError
+        If an argument has an invalid type.
+    ValueError
+        If an argument has an invalid value.
+    NotImplementedError
+        If writing anything in `mdict` is not supported.
+    exceptions.TypeNotMatlabCompatibleError
+        If writing a type not compatible with MATLAB and the
+        ``action_for_matlab_incompatible`` option is set to
+        ``'error'``.
+
+    See Also
+    --------
+    loads
+    writes
+    File.to_bytes
+
+    """
+    with File(writable=True, in_memory=True, **keywords) as f:
+        f.writes(mdict)
+        return f.to_bytes()
+
+
+def loads(data, **keywords):
+    """ Reads all the variables in an HDF5 file held in bytes.
+
+    Wrapper around ``File`` with ``in_memory=True`` that reads every
+    variable in the root of the file (such as made by ``dumps``)
+    without writing anything to disk. Like ``read``, the
+    ``matlab_compatible`` option is set to ``False`` if it isn't given
+    explicitly. Specifically, this function does
+
+        >>> if 'matlab_compatible' in keywords or (
+        ...         'options' in keywords
+        ...          and keywords['options'] is not None):
+        >>>     extra_kws = dict()
+        >>> else:
+        >>>     extra_kws = {'matlab_compatible': False}
+        >>> with File(in_memory=True, image=data, **extra_kws,
+        ...           **keywords) as f:
+        >>>     mdict = dict(f.items())
+
+    except that the names are unescaped.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    data : bytes-like
+        The contents of the file.
+    **keywords :
+        Extra keyword arguments to pass to ``File``.
+
+    Returns
+    -------
+    mdict : dict
+        The variables read, with their unescaped names as the keys.
+
+    Raises
+    ------
+    TypeError
+        If an argument has an invalid type.
+    IOError
+        If `data` isn't an HDF5 file.
+    exceptions.CantReadError
+        If reading the data can't be done.
+
+    See Also
+    --------
+    dumps
+    reads
+
+    """
+    if 'matlab_compatible' in keywords or (
+            'options' in keywords
+            and keywords['options'] is not None):
+        extra_kws = dict()
+    else:
+        extra_kws = {'matlab_compatible': False}
+    with File(in_memory=True, image=data, **extra_kws,
+              **keywords) as f:
+        return {pathesc.unescape_path(k): v for k, v in f.items()}
+
+
+def copy(src_file, dst_file, paths, dst_paths=None, **keywords):
+    """ Copies data between HDF5 files without decoding it.
+
+    Wrapper around ``File`` and ``File.copy``. Specifically, this
+    function is
+
+        >>> with File(src_file, **keywords) as fsrc:
+        >>>     with File(dst_file, writable=True, **keywords) as fdst:
+        >>>         fdst.copy(paths, dst_paths, src=fsrc)
+
+    except that if they are the same file, it is only opened once. The
+    data is copied with HDF5's object copy, which is much faster than
+    reading it and writing it again since it is not decoded and encoded
+    again (strings, structs, etc.), and the References into
+    ``Options.group_for_references`` are rewritten to point into the
+    Group for references of `dst_file`. Any pooled handles of the files
+    are closed first (see ``enable_file_pool``).
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    src_file : str
+        The file to copy from.
+    dst_file : str
+        The file to copy to, which can be `src_file`.
+    paths : Iterable
+        An iterable of paths to copy from in `src_file`. ``str`` and
+        ``bytes`` paths must be POSIX style.
+    dst_paths : Iterable or None, optional
+        An iterable of the paths to copy each path in `paths` to in
+        `dst_file`, or ``None`` (default) to use the same paths. A path
+        of ``'/'`` copies everything in the source Group into the root.
+    **keywords :
+        Extra keyword arguments to pass to ``File`` for both files.
+
+    Raises
+    ------
+    TypeError
+        If an argument has an invalid type.
+    ValueError
+        If an argument has an invalid value.
+    KeyError
+        If a path cannot be found in `src_file`.
+    IOError
+        If a file cannot be opened or some other file operation
+        failed.
+
+    See Also
+    --------
+    File.copy
+    repack
+
+    """
+    # Pooled handles of the files must be closed so that the copy sees
+    # everything written to them and so that they can be opened with
+    # the access needed.
+    close_file_pool(src_file)
+    close_file_pool(dst_file)
+    if os.path.exists(dst_file) and os.path.samefile(src_file, dst_file):
+        with File(dst_file, writable=True, **keywords) as fdst:
+            fdst.copy(paths, dst_paths)
+        return
+    with File(src_file, **keywords) as fsrc:
+        with File(dst_file, writable=True, **keywords) as fdst:
+            fdst.copy(paths, dst_paths, src=fsrc)
+
+
+def repack(src, dst=None, recompress=False, options=None, **keywords):
+    """ Copies only the live objects of an HDF5 file into a fresh file.
+
+    HDF5 files never shrink. The space used by objects that are deleted
+    (or deleted and made again when overwritten with data of another
+    shape or with other filters) and by data in
+    ``Options.group_for_references`` that nothing points to anymore is
+    not given back. This copies everything reachable from the root of
+    `src` (following the References into the Group for references) into
+    a new file, leaving everything else behind. The userblock (holding
+    the MATLAB header for MATLAB files) and all Attributes are
+    kept. Datasets are copied without decoding their data unless
+    `recompress` is set.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    src : str
+        The file to repack.
+    dst : str or None, optional
+        The file to write the repacked copy to, which is truncated if it
+        exists. ``None`` (default) repacks `src` in place by writing the
+        copy to a temporary file in the same directory and then
+        replacing `src` with it.
+    recompress : bool, optional
+        Whether to write the Datasets (other than those holding
+        References) again with the compression and filter settings in
+        the options instead of copying them as they are. Default is
+        ``False``.
+    options : Options or None, optional
+        The options to use. The path of the Group for references is
+        taken from them. If ``None`` (default), they are made from
+        `keywords`.
+    **keywords :
+        Extra keyword arguments to make the ``Options`` with if
+        `options` is ``None``.
+
+    Raises
+    ------
+    IOError
+        If a file cannot be opened or some other file operation
+        failed.
+
+    See Also
+    --------
+    File.storage_report
+    Options.group_for_references
+    utilities.ObjectCopier
+
+    """
+    if options is None:
+        options = Options(**keywords)
+    # Pooled handles of the file must be closed so that the copy sees
+    # everything written and so that it can be replaced.
+    close_file_pool(src)
+    if dst is None:
+        fd, filename = tempfile.mkstemp(
+            suffix='.h5', dir=os.path.dirname(os.path.abspath(src)))
+        os.close(fd)
+    else:
+        close_file_pool(dst)
+        filename = dst
+    try:
+        with h5py.File(src, mode='r') as fsrc:
+            userblock_size = fsrc.userblock_size
+            with h5py.File(filename, mode='w',
+                           userblock_size=userblock_size) as fdst:
+                copier = utilities.ObjectCopier(
+                    fsrc, fdst, options.group_for_references,
+                    options.group_for_references,
+                    options=options if recompress else None)
+                utilities.copy_attributes(fsrc, fdst)
+                copier.copy_children(fsrc, fdst)
+                if options.group_for_references in fsrc:
+                    copier.require_refs_group()
+                copier.finish()
+        # Copy the userblock over.
+        if userblock_size != 0:
+            with open(src, 'rb') as fsrc:
+                userblock = fsrc.read(userblock_size)
+            with open(filename, 'r+b') as fdst:
+                fdst.write(userblock)
+        if dst is None:
+            # mkstemp makes the file readable only by the owner, so it
+            # has to be given the permissions of the original.
+            shutil.copymode(src, filename)
+            os.replace(filename, src)
+    except:
+        if dst is None and os.path.exists(filename):
+            os.remove(filename)
+        raise
+
+
 def get_default_MarshallerCollection():
     """ Gets the default MarshallerCollection.
 
     The initial default only includes the builtin marshallers in the
-    ``Marshallers`` submodule.
+    ``Marshallers`` submodule. It is made the first time this function
+    is called, which keeps ``import hdf5storage`` fast.
+
+    .. versionchanged:: 0.2
+       The initial default is made on first use instead of on import.
 
     Returns
     -------
@@ -2599,7 +4620,11 @@ def get_default_MarshallerCollection():
     make_new_default_MarshallerCollection
 
     """
-    return _default_marshaller_collection[0]
+    with _default_marshaller_collection_lock:
+        if _default_marshaller_collection[0] is None:
+            _default_marshaller_collection[0] = \
+                MarshallerCollection(lazy_loading=True)
+        return _default_marshaller_collection[0]
 
 
 def make_new_default_MarshallerCollection(*args, **keywords):
@@ -2623,13 +4648,42 @@ def make_new_default_MarshallerCollection(*args, **keywords):
     get_default_MarshallerCollection
 
     """
-    _default_marshaller_collection[0] = MarshallerCollection(*args,
-                                                             **keywords)
+    mc = MarshallerCollection(*args, **keywords)
+    with _default_marshaller_collection_lock:
+        _default_marshaller_collection[0] = mc
+
+
+def _get_builtin_marshaller_classes():
+    """ Gets the builtin marshaller classes.
+
+    Finds all the classes in the ``Marshallers`` submodule that inherit
+    from ``Marshallers.TypeMarshaller`` (including it), sorted by their
+    names. The result is cached after the first call.
+
+    Returns
+    -------
+    classes : tuple of classes
+        The builtin marshaller classes.
+
+    See Also
+    --------
+    hdf5storage.Marshallers
+
+    """
+    if _builtin_marshaller_classes[0] is None:
+        _builtin_marshaller_classes[0] = tuple(
+            v for k, v in sorted(vars(Marshallers).items())
+            if isinstance(v, type)
+            and issubclass(v, Marshallers.TypeMarshaller))
+    return _builtin_marshaller_classes[0]
 
 
-# Make a default MarshallerCollection of just the builtins with lazy
+# The default MarshallerCollection of just the builtins with lazy
 # loading. This will be used as the source for those used in options. It
-# must be packed into a list so that it can be set from functions inside
-# this module without scoping problems.
+# is not made till it is first needed (by get_default_MarshallerCollection)
+# so that importing this package stays fast. It must be packed into a list
+# so that it can be set from functions inside this module without scoping
+# problems. The builtin marshaller classes are cached the same way.
 _default_marshaller_collection = [None]
-make_new_default_MarshallerCollection(lazy_loading=True)
+_default_marshaller_collection_lock = threading.Lock()
+_builtin_marshaller_classes = [None]
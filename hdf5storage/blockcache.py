@@ -0,0 +1,228 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" Module for a block cache in front of slow file-like objects.
+
+``File`` (and the module functions like ``read`` and ``loadmat``) can
+open HDF5 files held in binary file-like objects instead of on
+disk. Reading an HDF5 file makes many small reads (object headers,
+B-trees, heaps, etc.) scattered around the file, which is slow when
+each read is a request to a remote store (such as a range read from an
+object store). ``BlockCache`` wraps such an object and reads it in
+fixed size blocks, keeping the most recently used ones, so that only
+the blocks holding the needed metadata and chunks are fetched and each
+only once (as long as it stays in the cache).
+
+.. versionadded:: 0.2
+
+Example
+-------
+
+   >>> import hdf5storage
+   >>> from hdf5storage.blockcache import BlockCache
+   >>> cache = BlockCache(reader, block_size=256 * 1024, capacity=128)
+   >>> with hdf5storage.File(cache) as f:
+   >>>     a = f.read('/a')
+   >>> cache.misses, cache.bytes_fetched
+
+"""
+
+import collections
+import io
+import threading
+
+
+class BlockCache(io.RawIOBase):
+    """ Read-only file-like object caching blocks of another one.
+
+    Wraps a binary file-like object `raw`, which only needs ``seek``
+    and ``readinto`` (or ``read``) methods, reading it in blocks of
+    `block_size` bytes and keeping up to `capacity` of them in a least
+    recently used (LRU) cache. When a read needs several blocks that
+    aren't cached and are next to each other, they are fetched with a
+    single read of `raw`. Closing it does not close `raw`.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    raw : file-like
+        The binary file-like object to read from.
+    block_size : int, optional
+        The size of the blocks in bytes. The default is 64 KiB.
+    capacity : int, optional
+        The maximum number of blocks to keep. The default is 64.
+    size : int or None, optional
+        The size of `raw` in bytes. If ``None`` (default), it is found
+        by seeking to the end of `raw`.
+
+    Raises
+    ------
+    ValueError
+        If `block_size` or `capacity` isn't positive.
+
+    Attributes
+    ----------
+    block_size : int
+        The size of the blocks in bytes.
+    capacity : int
+        The maximum number of blocks to keep.
+    size : int
+        The size of `raw` in bytes.
+    hits : int
+        The number of blocks needed that were in the cache.
+    misses : int
+        The number of blocks needed that had to be fetched.
+    fetches : int
+        The number of reads of `raw`.
+    bytes_fetched : int
+        The number of bytes read from `raw`.
+
+    """
+    def __init__(self, raw, block_size=64 * 1024, capacity=64,
+                 size=None):
+        super(BlockCache, self).__init__()
+        if block_size <= 0:
+            raise ValueError('block_size must be positive.')
+        if capacity <= 0:
+            raise ValueError('capacity must be positive.')
+        self._raw = raw
+        self.block_size = block_size
+        self.capacity = capacity
+        if size is None:
+            size = raw.seek(0, io.SEEK_END)
+            if size is None:
+                size = raw.tell()
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.bytes_fetched = 0
+        self._pos = 0
+        self._blocks = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError('Invalid whence.')
+        if pos < 0:
+            raise ValueError('Negative seek position.')
+        self._pos = pos
+        return pos
+
+    def tell(self):
+        return self._pos
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        start = self._pos
+        stop = min(start + len(view), self.size)
+        if stop <= start:
+            return 0
+        with self._lock:
+            first = start // self.block_size
+            last = (stop - 1) // self.block_size
+            self._fetch(first, last)
+            # Copy the parts of each block needed.
+            for i in range(first, last + 1):
+                block = self._blocks[i]
+                block_start = i * self.block_size
+                lo = max(start, block_start)
+                hi = min(stop, block_start + len(block))
+                view[lo - start:hi - start] = \
+                    block[lo - block_start:hi - block_start]
+        self._pos = stop
+        return stop - start
+
+    def clear(self):
+        """ Removes all the blocks from the cache. """
+        with self._lock:
+            self._blocks.clear()
+
+    def _fetch(self, first, last):
+        # Makes sure blocks first to last are in the cache, marking
+        # them as the most recently used, and fetching the ones that
+        # aren't there with one read of raw for each run of them next
+        # to each other.
+        run_start = None
+        for i in range(first, last + 2):
+            if i <= last and i in self._blocks:
+                self.hits += 1
+                self._blocks.move_to_end(i)
+            elif i <= last:
+                self.misses += 1
+                if run_start is None:
+                    run_start = i
+                continue
+            if run_start is not None:
+                self._fetch_run(run_start, i)
+                run_start = None
+        # Drop the least recently used blocks, though never ones needed
+        # by this read.
+        while len(self._blocks) > max(self.capacity, last - first + 1):
+            self._blocks.popitem(last=False)
+
+    def _fetch_run(self, first, stop):
+        # Fetches blocks first up to (not including) stop.
+        offset = first * self.block_size
+        length = min(stop * self.block_size, self.size) - offset
+        data = self._read_raw(offset, length)
+        for i in range(first, stop):
+            lo = (i - first) * self.block_size
+            self._blocks[i] = data[lo:lo + self.block_size]
+
+    def _read_raw(self, offset, length):
+        # Reads length bytes at offset from raw, which can take several
+        # reads.
+        buf = bytearray(length)
+        view = memoryview(buf)
+        self._raw.seek(offset)
+        got = 0
+        while got < length:
+            if hasattr(self._raw, 'readinto'):
+                n = self._raw.readinto(view[got:])
+            else:
+                data = self._raw.read(length - got)
+                n = len(data)
+                view[got:got + n] = data
+            self.fetches += 1
+            if not n:
+                break
+            got += n
+        self.bytes_fetched += got
+        return bytes(buf[:got])
@@ -0,0 +1,524 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+""" Module for instrumenting reading and writing.
+
+Every time data is written with ``utilities.write_data`` or read with
+``utilities.read_data`` (which is done for the top level data given to
+``File.write``, ``File.read``, etc. as well as for all the data nested
+in it), an ``Event`` describing what was done is given to every
+subscribed callback. Callbacks are subscribed with ``subscribe`` or
+for a block of code with the ``instrument`` context manager.
+
+Events are also given for the steps inside that (``File.writes`` and
+``File.reads``, writing and reading object arrays, creating and writing
+Datasets, and setting Attributes), which ``ChromeTraceRecorder`` uses to
+record nested spans that can be viewed in Perfetto or
+``chrome://tracing``. Recording to a file can be turned on without
+changing any code by setting the environment variable
+``HDF5STORAGE_TRACE`` to the name of the file to write the trace to
+when the interpreter exits (any ``'{pid}'`` in it is replaced by the
+process ID).
+
+When nothing is subscribed, the only overhead is checking whether
+anything is subscribed.
+
+.. versionadded:: 0.2
+
+Example
+-------
+
+   >>> import hdf5storage
+   >>> with hdf5storage.instrument() as events:
+   >>>     hdf5storage.write({'a': [1, 2]}, '/data', filename='data.h5')
+   >>> for ev in events:
+   >>>     print(ev.depth, ev.path, ev.marshaller.__name__, ev.wall_time)
+
+"""
+
+import atexit
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import h5py
+
+
+class Event(collections.namedtuple(
+        'Event', ('operation', 'path', 'marshaller', 'bytes_in',
+                  'bytes_out', 'objects_created', 'wall_time',
+                  'cpu_time', 'start_time', 'depth', 'error',
+                  'thread_id'))):
+    """ Event describing an operation done in reading or writing.
+
+    The main operations are the writing and reading of each piece of
+    data, which have the `operation` ``'write'`` and ``'read'``. Events
+    for the operations inside another (elements of lists, values of
+    dicts, creating a Dataset, etc.) are given to the subscribers before
+    the event for the operation containing them, since it is not
+    finished till everything inside it is.
+
+    ======================  ===========================================
+    operation               description
+    ======================  ===========================================
+    ``'write'``             Writing a piece of data with a marshaller.
+    ``'read'``              Reading a piece of data with a marshaller.
+    ``'File.writes'``       ``File.writes`` (path is the filename).
+    ``'File.reads'``        ``File.reads`` (path is the filename).
+    ``'File.read_to_memmap'``  ``File.read_to_memmap`` (path is the
+                            filename).
+    ``'File.copy'``         ``File.copy`` (path is the filename).
+    ``'write_object_array'``  ``utilities.write_object_array``.
+    ``'read_object_array'``   ``utilities.read_object_array``.
+    ``'create_dataset'``    Creating a Dataset with its data.
+    ``'write_dataset'``     Writing the data of an existing Dataset.
+    ``'read_dataset'``      Reading a Dataset into a ``numpy.memmap``.
+    ``'set_attributes'``    ``utilities.set_attributes_all``.
+    ======================  ===========================================
+
+    For operations other than ``'write'`` and ``'read'``, `marshaller`
+    is ``None``.
+
+    Attributes
+    ----------
+    operation : {'write', 'read'}
+        Whether the data was written or read.
+    path : str
+        The absolute path in the file of the data.
+    marshaller : type
+        The class of the marshaller used to write or read the data.
+    bytes_in : int or None
+        The number of bytes of the data (the Python data when writing
+        and the storage used in the file when reading). ``None`` if it
+        isn't known, such as for Python containers and Groups.
+    bytes_out : int or None
+        The number of bytes of the result (the storage used in the file
+        when writing and the Python data when reading). ``None`` if it
+        isn't known, such as for Python containers and Groups.
+    objects_created : int
+        The number of HDF5 Datasets and Groups made by the marshallers,
+        including those for nested data. Always zero when reading.
+    wall_time : float
+        The wall time in seconds, including nested data.
+    cpu_time : float
+        The CPU time of the process in seconds, including nested data.
+    start_time : float
+        The ``time.perf_counter`` value when the operation started.
+    depth : int
+        The data nesting depth, which is zero for top level data. Only
+        ``'write'`` and ``'read'`` operations increase it.
+    error : BaseException or None
+        The exception raised by the operation, or ``None`` if there
+        was none. The exception is still raised after the event is
+        given to the subscribers.
+    thread_id : int
+        The ``threading.get_ident`` of the thread that did it.
+
+    """
+    __slots__ = ()
+
+
+# The subscribed callbacks. It is replaced rather than modified in place
+# so that it can be iterated over without the lock.
+_subscribers = ()
+_subscribers_lock = threading.Lock()
+
+# Per thread stack of the number of objects created by the operations
+# in progress.
+_local = threading.local()
+
+
+def subscribe(callback):
+    """ Subscribe a callback to the events.
+
+    Parameters
+    ----------
+    callback : callable
+        The callable to call with each ``Event``. It is called in the
+        thread that did the writing or reading. Any exception it raises
+        is propagated.
+
+    Raises
+    ------
+    TypeError
+        If `callback` is not callable.
+
+    See Also
+    --------
+    unsubscribe
+    instrument
+    Event
+
+    """
+    global _subscribers
+    if not callable(callback):
+        raise TypeError('callback must be callable.')
+    with _subscribers_lock:
+        _subscribers = _subscribers + (callback, )
+
+
+def unsubscribe(callback):
+    """ Unsubscribe a callback from the events.
+
+    Does nothing if `callback` is not subscribed.
+
+    Parameters
+    ----------
+    callback : callable
+        The callable to unsubscribe.
+
+    See Also
+    --------
+    subscribe
+
+    """
+    global _subscribers
+    with _subscribers_lock:
+        subs = list(_subscribers)
+        if callback in subs:
+            subs.remove(callback)
+            _subscribers = tuple(subs)
+
+
+@contextlib.contextmanager
+def instrument(callback=None):
+    """ Context manager subscribing a callback to the events.
+
+    The callback is subscribed on entry and unsubscribed on exit.
+
+    Parameters
+    ----------
+    callback : callable or None, optional
+        The callable to call with each ``Event``. If ``None`` (default),
+        the events are appended to a ``list``.
+
+    Returns
+    -------
+    events : list or None
+        The ``list`` the events are appended to if `callback` is
+        ``None``, otherwise ``None``.
+
+    See Also
+    --------
+    subscribe
+    Event
+
+    """
+    events = None
+    if callback is None:
+        events = []
+        callback = events.append
+    subscribe(callback)
+    try:
+        yield events
+    finally:
+        unsubscribe(callback)
+
+
+def _data_nbytes(data):
+    # The number of bytes of Python data, or None if it isn't known.
+    if isinstance(data, (np.ndarray, np.generic)):
+        return int(data.nbytes)
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    if isinstance(data, str):
+        return len(data.encode('utf-8', 'surrogatepass'))
+    return None
+
+
+def _storage_nbytes(obj):
+    # The storage used in the file by a Dataset, or None for other
+    # objects.
+    if isinstance(obj, h5py.Dataset):
+        return int(obj.id.get_storage_size())
+    return None
+
+
+def _emit(event):
+    for callback in _subscribers:
+        callback(event)
+
+
+def _get_stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = []
+        _local.stack = stack
+    return stack
+
+
+def instrumented_write(m, f, grp, name, data, type_string, options):
+    """ Writes data with a marshaller, giving an ``Event`` about it.
+
+    Called by ``utilities.write_data`` in place of ``m.write`` when
+    something is subscribed.
+
+    """
+    stack = _get_stack()
+    path = grp.name.rstrip('/') + '/' + name
+    existed = name in grp
+    stack.append(0)
+    error = None
+    obj = None
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        obj = m.write(f, grp, name, data, type_string, options)
+        return obj
+    except BaseException as ex:
+        error = ex
+        raise
+    finally:
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - start_cpu
+        created = stack.pop()
+        if obj is not None and not existed:
+            created += 1
+        if stack:
+            stack[-1] += created
+        _emit(Event('write', path, type(m), _data_nbytes(data),
+                    _storage_nbytes(obj), created, wall, cpu, start,
+                    len(stack), error, threading.get_ident()))
+
+
+def instrumented_read(m, f, dsetgrp, attributes, options,
+                      approximate):
+    """ Reads data with a marshaller, giving an ``Event`` about it.
+
+    Called by ``utilities.read_data`` in place of ``m.read`` (or
+    ``m.read_approximate`` if `approximate` is ``True``) when something
+    is subscribed.
+
+    """
+    stack = _get_stack()
+    stack.append(0)
+    error = None
+    data = None
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        if approximate:
+            data = m.read_approximate(f, dsetgrp, attributes, options)
+        else:
+            data = m.read(f, dsetgrp, attributes, options)
+        return data
+    except BaseException as ex:
+        error = ex
+        raise
+    finally:
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - start_cpu
+        stack.pop()
+        _emit(Event('read', dsetgrp.name, type(m),
+                    _storage_nbytes(dsetgrp), _data_nbytes(data), 0,
+                    wall, cpu, start, len(stack), error,
+                    threading.get_ident()))
+
+
+class _Span(object):
+    # Context manager giving an Event for the operation inside it.
+    __slots__ = ('operation', 'target', 'name', 'bytes_in',
+                 'objects_created', 'start', 'start_cpu')
+
+    def __init__(self, operation, target, name, bytes_in,
+                 objects_created):
+        self.operation = operation
+        self.target = target
+        self.name = name
+        self.bytes_in = bytes_in
+        self.objects_created = objects_created
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, tp, value, traceback):
+        wall = time.perf_counter() - self.start
+        cpu = time.process_time() - self.start_cpu
+        # The path is only worked out now since getting the name of an
+        # HDF5 object is not free.
+        path = self.target
+        if path is not None and not isinstance(path, str):
+            path = path.name
+        if self.name is not None:
+            path = path.rstrip('/') + '/' + self.name
+        _emit(Event(self.operation, path, None, self.bytes_in, None,
+                    self.objects_created, wall, cpu, self.start,
+                    len(_get_stack()), value, threading.get_ident()))
+        return False
+
+
+class _NullSpan(object):
+    # Context manager that does nothing, used when nothing is
+    # subscribed.
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tp, value, traceback):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+def span(operation, target=None, name=None, bytes_in=None,
+         objects_created=0):
+    """ Context manager giving an ``Event`` for the operation inside it.
+
+    Does nothing if nothing is subscribed.
+
+    Parameters
+    ----------
+    operation : str
+        The name of the operation.
+    target : str or h5py.Group or h5py.Dataset or None, optional
+        The path or HDF5 object the operation is done on, if any.
+    name : str or None, optional
+        The name in `target` (which must then be given) that the
+        operation is done on, if any.
+    bytes_in : int or None, optional
+        The number of bytes the operation works on, if known.
+    objects_created : int, optional
+        The number of HDF5 objects the operation creates.
+
+    Returns
+    -------
+    span : context manager
+        The context manager.
+
+    See Also
+    --------
+    Event
+
+    """
+    if not _subscribers:
+        return _null_span
+    return _Span(operation, target, name, bytes_in, objects_created)
+
+
+class ChromeTraceRecorder(object):
+    """ Records events as a Chrome trace.
+
+    Each ``Event`` it is called with is recorded as a complete (``'X'``)
+    trace event, and the trace can be saved as a JSON file that can be
+    opened in Perfetto (https://ui.perfetto.dev) or
+    ``chrome://tracing`` to see the nested operations on a timeline. It
+    is subscribed and unsubscribed like any other callback.
+
+    Example
+    -------
+
+       >>> import hdf5storage
+       >>> from hdf5storage.instrumentation import ChromeTraceRecorder
+       >>> recorder = ChromeTraceRecorder()
+       >>> with hdf5storage.instrument(recorder):
+       >>>     hdf5storage.savemat('data.mat', {'a': [1, 'b']})
+       >>> recorder.save('trace.json')
+
+    See Also
+    --------
+    instrument
+    Event
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._events = []
+
+    def __call__(self, event):
+        args = {'path': event.path, 'depth': event.depth,
+                'cpu_time_us': 1e6 * event.cpu_time}
+        for k in ('bytes_in', 'bytes_out', 'objects_created'):
+            if getattr(event, k) is not None:
+                args[k] = getattr(event, k)
+        if event.error is not None:
+            args['error'] = repr(event.error)
+        if event.marshaller is None:
+            name = event.operation
+        else:
+            args['marshaller'] = event.marshaller.__name__
+            name = event.operation + ' ' + event.marshaller.__name__
+        trace_event = {'name': name, 'cat': 'hdf5storage', 'ph': 'X',
+                       'ts': 1e6 * (event.start_time - self._origin),
+                       'dur': 1e6 * event.wall_time,
+                       'pid': os.getpid(), 'tid': event.thread_id,
+                       'args': args}
+        with self._lock:
+            self._events.append(trace_event)
+
+    def clear(self):
+        """ Discards all the recorded events. """
+        with self._lock:
+            self._events = []
+
+    def to_dict(self):
+        """ Gets the trace.
+
+        Returns
+        -------
+        trace : dict
+            The trace in Chrome trace JSON object format.
+
+        """
+        with self._lock:
+            events = list(self._events)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, filename):
+        """ Saves the trace as a JSON file.
+
+        Parameters
+        ----------
+        filename : str
+            The file to write the trace to. Any ``'{pid}'`` in it is
+            replaced by the process ID.
+
+        """
+        filename = filename.replace('{pid}', str(os.getpid()))
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+
+def _start_env_trace():
+    # Start recording a trace to be saved at exit if the
+    # HDF5STORAGE_TRACE environmental variable is set.
+    filename = os.environ.get('HDF5STORAGE_TRACE')
+    if not filename:
+        return
+    recorder = ChromeTraceRecorder()
+    subscribe(recorder)
+    atexit.register(recorder.save, filename)
+
+
+_start_env_trace()
@@ -28,8 +28,7 @@
 
 """
 
-# From setuptools, despite name.
-import pkg_resources
+import importlib
 
 
 def supported_marshaller_api_versions():
@@ -72,15 +71,89 @@ def find_thirdparty_marshaller_plugins():
         plugins. The keys are the Marshaller API versions (``str``) and
         the values are ``dict`` of the entry points, with the module
         names as the keys (``str``) and the values being the entry
-        points (``pkg_resources.EntryPoint``).
+        points (``importlib.metadata.EntryPoint``, or
+        ``pkg_resources.EntryPoint`` if ``importlib.metadata`` and its
+        ``importlib_metadata`` backport are not available).
+
+    .. versionchanged:: 0.2
+       Entry points are found with ``importlib.metadata`` when
+       available instead of the much slower to import
+       ``pkg_resources``.
 
     See Also
     --------
     supported_marshaller_api_versions
 
     """
-    all_plugins = tuple(pkg_resources.iter_entry_points(
-        'hdf5storage.marshallers.plugins'))
-    return {ver: {p.module_name: p
+    all_plugins = _iter_entry_points('hdf5storage.marshallers.plugins')
+    return {ver: {_entry_point_module_name(p): p
                   for p in all_plugins if p.name == ver}
             for ver in supported_marshaller_api_versions()}
+
+
+def _iter_entry_points(group):
+    """ Get all entry points in a group.
+
+    The modules used to look up entry points are only imported when this
+    function is called, since importing them (especially
+    ``pkg_resources``) is slow and they are not needed unless plugins
+    are being loaded. ``importlib.metadata`` (Python >= 3.8) is tried
+    first, then its ``importlib_metadata`` backport, and then
+    ``pkg_resources`` from setuptools.
+
+    Parameters
+    ----------
+    group : str
+        The entry point group.
+
+    Returns
+    -------
+    entry_points : tuple
+        The entry points in the group with duplicates removed.
+
+    """
+    for name in ('importlib.metadata', 'importlib_metadata'):
+        try:
+            metadata = importlib.import_module(name)
+        except ImportError:
+            continue
+        eps = metadata.entry_points()
+        # Python >= 3.10 returns an EntryPoints object that is searched
+        # with select, while earlier versions return a dict of lists
+        # with the groups as the keys.
+        if hasattr(eps, 'select'):
+            eps = eps.select(group=group)
+        else:
+            eps = eps.get(group, ())
+        # The same distribution can be found more than once if it is on
+        # sys.path more than once, so duplicates need to be removed.
+        out = []
+        seen = set()
+        for ep in eps:
+            if (ep.name, ep.value) not in seen:
+                seen.add((ep.name, ep.value))
+                out.append(ep)
+        return tuple(out)
+    # From setuptools, despite name.
+    pkg_resources = importlib.import_module('pkg_resources')
+    return tuple(pkg_resources.iter_entry_points(group))
+
+
+def _entry_point_module_name(ep):
+    """ Get the name of the module an entry point points into.
+
+    Parameters
+    ----------
+    ep : importlib.metadata.EntryPoint or pkg_resources.EntryPoint
+        The entry point.
+
+    Returns
+    -------
+    module_name : str
+        The name of the module.
+
+    """
+    if hasattr(ep, 'module_name'):
+        return ep.module_name
+    # The value is of the form 'module:attr [extras]'.
+    return ep.value.partition(':')[0].strip()
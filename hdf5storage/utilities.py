@@ -34,15 +34,17 @@ arrays, etc.
 
 import collections
 import collections.abc
-import copy
+import itertools
 import posixpath
 import random
 import sys
+import time
 
 import numpy as np
 import h5py
 
 import hdf5storage.exceptions
+import hdf5storage.instrumentation
 
 
 def does_dtype_have_a_zero_shape(dt):
@@ -92,6 +94,585 @@ def does_dtype_have_a_zero_shape(dt):
     return False
 
 
+def get_dataset_filters(data, options, convert=None):
+    """ Gets the filters to make a Dataset for some data with.
+
+    Works out the compression, shuffle, fletcher32, and chunking to use
+    for a Dataset holding `data` from the options. Data is compressed if
+    ``options.compress`` is set, it isn't a scalar, and it is at least
+    ``options.compress_size_threshold`` bytes. Otherwise, only the
+    fletcher32 filter (and chunking) is used, if
+    ``options.uncompressed_fletcher32_filter`` is set and `data` isn't a
+    scalar. If ``options.adaptive_compression`` is set, the compression
+    settings are chosen by ``choose_compression``. The scale-offset or
+    n-bit filter is used if ``options.scaleoffset_filter`` or
+    ``options.nbit_filter`` has a rule for the dtype of `data`.
+
+    The data is only ever looked at in blocks of at most a quarter of
+    ``options.write_memory_budget`` bytes, so that large arrays such as
+    ``numpy.memmap`` are never copied whole. If `data` will be converted
+    block by block as it is written, the conversion is given as
+    `convert` and is applied to each block looked at.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        The data that will be written.
+    options : hdf5storage.core.Options
+        The options to use when writing.
+    convert : callable or None, optional
+        The conversion applied to each block of `data` to get what is
+        written, which must not change the shape, or ``None`` if `data`
+        is written as is.
+
+    Returns
+    -------
+    filters : dict
+        The filters to pass to ``create_dataset`` (the keys
+        ``'compression'``, ``'compression_opts'``, ``'shuffle'``,
+        ``'fletcher32'``, ``'scaleoffset'``, ``'nbit'``, and
+        ``'chunks'``).
+    choice : str or None
+        The compression chosen by ``choose_compression`` if it was
+        used, or ``None`` if not.
+
+    See Also
+    --------
+    choose_compression
+    create_dataset
+    get_array_blocks
+    hdf5storage.Options.compress
+    hdf5storage.Options.adaptive_compression
+    hdf5storage.Options.scaleoffset_filter
+    hdf5storage.Options.nbit_filter
+    hdf5storage.Options.write_memory_budget
+
+    """
+    # If the data is converted as it is written, the dtype of what is
+    # stored is that of a converted element.
+    if convert is None or data.size == 0:
+        dtype = data.dtype
+    else:
+        dtype = convert(data[tuple([slice(0, 1)] * data.ndim)]).dtype
+
+    # If the data is being compressed (compression is enabled and the
+    # data is bigger than the threshold), turn on compression, set the
+    # algorithm, set the compression level, and enable the shuffle and
+    # fletcher32 filters appropriately. If the data is not being
+    # compressed, turn on the fletcher32 filter if indicated. Compression
+    # should not be done for scalars.
+    filters = dict()
+    choice = None
+    is_scalar = (data.shape != tuple())
+    if is_scalar and options.compress \
+            and data.size * dtype.itemsize \
+            >= options.compress_size_threshold:
+        if options.adaptive_compression:
+            choice = choose_compression(data, options, convert=convert)
+            algorithm, level, shuffle = _compression_candidates[choice]
+        else:
+            algorithm = options.compression_algorithm
+            level = options.gzip_compression_level
+            shuffle = options.shuffle_filter
+        filters['compression'] = algorithm
+        if algorithm == 'gzip':
+            filters['compression_opts'] = level
+        else:
+            filters['compression_opts'] = None
+        filters['shuffle'] = shuffle
+        if algorithm is None:
+            filters['fletcher32'] = \
+                options.uncompressed_fletcher32_filter
+        else:
+            filters['fletcher32'] = options.compressed_fletcher32_filter
+    else:
+        filters['compression'] = None
+        filters['shuffle'] = False
+        filters['compression_opts'] = None
+        if is_scalar:
+            filters['fletcher32'] = \
+                options.uncompressed_fletcher32_filter
+        else:
+            filters['fletcher32'] = False
+
+    # HDF5 doesn't allow the fletcher32 filter on variable length types
+    # (it would only cover their handles anyway).
+    if h5py.check_dtype(vlen=dtype) is not None:
+        filters['fletcher32'] = False
+
+    # Apply the scale-offset or n-bit filter if there is a rule for the
+    # dtype and the data can be stored with it. The scale-offset filter
+    # can't be used with the fletcher32 filter.
+    filters['scaleoffset'] = None
+    filters['nbit'] = None
+    if is_scalar and data.size != 0:
+        dtype_name = dtype.name
+        if dtype_name in options.scaleoffset_filter \
+                or dtype_name in options.nbit_filter:
+            data_range = _data_range(data, convert, options)
+        if dtype_name in options.scaleoffset_filter:
+            filters['scaleoffset'] = _scaleoffset_setting(
+                dtype, data_range, options.scaleoffset_filter[dtype_name])
+        if filters['scaleoffset'] is not None:
+            filters['fletcher32'] = False
+        elif dtype_name in options.nbit_filter:
+            filters['nbit'] = _nbit_setting(
+                dtype, data_range, options.nbit_filter[dtype_name])
+
+    # Set the chunking to auto if it is being chuncked (compressed or
+    # using any filter).
+    if filters['compression'] is not None or filters['fletcher32'] \
+            or filters['scaleoffset'] is not None \
+            or filters['nbit'] is not None:
+        filters['chunks'] = True
+    else:
+        filters['chunks'] = None
+    return filters, choice
+
+
+def _integer_bits_needed(low, high):
+    # Number of bits needed to hold every integer from low to high
+    # inclusive as an unsigned offset from low.
+    return int(high - low).bit_length()
+
+
+def _data_range(data, convert, options):
+    # The smallest and largest values of integer data and whether
+    # floating point data is all finite, going through it in blocks
+    # (converted by convert if it isn't None) so it is never copied
+    # whole.
+    low = None
+    high = None
+    finite = True
+    for index in get_array_blocks(data.shape, data.strides,
+                                  data.dtype.itemsize,
+                                  max(1, options.write_memory_budget // 4)):
+        block = data[index]
+        if convert is not None:
+            block = convert(block)
+        if block.dtype.kind in 'iu':
+            block_low = int(block.min())
+            block_high = int(block.max())
+            low = block_low if low is None else min(low, block_low)
+            high = block_high if high is None else max(high, block_high)
+        elif finite and not np.all(np.isfinite(block)):
+            finite = False
+    return low, high, finite
+
+
+def _scaleoffset_setting(dtype, data_range, setting):
+    # Integers must fit in the number of bits, or else the number of
+    # bits is worked out by the filter (0). Floats must all be finite.
+    low, high, finite = data_range
+    if dtype.kind in 'iu':
+        if setting != 0 and _integer_bits_needed(low, high) > setting:
+            return 0
+        return setting
+    if not finite:
+        return None
+    return setting
+
+
+def _nbit_setting(dtype, data_range, bits):
+    # The data must fit in the number of bits, which for signed integers
+    # includes the sign bit.
+    low, high, finite = data_range
+    if dtype.kind == 'u':
+        fits = high < 2**bits
+    else:
+        fits = low >= -2**(bits - 1) and high < 2**(bits - 1)
+    if fits and bits < 8 * dtype.itemsize:
+        return bits
+    return None
+
+
+def get_array_blocks(shape, strides, itemsize, max_bytes, chunks=None):
+    """ Splits an array into blocks of at most a given size.
+
+    Gets the indices of the blocks to go through an array in, each of
+    which is at most `max_bytes` bytes if possible. The array is split
+    along the axis with the largest stride (the slowest in memory) so
+    that each block is one sequential piece of memory for C and Fortran
+    ordered arrays and views of them (such as their transposes). If a
+    single index along that axis is too big, it is taken one index at a
+    time and the axis with the next largest stride is split as well, and
+    so on. If `chunks` is given, the blocks are a multiple of the chunk
+    shape (one chunk length along the axes taken one index at a time) so
+    that each chunk of a Dataset with that chunk shape is in a single
+    block, which can make the blocks bigger than `max_bytes` if a single
+    chunk is.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    shape : tuple of int
+        The shape of the array.
+    strides : tuple of int
+        The strides of the array in bytes.
+    itemsize : int
+        The size of each element of the array in bytes.
+    max_bytes : int
+        The maximum size of each block in bytes.
+    chunks : tuple of int or None, optional
+        The chunk shape to align the blocks to, or ``None``.
+
+    Returns
+    -------
+    blocks : list of tuple of slice
+        The index of each block in order.
+
+    See Also
+    --------
+    hdf5storage.Options.write_memory_budget
+
+    """
+    ndim = len(shape)
+    if ndim == 0 or 0 in shape:
+        return [tuple([slice(None)] * ndim)]
+    if chunks is None:
+        chunks = (1, ) * ndim
+    order = sorted(range(ndim), key=lambda i: -abs(strides[i]))
+
+    units = [min(c, n) for c, n in zip(chunks, shape)]
+
+    # The number of bytes in one index along each axis in order, which
+    # includes the whole of the axes after it and one chunk length of
+    # the axes before it.
+    slab_bytes = [itemsize] * ndim
+    for k in range(ndim - 2, -1, -1):
+        slab_bytes[k] = slab_bytes[k + 1] * shape[order[k + 1]]
+    for k in range(1, ndim):
+        for a in order[:k]:
+            slab_bytes[k] *= units[a]
+
+    # Split along the first axis in order where one chunk length fits,
+    # or the last one if none do, taking the ones before it one chunk
+    # length at a time.
+    split = ndim - 1
+    for k in range(ndim):
+        if slab_bytes[k] * units[order[k]] <= max_bytes:
+            split = k
+            break
+    axis = order[split]
+    unit = units[axis]
+    length = max(unit, max_bytes // slab_bytes[split] // unit * unit)
+
+    ranges = [[slice(None)]] * ndim
+    for k in range(split):
+        a = order[k]
+        ranges[a] = [slice(i, min(i + units[a], shape[a]))
+                     for i in range(0, shape[a], units[a])]
+    ranges[axis] = [slice(i, min(i + length, shape[axis]))
+                    for i in range(0, shape[axis], length)]
+    blocks = []
+    for parts in itertools.product(*[ranges[a] for a in order]):
+        index = [None] * ndim
+        for a, part in zip(order, parts):
+            index[a] = part
+        blocks.append(tuple(index))
+    return blocks
+
+
+def normalize_filter_rules(rules, kinds):
+    """ Normalizes per-dtype filter rules.
+
+    Checks that `rules` is a ``dict`` mapping numpy dtypes (anything
+    ``numpy.dtype`` accepts) to filter settings and converts the keys
+    to the dtype names (e.g. ``'int16'``). Each dtype must be of one of
+    the given kinds (``numpy.dtype.kind``) and each setting must be a
+    non-negative ``int`` (positive if `kinds` has no floating point
+    kinds) no larger than the number of bits in an element if the dtype
+    is an integer one. The only floating point dtypes allowed are
+    ``numpy.float32`` and ``numpy.float64``.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    rules : dict
+        The rules to normalize.
+    kinds : str
+        The allowed dtype kinds.
+
+    Returns
+    -------
+    normalized : dict or None
+        The normalized rules, or ``None`` if `rules` is not valid.
+
+    See Also
+    --------
+    hdf5storage.Options.scaleoffset_filter
+    hdf5storage.Options.nbit_filter
+
+    """
+    if not isinstance(rules, dict):
+        return None
+    min_setting = 0 if 'f' in kinds else 1
+    normalized = dict()
+    for k, v in rules.items():
+        try:
+            dt = np.dtype(k)
+        except TypeError:
+            return None
+        if dt.kind not in kinds or not isinstance(v, int) \
+                or isinstance(v, bool) or v < min_setting \
+                or (dt.kind in 'iu' and v > 8 * dt.itemsize) \
+                or (dt.kind == 'f' and dt.itemsize not in (4, 8)):
+            return None
+        normalized[dt.name] = v
+    return normalized
+
+
+def create_dataset(grp, name, data, filters, shape=None, dtype=None):
+    """ Creates a Dataset holding some data with the given filters.
+
+    Uses ``h5py.Group.create_dataset`` unless the n-bit filter is used,
+    which h5py doesn't support, in which case the Dataset is made with
+    the low level h5py API with an HDF5 datatype of reduced precision
+    and the n-bit filter first in the filter pipeline. If `data` is
+    ``None``, the Dataset is made with the given shape and dtype without
+    writing anything to it, so that it can be written later (such as in
+    blocks).
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    grp : h5py.Group or h5py.File
+        The Group to make the Dataset in.
+    name : str
+        The name of the Dataset.
+    data : numpy.ndarray or None
+        The data to write, or ``None`` to not write anything.
+    filters : dict
+        The filters to use as returned by ``get_dataset_filters``.
+    shape : tuple of int or None, optional
+        The shape of the Dataset if `data` is ``None``.
+    dtype : numpy.dtype or None, optional
+        The dtype of the Dataset if `data` is ``None``.
+
+    Returns
+    -------
+    dset : h5py.Dataset
+        The new Dataset.
+
+    See Also
+    --------
+    get_dataset_filters
+    dataset_has_filters
+
+    """
+    if data is not None:
+        shape = data.shape
+        dtype = data.dtype
+    kwargs = dict(filters)
+    bits = kwargs.pop('nbit', None)
+    if bits is None:
+        if data is None:
+            return grp.create_dataset(name, shape=shape, dtype=dtype,
+                                      **kwargs)
+        return grp.create_dataset(name, data=data, **kwargs)
+    tid = h5py.h5t.py_create(dtype).copy()
+    tid.set_precision(bits)
+    dcpl = h5py.h5p.create(h5py.h5p.DATASET_CREATE)
+    dcpl.set_chunk(h5py.filters.guess_chunk(shape, None, dtype.itemsize))
+    dcpl.set_fill_time(h5py.h5d.FILL_TIME_ALLOC)
+    dcpl.set_filter(h5py.h5z.FILTER_NBIT, 0, ())
+    if kwargs['shuffle']:
+        dcpl.set_shuffle()
+    if kwargs['compression'] == 'gzip':
+        dcpl.set_deflate(kwargs['compression_opts'])
+    elif kwargs['compression'] == 'lzf':
+        dcpl.set_filter(h5py.h5z.FILTER_LZF, h5py.h5z.FLAG_OPTIONAL)
+    elif kwargs['compression'] == 'szip':
+        dcpl.set_szip(h5py.h5z.SZIP_NN_OPTION_MASK, 8)
+    if kwargs['fletcher32']:
+        dcpl.set_fletcher32()
+    space = h5py.h5s.create_simple(shape)
+    if isinstance(name, str):
+        name = name.encode('utf-8')
+    dset = h5py.Dataset(h5py.h5d.create(grp.id, name, tid, space,
+                                        dcpl=dcpl))
+    if data is not None:
+        dset[...] = data
+    return dset
+
+
+def dataset_has_filters(dset, filters):
+    """ Checks whether a Dataset uses the given filters.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        The Dataset to check.
+    filters : dict
+        The filters as returned by ``get_dataset_filters``.
+
+    Returns
+    -------
+    same : bool
+        Whether `dset` uses the filters in `filters`.
+
+    See Also
+    --------
+    get_dataset_filters
+    create_dataset
+
+    """
+    if dset.compression != filters['compression'] \
+            or dset.shuffle != filters['shuffle'] \
+            or dset.fletcher32 != filters['fletcher32'] \
+            or dset.compression_opts != filters['compression_opts'] \
+            or dset.scaleoffset != filters['scaleoffset']:
+        return False
+    dcpl = dset.id.get_create_plist()
+    has_nbit = any(dcpl.get_filter(i)[0] == h5py.h5z.FILTER_NBIT
+                   for i in range(dcpl.get_nfilters()))
+    if filters['nbit'] is None:
+        return not has_nbit
+    return has_nbit \
+        and dset.id.get_type().get_precision() == filters['nbit']
+
+
+# The candidate compression settings for adaptive compression by name,
+# which are the algorithm, the gzip level, and whether to shuffle.
+_compression_candidates = collections.OrderedDict((
+    ('none', (None, None, False)),
+    ('gzip:1', ('gzip', 1, False)),
+    ('gzip:1+shuffle', ('gzip', 1, True)),
+    ('gzip:4', ('gzip', 4, False)),
+    ('gzip:4+shuffle', ('gzip', 4, True)),
+    ('gzip:9', ('gzip', 9, False)),
+    ('gzip:9+shuffle', ('gzip', 9, True)),
+    ('lzf', ('lzf', None, False)),
+    ('lzf+shuffle', ('lzf', None, True))))
+
+# Counter to give each in memory file used to sample the compression a
+# unique name.
+_sample_file_counter = itertools.count()
+
+# The number of times the sample is compressed with each candidate, the
+# fastest of which is its time, and the timer used.
+_compression_sample_repeats = 3
+_compression_timer = time.perf_counter
+
+
+def choose_compression(data, options, convert=None):
+    """ Chooses the compression for some data by sampling.
+
+    Takes a sample of `data` (up to
+    ``options.adaptive_compression_sample_size`` bytes made of evenly
+    spaced blocks), writes it to an in memory HDF5 file with each
+    candidate compression setting (timing the fastest of a few repeats
+    of just writing the data), and chooses the best one by
+    ``options.adaptive_compression_objective``. The candidates are
+
+    ====================  ==============================================
+    name                  setting
+    ====================  ==============================================
+    ``'none'``            No compression.
+    ``'gzip:L'``          ``'gzip'`` at level L (1, 4, and 9).
+    ``'gzip:L+shuffle'``  ``'gzip'`` at level L with the shuffle filter.
+    ``'lzf'``             ``'lzf'``.
+    ``'lzf+shuffle'``     ``'lzf'`` with the shuffle filter.
+    ====================  ==============================================
+
+    where the ``'lzf'`` ones are not used if doing MATLAB compatibility.
+    Only the sample of `data` is copied.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        The data that will be written.
+    options : hdf5storage.core.Options
+        The options to use when writing.
+    convert : callable or None, optional
+        The conversion applied to `data` to get what is written, which
+        is applied to the sample, or ``None`` if `data` is written as
+        is.
+
+    Returns
+    -------
+    choice : str
+        The name of the chosen candidate.
+
+    See Also
+    --------
+    get_dataset_filters
+    hdf5storage.Options.adaptive_compression
+
+    """
+    names = [k for k, v in _compression_candidates.items()
+             if v[0] != 'lzf' or not options.matlab_compatible]
+    # Reference arrays can't be sampled by copying the data, so the
+    # choice is simply not to compress them.
+    if h5py.check_dtype(ref=data.dtype) is not None:
+        return 'none'
+    # Make the sample from evenly spaced blocks of the data, which are
+    # taken with flat so that only they are copied if data isn't
+    # contiguous.
+    n = max(1, options.adaptive_compression_sample_size
+            // max(1, data.dtype.itemsize))
+    if n >= data.size:
+        sample = data.reshape(-1)
+    else:
+        blocks = 4
+        step = data.size // blocks
+        length = max(1, n // blocks)
+        sample = np.concatenate([data.flat[i * step:i * step + length]
+                                 for i in range(blocks)])
+    if convert is not None:
+        sample = convert(sample)
+    # Write the sample with each candidate, getting the size and the
+    # throughput in MB/s. Only writing the data and flushing it (which
+    # is when the filters are run on the chunks) is timed, not making
+    # the Dataset, and the fastest of several repeats is used so that
+    # the overhead and noise don't swamp the time of the filters.
+    results = []
+    with h5py.File('hdf5storage_sample_'
+                   + str(next(_sample_file_counter)), mode='w',
+                   driver='core', backing_store=False) as f:
+        for name in names:
+            algorithm, level, shuffle = _compression_candidates[name]
+            if algorithm is None:
+                kwargs = dict()
+            else:
+                kwargs = {'compression': algorithm,
+                          'compression_opts': level,
+                          'shuffle': shuffle, 'chunks': True}
+            elapsed = None
+            for i in range(_compression_sample_repeats):
+                dset = f.create_dataset(name + ':' + str(i),
+                                        shape=sample.shape,
+                                        dtype=sample.dtype, **kwargs)
+                start = _compression_timer()
+                dset[...] = sample
+                f.flush()
+                t = _compression_timer() - start
+                if elapsed is None or t < elapsed:
+                    elapsed = t
+            size = dset.id.get_storage_size()
+            throughput = sample.nbytes / max(elapsed, 1e-9) / 1e6
+            results.append((size, -throughput, name))
+    # Choose the smallest (the fastest breaking ties), only considering
+    # the fast enough ones for the throughput objective (or the fastest
+    # if none are fast enough).
+    if options.adaptive_compression_objective == 'throughput':
+        fast = [x for x in results
+                if -x[1] >= options.adaptive_compression_min_throughput]
+        if len(fast) == 0:
+            return min(results, key=lambda x: x[1])[2]
+        results = fast
+    return min(results)[2]
+
+
 def write_data(f, grp, name, data, type_string, options):
     """ Writes a piece of data into an open HDF5 file.
 
@@ -151,6 +732,9 @@ def write_data(f, grp, name, data, type_string, options):
     # the containing group.
 
     if m is not None and has_modules:
+        if hdf5storage.instrumentation._subscribers:
+            return hdf5storage.instrumentation.instrumented_write(
+                m, f, grp, name, data, type_string, options)
         return m.write(f, grp, name, data, type_string, options)
     else:
         raise NotImplementedError('Can''t write data type: ' + str(tp))
@@ -218,6 +802,13 @@ def read_data(f, grp, name, options, dsetgrp=None):
     matlab_class = convert_attribute_to_string(
         attributes['MATLAB_class'])
 
+    # MATLAB sparse matrices are Groups with the MATLAB class of their
+    # elements, so they are recognized by their MATLAB_sparse Attribute
+    # instead.
+    if type_string is None and 'MATLAB_sparse' in attributes \
+            and isinstance(dsetgrp, h5py.Group):
+        type_string = 'scipy.sparse.csc_matrix'
+
     # If the type_string is present, get the marshaller for it. If it is
     # not, use the one for the matlab class if it is given. Otherwise,
     # use the fallback (NumpyScalarArrayMarshaller for both Datasets and
@@ -248,6 +839,9 @@ def read_data(f, grp, name, options, dsetgrp=None):
     # return an error.
 
     if m is not None:
+        if hdf5storage.instrumentation._subscribers:
+            return hdf5storage.instrumentation.instrumented_read(
+                m, f, dsetgrp, attributes, options, not has_modules)
         if has_modules:
             return m.read(f, dsetgrp, attributes, options)
         else:
@@ -257,6 +851,229 @@ def read_data(f, grp, name, options, dsetgrp=None):
                                                    + dsetgrp.name)
 
 
+def read_data_to_memmap(f, grp, name, filename, options):
+    """ Reads an array into a new ``numpy.memmap`` in blocks.
+
+    Low level function to read an array of bools, numbers, or times of
+    the specified name from the specified Group into a new
+    ``numpy.memmap`` backed by the file `filename` without having the
+    whole array in memory at once. See
+    ``NumpyScalarArrayMarshaller.read_to_memmap`` for how it is done.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    f : h5py.File
+        The open HDF5 file.
+    grp : h5py.Group or h5py.File
+        The Group to read the data from.
+    name : str
+        The name of the data to read.
+    filename : str or pathlib.Path
+        The file to make the ``numpy.memmap`` with, which is overwritten
+        if it exists.
+    options : hdf5storage.core.Options
+        The options to use when reading.
+
+    Returns
+    -------
+    data : numpy.memmap
+        The data named `name` in Group `grp`.
+
+    Raises
+    ------
+    KeyError
+        If the data cannot be found.
+    CantReadError
+        If the data would not be read as a ``numpy.ndarray`` of bools,
+        numbers, or times.
+
+    See Also
+    --------
+    read_data
+    hdf5storage.File.read_to_memmap : Higher level version.
+    hdf5storage.Marshallers.NumpyScalarArrayMarshaller.read_to_memmap
+
+    """
+    # If name isn't found, return error.
+    try:
+        dsetgrp = grp[name]
+    except:
+        raise KeyError('Could not find '
+                       + posixpath.join(grp.name, name))
+
+    # Get all attributes with values.
+    defaultfactory = type(None)
+    attributes = collections.defaultdict(defaultfactory,
+                                         dsetgrp.attrs.items())
+
+    # Only what would be read by the marshaller for numpy.ndarray can
+    # be read this way.
+    type_string = convert_attribute_to_string(attributes['Python.Type'])
+    if type_string not in (None, 'numpy.ndarray', 'numpy.memmap'):
+        raise hdf5storage.exceptions.CantReadError(
+            'Can only read numpy.ndarray to a numpy.memmap, not '
+            + type_string)
+    m, has_modules = options.marshaller_collection.get_marshaller_for_type(
+        np.ndarray)
+    return m.read_to_memmap(f, dsetgrp, attributes, options, filename)
+
+
+def get_vlen_dtype(data, options):
+    """ Gets the HDF5 variable length dtype to write an object array as.
+
+    Checks whether the elements of an object array can all be written
+    together as a single Dataset of an HDF5 variable length type, and if
+    so, returns the dtype to view the array as for h5py to write it that
+    way. This is the case if ``options.ragged_arrays_as_vlen`` is set
+    and the elements are all 1D ``numpy.ndarray`` (not subclasses) of
+    the same native integer or floating point dtype, or if
+    ``options.str_collections_as_vlen`` is set and the elements are all
+    ``str`` (not subclasses) without null characters that can be
+    encoded to UTF-8.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    data : numpy.ndarray of objects
+        Numpy object array to check.
+    options : hdf5storage.core.Options
+        hdf5storage options object.
+
+    Returns
+    -------
+    dtype : numpy.dtype or None
+        The variable length dtype (made by ``h5py.vlen_dtype``), or
+        ``None`` if `data` can't be written as a variable length type.
+
+    See Also
+    --------
+    write_object_array
+    hdf5storage.Options.ragged_arrays_as_vlen
+    hdf5storage.Options.str_collections_as_vlen
+    h5py.vlen_dtype
+    h5py.string_dtype
+
+    """
+    if data.size == 0:
+        return None
+    first = data.flat[0]
+    if type(first) == str and options.str_collections_as_vlen:
+        # HDF5 variable length strings are null terminated and h5py
+        # encodes them to UTF-8, which is checked all at once by
+        # joining them.
+        strs = data.ravel().tolist()
+        if set(map(type, strs)) != {str}:
+            return None
+        try:
+            joined = ''.join(strs)
+            joined.encode('UTF-8')
+        except UnicodeEncodeError:
+            return None
+        if '\x00' in joined:
+            return None
+        return h5py.string_dtype('utf-8')
+    if type(first) != np.ndarray or first.dtype.kind not in 'iuf' \
+            or not first.dtype.isnative \
+            or not options.ragged_arrays_as_vlen:
+        return None
+    dt = first.dtype
+    for x in data.flat:
+        if type(x) != np.ndarray or x.ndim != 1 or x.dtype != dt:
+            return None
+    return h5py.vlen_dtype(dt)
+
+
+def encode_compact_object_array(data, options):
+    """ Encodes an object array as a structured array if possible.
+
+    Checks whether the elements of an object array can all be written
+    together columnar as a single Dataset of an HDF5 compound type, and
+    if so, encodes them. This is the case if
+    ``options.fixed_field_objects_as_compound`` and
+    ``options.store_python_metadata`` are set (the type is needed to
+    decode them), the elements are all the same type, and the marshaller
+    for that type can encode them with its ``encode_compact`` method.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    data : numpy.ndarray of objects
+        Numpy object array to encode.
+    options : hdf5storage.core.Options
+        hdf5storage options object.
+
+    Returns
+    -------
+    encoded : numpy.ndarray or None
+        The structured array of the same shape to write, or ``None`` if
+        `data` can't be encoded.
+    type_string : str or None
+        The type string of the elements, or ``None`` if `data` can't be
+        encoded.
+
+    See Also
+    --------
+    decode_compact_array
+    hdf5storage.Options.fixed_field_objects_as_compound
+    hdf5storage.Marshallers.TypeMarshaller.encode_compact
+
+    """
+    if data.size == 0 or not options.fixed_field_objects_as_compound \
+            or not options.store_python_metadata:
+        return None, None
+    first = data.flat[0]
+    tp = type(first)
+    for x in data.flat:
+        if type(x) is not tp:
+            return None, None
+    m, has_modules = options.marshaller_collection.get_marshaller_for_type(
+        tp)
+    if m is None:
+        return None, None
+    encoded = m.encode_compact(data, options)
+    if encoded is None:
+        return None, None
+    return encoded, m.get_type_string(first, None)
+
+
+def decode_compact_array(data, type_string, options):
+    """ Decodes a structured array made by encode_compact_object_array.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        The structured array that was read.
+    type_string : str
+        The type string of the elements.
+    options : hdf5storage.core.Options
+        hdf5storage options object.
+
+    Returns
+    -------
+    decoded : numpy.ndarray
+        The object array of the same shape, or `data` unchanged if the
+        marshaller for `type_string` or the modules it requires can't be
+        found.
+
+    See Also
+    --------
+    encode_compact_object_array
+    hdf5storage.Marshallers.TypeMarshaller.decode_compact
+
+    """
+    m, has_modules = \
+        options.marshaller_collection.get_marshaller_for_type_string(
+            type_string)
+    if m is None or not has_modules:
+        return data
+    return m.decode_compact(data, type_string, options)
+
 def write_object_array(f, data, options):
     """ Writes an array of objects recursively.
 
@@ -293,6 +1110,15 @@ def write_object_array(f, data, options):
     h5py.Reference
 
     """
+    with hdf5storage.instrumentation.span(
+            'write_object_array', options.group_for_references,
+            bytes_in=data.nbytes):
+        return _write_object_array(f, data, options)
+
+
+def _write_object_array(f, data, options):
+    # Does the work of write_object_array.
+
     # We need to make sure that the group to hold references is present,
     # and create it if it isn't.
     grp2 = f.require_group(options.group_for_references)
@@ -396,16 +1222,508 @@ def read_object_array(f, data, options):
     """
     # Go through all the elements of data and read them using their
     # references, and the putting the output in new object array.
-    data_derefed = np.zeros(shape=data.shape, dtype='object')
-    data_derefed_flat = data_derefed.reshape(-1)
-    data_flat = data[...].ravel()
-    for index, x in enumerate(data_flat):
-        data_derefed_flat[index] = read_data(f, None, None,
-                                             options,
-                                             dsetgrp=f[x])
+    with hdf5storage.instrumentation.span('read_object_array'):
+        data_derefed = np.zeros(shape=data.shape, dtype='object')
+        data_derefed_flat = data_derefed.reshape(-1)
+        data_flat = data[...].ravel()
+        for index, x in enumerate(data_flat):
+            data_derefed_flat[index] = read_data(f, None, None,
+                                                 options,
+                                                 dsetgrp=f[x])
     return data_derefed
 
 
+def get_referenced_objects(f, dset):
+    """ Gets the objects an HDF5 Reference Dataset points to.
+
+    Gets the Datasets and Groups pointed to by the HDF5 Object
+    References in a Dataset, whether the Dataset is an array of
+    References or has fields that are, and in its Attributes (such as
+    the one pointing to the hashes of the chunks of a delta
+    checkpoint). Null References are skipped.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    f : h5py.File
+        The HDF5 file handle that is open.
+    dset : h5py.Dataset
+        The Dataset to get the References of.
+
+    Returns
+    -------
+    objs : list of h5py.Dataset and h5py.Group
+        The objects pointed to in the order they are found. An object
+        pointed to more than once appears more than once.
+
+    See Also
+    --------
+    read_object_array
+    h5py.Reference
+
+    """
+    fields = _reference_fields(dset.dtype)
+    refs = [dset.attrs[k] for k in _reference_attributes(dset)]
+    if len(fields) != 0:
+        data = dset[...]
+        refs.extend([data if k is None else data[k] for k in fields])
+    objs = []
+    for arr in refs:
+        for ref in np.asarray(arr).flat:
+            if ref:
+                objs.append(f[ref])
+    return objs
+
+
+def _reference_attributes(obj):
+    # Gets the names of the Attributes of an object that are HDF5 Object
+    # References (or arrays of them).
+    return [k for k in obj.attrs if h5py.check_dtype(
+        ref=obj.attrs.get_id(k).dtype) is h5py.Reference]
+
+
+def _reference_fields(dt):
+    # Gets the fields of a dtype that are HDF5 Object References, which
+    # is [None] if the dtype itself is one.
+    if dt.names is None:
+        if h5py.check_dtype(ref=dt) is h5py.Reference:
+            return [None]
+        return []
+    return [k for k in dt.names
+            if h5py.check_dtype(ref=dt.fields[k][0]) is h5py.Reference]
+
+
+def get_storage_info(f, obj, visited=None):
+    """ Gets how much storage an object and everything it holds uses.
+
+    Walks through `obj`, and if it is a Group everything in it, and
+    follows any HDF5 References to the objects they point to (such as
+    those in ``Options.group_for_references``), adding up the storage
+    used by everything found. An object is only counted the first time
+    it is found.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    f : h5py.File
+        The HDF5 file handle that is open.
+    obj : h5py.Dataset or h5py.Group
+        The object to get the storage of.
+    visited : set or None, optional
+        The addresses in the file of the objects already counted, which
+        will not be counted again. Addresses of the objects found are
+        added to it. ``None`` (default) starts with an empty ``set``.
+
+    Returns
+    -------
+    info : dict
+        The storage information, with the following keys.
+
+        ======================  =======================================
+        key                     value
+        ======================  =======================================
+        ``'logical_bytes'``     Number of bytes of data in all the
+                                Datasets (not counting those holding
+                                References). Elements of variable
+                                length types count as the size of
+                                their fixed length handle
+                                (``dtype.itemsize``), not the length
+                                of their data.
+        ``'storage_bytes'``     Number of bytes allocated in the file
+                                for the data of all the Datasets.
+        ``'compression_ratio'`` ``'logical_bytes'`` divided by
+                                ``'storage_bytes'``, or ``None`` if
+                                the latter is zero.
+        ``'objects'``           Number of Datasets and Groups.
+        ``'referenced_objects'``  Number of Datasets and Groups that
+                                  were found through References.
+        ``'header_bytes'``      Number of bytes of all the object
+                                headers, which includes the
+                                Attributes stored in them.
+        ``'attribute_bytes'``   Number of bytes of the values of all
+                                the Attributes.
+        ``'compression_choices'``  ``dict`` of the number of Datasets
+                                   (the values) that adaptive
+                                   compression chose each setting
+                                   (the keys) for.
+        ======================  =======================================
+
+    See Also
+    --------
+    get_referenced_objects
+    hdf5storage.File.storage_report
+
+    """
+    if visited is None:
+        visited = set()
+    info = {'logical_bytes': 0, 'storage_bytes': 0, 'objects': 0,
+            'referenced_objects': 0, 'header_bytes': 0,
+            'attribute_bytes': 0, 'compression_choices': dict()}
+    # Walk through everything with a stack of the objects to do and
+    # whether each was found through a Reference or not.
+    todo = [(obj, False)]
+    while len(todo) > 0:
+        x, referenced = todo.pop()
+        oinfo = h5py.h5o.get_info(x.id)
+        if oinfo.addr in visited:
+            continue
+        visited.add(oinfo.addr)
+        info['objects'] += 1
+        if referenced:
+            info['referenced_objects'] += 1
+        info['header_bytes'] += oinfo.hdr.space.total
+        for k in x.attrs:
+            info['attribute_bytes'] += _attribute_storage_size(
+                x.attrs.get_id(k))
+        if isinstance(x, h5py.Dataset):
+            info['storage_bytes'] += x.id.get_storage_size()
+            choice = get_attribute_string(x, 'Python.Compression')
+            if choice is not None:
+                info['compression_choices'][choice] = \
+                    info['compression_choices'].get(choice, 0) + 1
+            if len(_reference_fields(x.dtype)) == 0:
+                info['logical_bytes'] += x.size * x.dtype.itemsize
+            todo.extend([(y, True)
+                         for y in get_referenced_objects(f, x)])
+        elif isinstance(x, h5py.Group):
+            todo.extend([(y, referenced) for y in x.values()])
+    if info['storage_bytes'] == 0:
+        info['compression_ratio'] = None
+    else:
+        info['compression_ratio'] = \
+            info['logical_bytes'] / info['storage_bytes']
+    return info
+
+
+def _attribute_storage_size(aid):
+    # Gets the storage size of an Attribute. HDF5 uses a return value of
+    # zero for errors, so h5py raises an error for Attributes that take
+    # no space (such as the empty Python.Shape of scalars).
+    try:
+        return aid.get_storage_size()
+    except RuntimeError:
+        return 0
+
+
+def find_unreachable_references(f, refs_name):
+    """ Finds what in the Group for references nothing points to.
+
+    Marks everything reachable from the root of the file, going into
+    every Group (other than the Group for references) and following
+    every HDF5 Reference, and then finds the objects in the Group for
+    references that were not reached. These are left over from data
+    that was deleted or overwritten. The canonical empty ``'a'`` is
+    never included.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    f : h5py.File
+        The HDF5 file handle that is open.
+    refs_name : str
+        The path of the Group for references.
+
+    Returns
+    -------
+    unreachable : list of str
+        The names in the Group for references of the objects that are
+        not reachable.
+    total : int
+        The number of objects in the Group for references, not
+        counting the canonical empty ``'a'``.
+
+    See Also
+    --------
+    get_referenced_objects
+    hdf5storage.File.collect_garbage
+
+    """
+    refs_name = posixpath.join('/', refs_name)
+    if refs_name not in f or not isinstance(f[refs_name], h5py.Group):
+        return [], 0
+    # Mark with a stack of the objects to do.
+    visited = set()
+    todo = [f]
+    while len(todo) > 0:
+        x = todo.pop()
+        addr = h5py.h5o.get_info(x.id).addr
+        if addr in visited:
+            continue
+        visited.add(addr)
+        if isinstance(x, h5py.Dataset):
+            todo.extend(get_referenced_objects(f, x))
+        elif isinstance(x, h5py.Group):
+            todo.extend([v for k, v in x.items()
+                         if posixpath.join(x.name, k) != refs_name])
+    names = [k for k in f[refs_name] if k != 'a']
+    unreachable = [k for k in names if h5py.h5o.get_info(
+        f[refs_name][k].id).addr not in visited]
+    return unreachable, len(names)
+
+
+def copy_attributes(src, dst):
+    """ Copies all the Attributes of one object to another.
+
+    The Attributes are copied with their exact HDF5 types and shapes
+    (fixed and variable length strings stay what they are, etc.),
+    replacing any of the same name already on `dst`.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    src : h5py.Dataset or h5py.Group
+        The object to copy the Attributes of.
+    dst : h5py.Dataset or h5py.Group
+        The object to copy them to.
+
+    See Also
+    --------
+    ObjectCopier
+
+    """
+    for name in src.attrs:
+        aid = src.attrs.get_id(name)
+        value = np.empty(aid.shape, dtype=aid.dtype)
+        aid.read(value)
+        bname = name.encode('utf-8')
+        if h5py.h5a.exists(dst.id, bname):
+            h5py.h5a.delete(dst.id, bname)
+        new_aid = h5py.h5a.create(dst.id, bname, aid.get_type(),
+                                  aid.get_space())
+        new_aid.write(value)
+
+
+class ObjectCopier(object):
+    """ Copies HDF5 objects while keeping their References right.
+
+    Copies Groups (with everything in them) and Datasets from one HDF5
+    file to another (or within a file), along with their Attributes and
+    filters. Datasets are copied with HDF5's object copy, so their data
+    is not decoded and encoded again unless `options` is given to
+    re-apply the compression settings. Datasets holding HDF5 Object
+    References (the arrays written by ``write_object_array``, which
+    point into ``Options.group_for_references``) and Attributes holding
+    them have every Reference rewritten to point to the copy of what it
+    pointed to. Objects that are pointed to but not copied otherwise
+    are copied into the destination's Group for references, keeping
+    their names when they are in the source's Group for references and
+    the name is free (getting new random names otherwise). The canonical empty ``'a'`` in
+    the Group for references is never duplicated. Anything reached more
+    than once (hard links, or pointed to by several References) is only
+    copied once, so the copies keep the same sharing. Soft and external
+    links are copied as links. Region References are not supported.
+
+    References are only rewritten by ``finish``, which must be called
+    after all the copying is done so that References to objects that
+    are copied later get pointed at those copies instead of new ones.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    src_file : h5py.File
+        The file to copy from.
+    dst_file : h5py.File
+        The file to copy to, which can be `src_file`.
+    src_refs : str
+        The path of the Group for references in `src_file`.
+    dst_refs : str
+        The path of the Group for references in `dst_file`.
+    options : hdf5storage.core.Options or None, optional
+        If not ``None`` (the default), the Datasets that don't hold
+        References are written again with the filters
+        ``get_dataset_filters`` gives for these options instead of
+        being copied as they are.
+
+    See Also
+    --------
+    copy_attributes
+    get_referenced_objects
+    hdf5storage.repack
+
+    """
+    def __init__(self, src_file, dst_file, src_refs, dst_refs,
+                 options=None):
+        self._src_file = src_file
+        self._dst_file = dst_file
+        self._src_refs = posixpath.join('/', src_refs)
+        self._dst_refs = posixpath.join('/', dst_refs)
+        self._options = options
+        # The copies made so far by the address of what they are a copy
+        # of, and the (source, copy) pairs of Datasets and of objects
+        # with Attributes whose References still need rewriting.
+        self._copies = dict()
+        self._pending = []
+        self._pending_attributes = []
+
+    def copy(self, src, dst_grp, name):
+        """ Copies an object into a Group.
+
+        Parameters
+        ----------
+        src : h5py.Dataset or h5py.Group
+            The object to copy.
+        dst_grp : h5py.Group
+            The Group to put the copy in.
+        name : str
+            The name of the copy in `dst_grp`.
+
+        Returns
+        -------
+        obj : h5py.Dataset or h5py.Group
+            The copy. If `src` was already copied, it is the earlier
+            copy, which is hard linked to `name` in `dst_grp`.
+
+        """
+        addr = h5py.h5o.get_info(src.id).addr
+        if addr in self._copies:
+            dst_grp[name] = self._copies[addr]
+            return self._copies[addr]
+        if isinstance(src, h5py.Group):
+            dst = dst_grp.create_group(name)
+            self._copies[addr] = dst
+            copy_attributes(src, dst)
+            self.copy_children(src, dst)
+        else:
+            dst = self._copy_dataset(src, dst_grp, name)
+            self._copies[addr] = dst
+        if len(_reference_attributes(src)) != 0:
+            self._pending_attributes.append((src, dst))
+        # hdf5storage stores the path of the parent Group in H5PATH when
+        # doing MATLAB compatibility, which must follow the copy. It is
+        # deleted first since modifying the fixed length string in place
+        # would cut off a longer path.
+        if 'H5PATH' in dst.attrs:
+            del_attribute(dst, 'H5PATH')
+            set_attribute_string(dst, 'H5PATH', dst_grp.name)
+        return dst
+
+    def copy_children(self, src_grp, dst_grp):
+        """ Copies everything in a Group into another Group.
+
+        The source's Group for references is skipped, since only what
+        is pointed to in it gets copied.
+
+        Parameters
+        ----------
+        src_grp : h5py.Group
+            The Group to copy the contents of.
+        dst_grp : h5py.Group
+            The Group to copy them into.
+
+        """
+        for k in src_grp:
+            if posixpath.join(src_grp.name, k) == self._src_refs:
+                continue
+            link = src_grp.get(k, getlink=True)
+            if isinstance(link, (h5py.SoftLink, h5py.ExternalLink)):
+                dst_grp[k] = link
+            else:
+                self.copy(src_grp[k], dst_grp, k)
+
+    def require_refs_group(self):
+        """ Gets the destination's Group for references.
+
+        Makes it if it doesn't exist yet, copying the Attributes of the
+        source's Group for references and its canonical empty ``'a'``.
+
+        Returns
+        -------
+        grp : h5py.Group
+            The destination's Group for references.
+
+        """
+        if self._dst_refs in self._dst_file:
+            return self._dst_file[self._dst_refs]
+        grp = self._dst_file.create_group(self._dst_refs)
+        if self._src_refs in self._src_file:
+            src_grp = self._src_file[self._src_refs]
+            copy_attributes(src_grp, grp)
+            if 'a' in src_grp:
+                self.copy(src_grp['a'], grp, 'a')
+        return grp
+
+    def finish(self):
+        """ Rewrites the References in the copied Datasets.
+
+        Also rewrites the References in the Attributes of the copied
+        objects. Copies everything pointed to that hasn't been copied
+        yet (which can point to more things) into the destination's
+        Group for references.
+
+        """
+        ref_dtype = h5py.special_dtype(ref=h5py.Reference)
+        while len(self._pending) > 0 \
+                or len(self._pending_attributes) > 0:
+            if len(self._pending) == 0:
+                src, dst = self._pending_attributes.pop()
+                for k in _reference_attributes(src):
+                    refs = np.array(src.attrs[k], dtype=ref_dtype)
+                    for index in np.ndindex(refs.shape):
+                        refs[index] = self._copy_reference(refs[index])
+                    del_attribute(dst, k)
+                    dst.attrs.create(k, refs, dtype=ref_dtype)
+                continue
+            src, dst = self._pending.pop()
+            data = src[...]
+            if not isinstance(data, np.ndarray):
+                data = np.asarray(data)
+            for k in _reference_fields(data.dtype):
+                refs = data if k is None else data[k]
+                for index in np.ndindex(refs.shape):
+                    refs[index] = self._copy_reference(refs[index])
+                if k is not None:
+                    data[k] = refs
+            dst[...] = data
+
+    def _copy_reference(self, ref):
+        # Gets the Reference to the copy of what ref points to, copying
+        # it first if need be. Null and dangling References become null
+        # References.
+        if not ref:
+            return h5py.Reference()
+        try:
+            obj = self._src_file[ref]
+        except Exception:
+            return h5py.Reference()
+        addr = h5py.h5o.get_info(obj.id).addr
+        if addr in self._copies:
+            return self._copies[addr].ref
+        grp = self.require_refs_group()
+        parent, name = posixpath.split(obj.name or '')
+        if parent != self._src_refs or name in grp:
+            name = next_unused_name_in_group(grp, 16)
+        return self.copy(obj, grp, name).ref
+
+    def _copy_dataset(self, src, dst_grp, name):
+        # Datasets holding References and those whose compression isn't
+        # being changed are copied with HDF5's object copy, the former
+        # getting their References rewritten later. The rest are written
+        # again with the new filters.
+        if len(_reference_fields(src.dtype)) != 0 \
+                or self._options is None:
+            dst_grp.copy(src, dst_grp, name)
+            dst = dst_grp[name]
+            if len(_reference_fields(src.dtype)) != 0:
+                self._pending.append((src, dst))
+            return dst
+        data = src[...]
+        if not isinstance(data, np.ndarray):
+            data = np.asarray(data)
+        filters, choice = get_dataset_filters(data, self._options)
+        dst = create_dataset(dst_grp, name, data, filters)
+        copy_attributes(src, dst)
+        if choice is not None and self._options.store_python_metadata:
+            set_attribute_string(dst, 'Python.Compression', choice)
+        else:
+            del_attribute(dst, 'Python.Compression')
+        return dst
+
+
 def next_unused_name_in_group(grp, length):
     """ Gives a name that isn't used in a Group.
 
@@ -450,6 +1768,17 @@ def next_unused_name_in_group(grp, length):
     return name
 
 
+def _code_points(data):
+    # Gets the UTF-32 code points of a non-empty numpy.unicode_ array as
+    # a 2D uint32 array with a row for each string, along with the
+    # length of the longest string (ignoring trailing nulls).
+    n = data.dtype.itemsize // 4
+    codes = np.ascontiguousarray(data, dtype='U' + str(n)).view(
+        'uint32').reshape(data.size, n)
+    used = np.flatnonzero((codes != 0).any(axis=0))
+    return codes, int(used[-1]) + 1 if used.size != 0 else 0
+
+
 def convert_numpy_str_to_uint16(data):
     """ Converts a ``numpy.unicode_`` to UTF-16 in numpy.uint16 form.
 
@@ -493,12 +1822,27 @@ def convert_numpy_str_to_uint16(data):
     else:
         codec = 'UTF-16BE'
 
+    # When there are no characters outside the Basic Multilingual Plane
+    # and no lone surrogates, each UTF-32 character is its own single
+    # UTF-16 word and the whole array can be converted at once by
+    # casting the code points. The strings are cut down to the length
+    # of the longest one (ignoring trailing nulls) to match what
+    # numpy.char.encode gives.
+    data = np.atleast_1d(data)
+    codes, length = _code_points(data)
+    top = int(codes.max())
+    if top < 0xD800 or (top < 0x10000 and not np.any(
+            (codes >= 0xD800) & (codes < 0xE000))):
+        shape = list(data.shape)
+        shape[-1] *= length
+        return codes[:, :length].astype('uint16').reshape(shape)
+
     # numpy.char.encode can do the conversion element wise. Then, we
     # just have convert to uin16 with the appropriate dimensions. The
     # dimensions are gotten from the shape of the converted data with
     # the number of column increased by the number of words (pair of
     # bytes) in the strings.
-    cdata = np.char.encode(np.atleast_1d(data), codec)
+    cdata = np.char.encode(data, codec)
     shape = list(cdata.shape)
     shape[-1] *= (cdata.dtype.itemsize // 2)
     return np.ndarray(shape=shape, dtype='uint16',
@@ -546,6 +1890,52 @@ def convert_numpy_str_to_uint32(data):
         return data.ravel().view(np.uint32).reshape(tuple(shape))
 
 
+def convert_numpy_str_to_utf8(data):
+    r""" Converts ``numpy.unicode_`` to fixed length UTF-8 strings.
+
+    Convert a ``numpy.unicode_`` or an array of them (they are UTF-32
+    strings) to UTF-8 encoded ``numpy.bytes_`` of the same shape, whose
+    length is that of the longest encoded string. The dtype is marked
+    (with ``h5py.string_dtype``) so that h5py writes them as HDF5
+    strings with the UTF-8 character set. A ``numpy.unicode_`` scalar is
+    returned as a zero dimensional array so that the marking is kept.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    data : numpy.unicode\_ or numpy.ndarray of numpy.unicode\_
+        The string or array of them to convert. It must not be empty.
+
+    Returns
+    -------
+    array : numpy.ndarray of numpy.bytes\_
+        The result of the conversion.
+
+    See Also
+    --------
+    convert_numpy_str_to_uint16
+    convert_to_numpy_str
+    h5py.string_dtype
+
+    """
+    # When all the characters are ASCII, the code points are the UTF-8
+    # bytes and the whole array can be converted at once by
+    # casting. Otherwise, numpy.char.encode does it element by element.
+    shape = np.shape(data)
+    data = np.atleast_1d(data)
+    codes, length = _code_points(data)
+    length = max(1, length)
+    if codes.max() < 0x80:
+        cdata = codes[:, :length].astype('uint8').view(
+            'S' + str(length))
+    else:
+        cdata = np.char.encode(data, 'UTF-8')
+    return cdata.view(h5py.string_dtype('utf-8',
+                                        cdata.dtype.itemsize)).reshape(
+                                            shape)
+
+
 def convert_to_str(data):
     """ Decodes data to the ``str`` type.
 
@@ -601,6 +1991,33 @@ def convert_to_str(data):
         return data
 
 
+def _combine_utf16_surrogates(data, length):
+    # Converts UTF-16 in native uint16 form, with the strings being
+    # length words long along the rows, to UTF-32 code points (uint32)
+    # of the same shape by combining each surrogate pair into one code
+    # point, shifting the rest of the string down over the low
+    # surrogate, and padding the end of the string with nulls. None is
+    # returned if there are lone surrogates, which can't be decoded.
+    units = data.reshape(-1, length).astype('uint32')
+    high = (units >= 0xD800) & (units < 0xDC00)
+    low = (units >= 0xDC00) & (units < 0xE000)
+    if high[:, -1].any() or low[:, 0].any() \
+            or not np.array_equal(high[:, :-1], low[:, 1:]):
+        return None
+    units[:, :-1] = np.where(
+        high[:, :-1],
+        0x10000 + ((units[:, :-1] - 0xD800) << 10)
+        + (units[:, 1:] - 0xDC00),
+        units[:, :-1])
+    # A stable sort of the low surrogate flags moves the characters to
+    # keep to the front in order, and the sorted flags are where the
+    # padding goes.
+    units = np.take_along_axis(
+        units, np.argsort(low, axis=1, kind='stable'), axis=1)
+    units[np.sort(low, axis=1)] = 0
+    return units.reshape(data.shape)
+
+
 def convert_to_numpy_str(data, length=None):
     """ Decodes data to Numpy unicode string (``numpy.unicode_``).
 
@@ -622,7 +2039,9 @@ def convert_to_numpy_str(data, length=None):
     dimension. For higher dimensional arrays, it is done along each row
     (across columns). So, for a 3x5x10 input array of uints and a
     `length` of 5, the output array would be a 3x5x2 of 5 element
-    strings.
+    strings. For an array of ``numpy.bytes_``, `length` is instead the
+    length of the strings in the output array (its dtype is
+    ``'U<length>'``).
 
     Parameters
     ----------
@@ -633,6 +2052,8 @@ def convert_to_numpy_str(data, length=None):
         integer `data`) to compose each string in the output array from.
         ``None`` indicates the full amount for a 1d array or the number
         of columns (full length of row) for a higher dimension array.
+        For an array of ``numpy.bytes_``, the length of the output
+        strings, with ``None`` meaning the length of the longest one.
 
     Returns
     -------
@@ -672,7 +2093,14 @@ def convert_to_numpy_str(data, length=None):
         return np.ndarray(shape=tuple(), dtype='U1',
                           buffer=data)[()]
     elif isinstance(data, np.ndarray) and data.dtype.char == 'S':
-        return np.char.encode(data, 'UTF-32')
+        # Decode them as UTF-8 and make them the given length, if any.
+        if data.size == 0:
+            new_data = data.astype('U')
+        else:
+            new_data = np.char.decode(data, 'UTF-8')
+        if length is not None:
+            new_data = new_data.astype('U' + str(max(1, length)))
+        return new_data
     elif isinstance(data, np.ndarray) \
             and data.dtype.name in ('uint8', 'uint16', 'uint32'):
         # It is an ndarray of some uint type. How it is converted
@@ -686,53 +2114,58 @@ def convert_to_numpy_str(data, length=None):
         # As there are more than one element, it gets a bit more
         # complicated. We need to take the subarrays of the specified
         # length along columns (1D arrays will be treated as row arrays
-        # here), each of those converted to an str_ scalar (normal
-        # string) and stuffed into a new array.
-        #
-        # If the length was not given, it needs to be set to full. Then
-        # the shape of the new array needs to be calculated (divide the
-        # appropriate dimension, which depends on the number of
-        # dimentions).
-        if len(shape) == 1:
-            if length is None:
-                length = shape[0]
-            new_shape = (shape[0]//length,)
-        else:
-            if length is None:
-                length = shape[-1]
-            new_shape = copy.deepcopy(shape)
-            new_shape[-1] //= length
-
-        # numpy.char.decode will be used to decode. It needs the
-        # encoding (UTF-8/16/32) which is gotten from the dtype. But it
-        # also needs the data to be in big endian format, so it must be
-        # byteswapped if it isn't. Without the swapping, an error occurs
-        # since trailing nulls are dropped in numpy bytes_ arrays. The
-        # dtype for each string element is just 'SX' where X is the
-        # number of bytes.
-        if data.dtype.name == 'uint8':
-            encoding = 'UTF-8'
-            swapbytes = False
-            dt = 'S' + str(length)
-        else:
-            if data.dtype.name == 'uint16':
-                encoding = 'UTF-16BE'
-                dt = 'S' + str(2 * length)
+        # here) and turn each into a string. If the length was not
+        # given, it is the full length of the rows.
+        if length is None:
+            length = shape[-1]
+
+        # The characters need to be contiguous and in native byte order
+        # so that they can be viewed as strings, which doesn't make a
+        # copy if they already are (the common case).
+        data = np.ascontiguousarray(
+            data, dtype=data.dtype.newbyteorder('='))
+
+        # When every element is a whole character on its own (ASCII for
+        # UTF-8 and no surrogates for UTF-16 and UTF-32), the elements
+        # are the UTF-32 code points themselves, so all the strings can
+        # be made at once by viewing the code points (as uint32) as
+        # strings of the given length instead of decoding them one by
+        # one.
+        if data.size != 0 and length != 0:
+            top = int(data.max())
+            if data.dtype.name == 'uint8':
+                simple = top < 0x80
             else:
-                encoding = 'UTF-32BE'
-                dt = 'S' + str(4 * length)
-            if (data.dtype.byteorder == '<'
-                or (sys.byteorder == 'little'
-                    and data.dtype.byteorder == '=')):
-                swapbytes = True
-            else:
-                swapbytes = False
-        # Copy is needed to prevent errors.
-        if swapbytes:
-            return np.char.decode(data.copy().byteswap().view(dt),
-                                  encoding)
+                simple = top < 0xD800 or (top <= 0x10FFFF and not np.any(
+                    (data >= 0xD800) & (data < 0xE000)))
+            if simple:
+                if data.dtype.name != 'uint32':
+                    data = data.astype('uint32')
+                return data.view('U' + str(length))
+            # UTF-16 with surrogate pairs can still be done all at once
+            # by combining the pairs.
+            if data.dtype.name == 'uint16':
+                codes = _combine_utf16_surrogates(data, length)
+                if codes is not None:
+                    return codes.view('U' + str(length))
+
+        # Otherwise, numpy.char.decode is used to decode the strings
+        # element by element. It needs the encoding (UTF-8/16/32) which
+        # is gotten from the dtype. But it also needs the data to be in
+        # big endian format, so it must be byteswapped if it isn't.
+        # Without the swapping, an error occurs since trailing nulls are
+        # dropped in numpy bytes_ arrays. The dtype for each string
+        # element is just 'SX' where X is the number of bytes.
+        if data.dtype.name == 'uint8':
+            return np.char.decode(data.view('S' + str(length)), 'UTF-8')
+        elif data.dtype.name == 'uint16':
+            return np.char.decode(
+                data.astype('>u2').view('S' + str(2 * length)),
+                'UTF-16BE')
         else:
-            return np.char.decode(data.copy().view(dt), encoding)
+            return np.char.decode(
+                data.astype('>u4').view('S' + str(4 * length)),
+                'UTF-32BE')
     else:
         # Couldn't figure out what it is, so nothing can be done but
         # return it as is.
@@ -807,12 +2240,23 @@ def convert_to_numpy_bytes(data, length=None):
         return np.ndarray(shape=(), dtype='S1',
                           buffer=data)[()]
     elif isinstance(data, np.ndarray) and data.dtype.char == 'U':
-        # We just need to convert it elementwise.
-        new_data = np.zeros(shape=data.shape,
-                            dtype='S' + str(data.dtype.itemsize))
-        for index, x in np.ndenumerate(data):
-            new_data[index] = np.bytes_(x.encode('UTF-8'))
-        return new_data
+        # The strings are made 4 bytes per character wide, which is the
+        # most any character can take in UTF-8. When every character is
+        # ASCII, the code points are the UTF-8 bytes, so all the strings
+        # can be made at once by putting the code points in the first
+        # quarter of each string (the rest stays nulls). Otherwise,
+        # numpy.char.encode has to encode them element by element.
+        n = data.dtype.itemsize // 4
+        dt = 'S' + str(max(1, 4 * n))
+        if data.size != 0 and n != 0:
+            codes = np.ascontiguousarray(data, dtype='U' + str(n)).view(
+                'uint32').reshape(data.size, n)
+            if codes.max() < 0x80:
+                new_data = np.zeros(shape=(data.size, 4 * n),
+                                    dtype='uint8')
+                new_data[:, :n] = codes
+                return new_data.view(dt).reshape(data.shape)
+        return np.char.encode(data, 'UTF-8').astype(dt)
     elif isinstance(data, np.ndarray) \
             and data.dtype.name in ('uint8', 'uint16', 'uint32'):
         # It is an ndarray of some uint type. How it is converted
@@ -826,53 +2270,26 @@ def convert_to_numpy_bytes(data, length=None):
         # As there are more than one element, it gets a bit more
         # complicated. We need to take the subarrays of the specified
         # length along columns (1D arrays will be treated as row arrays
-        # here), each of those converted to an str_ scalar (normal
-        # string) and stuffed into a new array.
-        #
-        # If the length was not given, it needs to be set to full. Then
-        # the shape of the new array needs to be calculated (divide the
-        # appropriate dimension, which depends on the number of
-        # dimentions).
-        if len(shape) == 1:
-            if length is None:
-                length2 = shape[0]
-                new_shape = (shape[0],)
-            else:
-                length2 = length
-                new_shape = (shape[0]//length2,)
-        else:
-            if length is None:
-                length2 = shape[-1]
-            else:
-                length2 = length
-            new_shape = copy.deepcopy(shape)
-            new_shape[-1] //= length2
+        # here) and turn each into a string. If the length was not
+        # given, it is the full length of the rows.
+        if length is None:
+            length = shape[-1]
 
-        # If it is uint8, we can just use the object directly as the
-        # buffer for the new data.
+        # If it is uint8, the elements are already the bytes, so we can
+        # just view the data as strings.
         if data.dtype.name == 'uint8':
-            return np.ndarray(shape=new_shape, dtype='S'+str(length2),
-                              buffer=data)
-
-        # The new array can be made as all zeros (nulls) with enough
-        # padding to hold everything (dtype='UL' where 'L' is the
-        # length). It will start out as a 1d array and be reshaped into
-        # the proper shape later (makes indexing easier).
-        new_data = np.zeros(shape=(np.prod(new_shape),),
-                            dtype='S'+str(length2))
-
-        # With data flattened into a 1d array, we just need to take
-        # length sized chunks, convert them (if they are uint8 or 16,
-        # then decode to str first, if they are uint32, put them as an
-        # input buffer for an ndarray of type 'U').
-        data = data.ravel()
-        for i in range(0, new_data.shape[0]):
-            chunk = data[(i*length2):((i+1)*length2)]
-            new_data[i] = np.bytes_(
-                convert_to_str(chunk).encode('UTF-8'))
-
-        # Only thing is left is to reshape it.
-        return new_data.reshape(tuple(new_shape))
+            return np.ascontiguousarray(data).view('S' + str(length))
+
+        # When every character is ASCII, each one is a single byte in
+        # UTF-8 and the strings can be made all at once by casting to
+        # uint8 and viewing them as strings. Otherwise, they have to be
+        # decoded to str_ first and then encoded to UTF-8, which keeps
+        # the same string length as before.
+        if data.size != 0 and length != 0 and data.max() < 0x80:
+            return data.astype('uint8', order='C').view(
+                'S' + str(length))
+        return np.char.encode(convert_to_numpy_str(data, length=length),
+                              'UTF-8').astype('S' + str(max(1, length)))
     else:
         # Couldn't figure out what it is, so nothing can be done but
         # return it as is.
@@ -1010,6 +2427,107 @@ def encode_complex(data, complex_names):
                       (complex_names[1], dtype_name)])
 
 
+
+# The MATLAB datenum of the numpy.datetime64 epoch, 1970-01-01.
+_datenum_of_epoch = 719529.0
+
+
+def convert_datetime64_to_datenum(data):
+    """ Converts datetime64 and timedelta64 data to MATLAB datenums.
+
+    Converts ``numpy.datetime64`` data to MATLAB datenums, which are
+    ``numpy.float64`` days since January 0, year 0000, and
+    ``numpy.timedelta64`` data to ``numpy.float64`` days. ``NaT``
+    becomes ``NaN``. The conversion is vectorized.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    data : numpy.datetime64 or numpy.timedelta64 or numpy.ndarray
+        The data to convert.
+
+    Returns
+    -------
+    datenums : numpy.ndarray of numpy.float64
+        The converted `data`, with the same shape.
+
+    Raises
+    ------
+    TypeError
+        If `data` is ``numpy.timedelta64`` in years or months, which
+        don't have a fixed number of days.
+
+    See Also
+    --------
+    convert_datenum_to_datetime64
+
+    """
+    data = np.asarray(data)
+    unit = np.datetime_data(data.dtype)[0]
+    one_day = np.timedelta64(1, 'D')
+    if data.dtype.kind == 'm':
+        if unit in ('Y', 'M'):
+            raise TypeError('timedelta64 in years or months cannot be '
+                            'converted to days.')
+        return np.asarray(data / one_day, dtype=np.float64)
+    # Years and months have to be made into days first to be able to
+    # subtract the epoch and divide.
+    if unit in ('Y', 'M'):
+        data = data.astype('datetime64[D]')
+    return np.asarray((data - np.datetime64(0, 'D')) / one_day,
+                      dtype=np.float64) + _datenum_of_epoch
+
+
+def convert_datenum_to_datetime64(data, dtype):
+    """ Converts MATLAB datenums to datetime64 or timedelta64 data.
+
+    The inverse of ``convert_datetime64_to_datenum``. Converts MATLAB
+    datenums to ``numpy.datetime64`` or days to ``numpy.timedelta64``
+    of the given dtype, rounding to the nearest multiple of its
+    unit. ``NaN`` becomes ``NaT``. The conversion is vectorized.
+
+    .. versionadded:: 0.2
+
+    Parameters
+    ----------
+    data : numpy.ndarray of numpy.float64
+        The datenums or days to convert.
+    dtype : numpy.dtype or str
+        The ``numpy.datetime64`` or ``numpy.timedelta64`` dtype with a
+        unit to convert to such as ``'datetime64[ns]'``.
+
+    Returns
+    -------
+    converted : numpy.ndarray
+        The converted `data`, with the same shape.
+
+    See Also
+    --------
+    convert_datetime64_to_datenum
+
+    """
+    dtype = np.dtype(dtype)
+    days = np.asarray(data, dtype=np.float64)
+    if dtype.kind == 'M':
+        days = days - _datenum_of_epoch
+    # The rounding is done in the unit of dtype so that values that
+    # were exact multiples of it come back exactly, except for years
+    # and months which are done in days and then converted.
+    unit, count = np.datetime_data(dtype)
+    if unit in ('Y', 'M', 'generic'):
+        step = np.timedelta64(1, 'D')
+    else:
+        step = np.timedelta64(count, unit)
+    is_nan = np.isnan(days)
+    counts = np.round(np.where(is_nan, 0.0, days)
+                      * (np.timedelta64(1, 'D') / step))
+    converted = counts.astype(np.int64) * step
+    if dtype.kind == 'M':
+        converted = converted + np.datetime64(0, 'D')
+    return np.where(is_nan, np.array('NaT', dtype=dtype),
+                    converted.astype(dtype))
+
 def get_attribute(target, name):
     """ Gets an attribute from a Dataset or Group.
 
@@ -1267,6 +2785,12 @@ def set_attributes_all(target, attributes, discard_others=True):
     set_attribute_string_array
 
     """
+    with hdf5storage.instrumentation.span('set_attributes', target):
+        _set_attributes_all(target, attributes, discard_others)
+
+
+def _set_attributes_all(target, attributes, discard_others):
+    # Does the work of set_attributes_all.
     attrs = target.attrs
     existing = dict(attrs.items())
     # Generate special dtype for string arrays.
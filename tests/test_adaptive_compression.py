@@ -0,0 +1,213 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import itertools
+import os
+import tempfile
+import tracemalloc
+
+import numpy as np
+import h5py
+
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+import hdf5storage.utilities
+
+from asserts import assert_equal
+
+
+def write_and_check(data, **keywords):
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          truncate_existing=True, adaptive_compression=True,
+                          compress_size_threshold=0, **keywords)
+        out = hdf5storage.read(path='/a', filename=filename, **keywords)
+        with h5py.File(filename, mode='r') as f:
+            d = f['a']
+            choice = hdf5storage.utilities.convert_attribute_to_string(
+                d.attrs['Python.Compression'])
+            filters = (d.compression, d.compression_opts, d.shuffle)
+        with hdf5storage.File(filename) as f:
+            report = f.storage_report()
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    assert_equal(out, data)
+    assert_equal_nose({choice: 1},
+                      report['variables']['/a']['compression_choices'])
+    return choice, filters
+
+
+def check_choice(data, matlab_compatible, objective):
+    choice, filters = write_and_check(
+        data, matlab_compatible=matlab_compatible,
+        adaptive_compression_objective=objective)
+    algorithm, level, shuffle = \
+        hdf5storage.utilities._compression_candidates[choice]
+    assert_equal_nose((algorithm, level, shuffle), filters)
+    if matlab_compatible:
+        assert algorithm in (None, 'gzip')
+
+
+def test_choices():
+    datas = [np.zeros((1000, 10)),
+             np.arange(10000, dtype='int32'),
+             np.random.randint(0, 255, size=(10000, ), dtype='uint8')]
+    for data in datas:
+        for matlab_compatible in (True, False):
+            for objective in ('size', 'throughput'):
+                yield check_choice, data, matlab_compatible, objective
+
+
+def test_incompressible_not_compressed():
+    data = np.frombuffer(os.urandom(100000), dtype='uint8')
+    choice, filters = write_and_check(data, matlab_compatible=False)
+    assert_equal_nose('none', choice)
+    assert_equal_nose((None, None, False), filters)
+
+
+def test_compressible_compressed():
+    data = np.zeros((100000, ), dtype='float64')
+    choice, filters = write_and_check(data, matlab_compatible=False)
+    assert choice != 'none'
+
+
+def fake_timer(times):
+    # Makes a timer where every write of the sample with each candidate
+    # (in order) takes the time given for it.
+    repeats = hdf5storage.utilities._compression_sample_repeats
+    names = list(hdf5storage.utilities._compression_candidates)
+    calls = itertools.count()
+    now = [0.0]
+
+    def timer():
+        n = next(calls)
+        if n % 2 == 1:
+            now[0] += times[names[n // (2 * repeats)]]
+        return now[0]
+
+    return timer
+
+
+def write_with_times(data, times, **keywords):
+    old = hdf5storage.utilities._compression_timer
+    hdf5storage.utilities._compression_timer = fake_timer(times)
+    try:
+        return write_and_check(data, matlab_compatible=False,
+                               adaptive_compression_objective='throughput',
+                               **keywords)
+    finally:
+        hdf5storage.utilities._compression_timer = old
+
+
+def test_throughput_none_fast_enough():
+    # Nothing can be this fast, so the fastest must be chosen.
+    data = np.arange(100000, dtype='int64')
+    times = dict.fromkeys(hdf5storage.utilities._compression_candidates,
+                          1.0)
+    times['gzip:4'] = 0.5
+    choice, filters = write_with_times(
+        data, times, adaptive_compression_min_throughput=1e12)
+    assert_equal_nose('gzip:4', choice)
+
+
+def test_throughput_smallest_fast_enough():
+    # Only no compression and lzf are fast enough, and lzf makes the
+    # sample smaller.
+    data = np.arange(100000, dtype='int64')
+    times = dict.fromkeys(hdf5storage.utilities._compression_candidates,
+                          10.0)
+    times['none'] = 1e-6
+    times['lzf'] = 1e-3
+    choice, filters = write_with_times(
+        data, times, adaptive_compression_min_throughput=1.0)
+    assert_equal_nose('lzf', choice)
+
+
+def test_no_python_metadata():
+    data = np.zeros((100000, ), dtype='float64')
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          truncate_existing=True, adaptive_compression=True,
+                          compress_size_threshold=0,
+                          matlab_compatible=False,
+                          store_python_metadata=False)
+        with h5py.File(filename, mode='r') as f:
+            assert 'Python.Compression' not in f['a'].attrs
+            assert f['a'].compression is not None
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+
+
+def test_sample_not_contiguous():
+    # The sample of a non-contiguous array (such as the transposed ones
+    # written for MATLAB) must be taken without copying the whole thing.
+    data = np.arange(400000, dtype='float64').reshape(400, 1000).T
+    options = hdf5storage.Options(matlab_compatible=False,
+                                  adaptive_compression_sample_size=8000)
+    samples = []
+
+    def convert(sample):
+        samples.append(sample)
+        return sample
+
+    tracemalloc.start()
+    try:
+        hdf5storage.utilities.choose_compression(data, options, convert)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < data.nbytes // 10
+    assert_equal_nose(1, len(samples))
+    flat = data.reshape(-1)
+    expected = np.concatenate([flat[i * 100000:i * 100000 + 250]
+                               for i in range(4)])
+    assert_equal(expected, samples[0])
+
+
+def test_options_validation():
+    options = hdf5storage.Options(adaptive_compression=1,
+                                  adaptive_compression_objective='fast',
+                                  adaptive_compression_min_throughput=0,
+                                  adaptive_compression_sample_size=-1)
+    assert_equal_nose((False, 'size', 100.0, 256 * 1024),
+                      (options.adaptive_compression,
+                       options.adaptive_compression_objective,
+                       options.adaptive_compression_min_throughput,
+                       options.adaptive_compression_sample_size))
+    options = hdf5storage.Options(adaptive_compression=True,
+                                  matlab_compatible=True)
+    assert options.matlab_compatible
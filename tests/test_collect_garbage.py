@@ -0,0 +1,153 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import tempfile
+
+import numpy as np
+import h5py
+
+from nose.tools import assert_equal as assert_equal_nose
+from nose.tools import raises
+
+import hdf5storage
+
+from asserts import assert_equal
+
+
+def make_temp_file():
+    fld = tempfile.mkstemp()
+    os.close(fld[0])
+    return fld[1]
+
+
+def count_refs(filename):
+    with h5py.File(filename, mode='r') as f:
+        return len(f['#refs#'])
+
+
+def make_garbage(f):
+    # Writes data stored with References and then overwrites and
+    # deletes some of it, which leaves orphans in the Group for
+    # references.
+    f['a'] = [1, 'b', [2.0, 3]]
+    f['keep'] = [np.arange(3), [np.float32(4)]]
+    f['a'] = 5
+    f['b'] = [6, 7]
+    del f['b']
+
+
+def test_collect_garbage():
+    filename = make_temp_file()
+    try:
+        with hdf5storage.File(filename, writable=True,
+                              matlab_compatible=False) as f:
+            make_garbage(f)
+            before = f.storage_report()['unreachable_objects']
+            assert before > 0
+            assert f.collect_garbage() > 0
+            assert_equal_nose(0, f.collect_garbage())
+            report = f.storage_report()
+            out = f.reads(['a', 'keep'])
+        with h5py.File(filename, mode='r') as f:
+            assert 'a' in f['#refs#']
+            # The canonical empty and the 3 objects still pointed to
+            # by 'keep' (a list holding another list of 1 element) are
+            # all that are left.
+            assert_equal_nose(4, len(f['#refs#']))
+    finally:
+        os.remove(filename)
+    assert_equal_nose(0, report['unreachable_objects'])
+    assert_equal(5, out[0])
+    assert_equal([np.arange(3), [np.float32(4)]], out[1])
+
+
+def test_collect_garbage_nothing_to_do():
+    filename = make_temp_file()
+    try:
+        with hdf5storage.File(filename, writable=True,
+                              matlab_compatible=False) as f:
+            assert_equal_nose(0, f.collect_garbage())
+            f['a'] = np.arange(4)
+            f['b'] = [1, 2]
+            assert_equal_nose(0, f.collect_garbage())
+            assert_equal([1, 2], f['b'])
+    finally:
+        os.remove(filename)
+
+
+@raises(IOError)
+def test_collect_garbage_not_writable():
+    filename = make_temp_file()
+    try:
+        hdf5storage.write([1], path='/a', filename=filename,
+                          truncate_existing=True)
+        with hdf5storage.File(filename) as f:
+            f.collect_garbage()
+    finally:
+        os.remove(filename)
+
+
+def check_collect_on_close(threshold, collected):
+    filename = make_temp_file()
+    try:
+        with hdf5storage.File(filename, writable=True,
+                              matlab_compatible=False) as f:
+            make_garbage(f)
+        n = count_refs(filename)
+        with hdf5storage.File(filename, writable=True,
+                              matlab_compatible=False,
+                              garbage_collection_threshold=threshold) as f:
+            make_garbage(f)
+            ratio = f.storage_report()['unreachable_objects'] \
+                / (count_refs(filename) - 1)
+        if collected:
+            assert_equal_nose(4, count_refs(filename))
+        else:
+            assert count_refs(filename) > n
+        if threshold is not None:
+            assert (ratio >= threshold) == collected
+    finally:
+        os.remove(filename)
+
+
+def test_collect_garbage_on_close():
+    for threshold, collected in ((0, True), (0.5, True), (0.99, False),
+                                 (1, False), (None, False)):
+        yield check_collect_on_close, threshold, collected
+
+
+def test_garbage_collection_threshold_option():
+    assert_equal_nose(None,
+                      hdf5storage.Options().garbage_collection_threshold)
+    for value in (0, 0.25, 1):
+        options = hdf5storage.Options(garbage_collection_threshold=value)
+        assert_equal_nose(float(value),
+                          options.garbage_collection_threshold)
+        assert options.matlab_compatible
+    for value in (-0.1, 1.5, True, '0.5'):
+        options = hdf5storage.Options(garbage_collection_threshold=value)
+        assert_equal_nose(None, options.garbage_collection_threshold)
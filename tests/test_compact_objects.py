@@ -0,0 +1,180 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import datetime
+import fractions
+import os
+import os.path
+import tempfile
+
+import numpy as np
+import h5py
+
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+
+
+tz = datetime.timezone(datetime.timedelta(hours=-3, minutes=-30))
+
+compactable = [slice(1, None, -2), slice(None), range(3, 100, 7),
+               fractions.Fraction(-7, 3),
+               datetime.timedelta(-3, 5, 7), tz, datetime.timezone.utc,
+               datetime.date(2020, 2, 29),
+               datetime.time(1, 2, 3, 4, tz), datetime.time(23, 59),
+               datetime.datetime(2021, 1, 2, 3, 4, 5, 6,
+                                 datetime.timezone.utc),
+               datetime.datetime(1, 1, 1)]
+
+not_compactable = [slice(1.5, 2), slice('a', 'b'), range(2**70),
+                   fractions.Fraction(2**70, 3),
+                   datetime.timezone(datetime.timedelta(hours=1), 'X'),
+                   datetime.time(1, tzinfo=datetime.timezone(
+                       datetime.timedelta(hours=1), 'X'))]
+
+
+def write_readback(data, **keywords):
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          **keywords)
+        with h5py.File(filename, mode='r') as f:
+            is_dataset = isinstance(f['a'], h5py.Dataset)
+            stored_dtype = f['a'].dtype if is_dataset else None
+            names = list(f)
+        out = hdf5storage.read(path='/a', filename=filename,
+                               **keywords)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    return stored_dtype, names, out
+
+
+def check_single(data, compact):
+    sdt, names, out = write_readback(
+        data, matlab_compatible=False, fixed_field_objects_as_compound=True)
+    assert_equal_nose(type(out), type(data))
+    assert_equal_nose(out, data)
+    if compact:
+        assert_equal_nose(names, ['a'])
+        assert sdt is not None and sdt.names is not None
+        assert all([sdt[k] == np.dtype('int64') for k in sdt.names])
+    else:
+        assert sdt is None
+
+
+def check_list(data, compact):
+    sdt, names, out = write_readback(
+        data, matlab_compatible=False, fixed_field_objects_as_compound=True)
+    assert_equal_nose(type(out), list)
+    assert_equal_nose(out, data)
+    assert all([type(x) == type(y) for x, y in zip(out, data)])
+    if compact:
+        assert_equal_nose(names, ['a'])
+        assert sdt.names is not None
+    else:
+        assert sdt is None or sdt.names is None
+
+
+def test_single():
+    for data in compactable:
+        yield check_single, data, True
+    for data in not_compactable:
+        yield check_single, data, False
+
+
+def test_list():
+    for data in compactable:
+        yield check_list, [data] * 3, True
+    for data in not_compactable:
+        yield check_list, [data] * 3, False
+    yield check_list, [datetime.datetime(2020, 1, i)
+                       for i in range(1, 30)], True
+    yield check_list, [range(i) for i in range(4)], True
+    yield check_list, [slice(None), slice(1, 2, None), slice(1.5)], False
+    yield check_list, [datetime.date(2020, 1, 1),
+                       datetime.datetime(2020, 1, 1)], False
+
+
+def test_array_shape():
+    data = np.empty((2, 3), dtype='object')
+    for i in range(data.size):
+        data.flat[i] = fractions.Fraction(i, 7)
+    sdt, names, out = write_readback(
+        data, matlab_compatible=False, fixed_field_objects_as_compound=True)
+    assert_equal_nose(names, ['a'])
+    assert_equal_nose(out.dtype, data.dtype)
+    assert_equal_nose(out.shape, data.shape)
+    assert_equal_nose(out.tolist(), data.tolist())
+
+
+def test_structured_field():
+    data = np.zeros((2, ), dtype=[('a', 'object'), ('b', 'float64')])
+    data['a'][0] = datetime.date(2020, 1, 2)
+    data['a'][1] = datetime.date(2021, 3, 4)
+    data['b'] = [1.5, 2.5]
+    sdt, names, out = write_readback(
+        data, matlab_compatible=False, fixed_field_objects_as_compound=True)
+    assert_equal_nose(out.dtype, data.dtype)
+    assert_equal_nose(out.tolist(), data.tolist())
+
+
+def test_option_off():
+    # It is off by default since older versions can't read them.
+    for keywords in ({}, {'fixed_field_objects_as_compound': False}):
+        for data in (compactable[0], [compactable[-1]] * 2):
+            sdt, names, out = write_readback(
+                data, matlab_compatible=False, **keywords)
+            assert_equal_nose(out, data)
+            assert sdt is None or sdt.names is None
+
+
+def test_matlab():
+    data = datetime.date(2020, 2, 29)
+    sdt, names, out = write_readback(data, matlab_compatible=True)
+    assert sdt is None
+
+
+def test_options():
+    assert not hdf5storage.Options().fixed_field_objects_as_compound
+    options = hdf5storage.Options(matlab_compatible=False)
+    assert not options.fixed_field_objects_as_compound
+    options.fixed_field_objects_as_compound = True
+    options.matlab_compatible = True
+    assert not options.fixed_field_objects_as_compound
+    options.fixed_field_objects_as_compound = True
+    assert not options.matlab_compatible
+
+
+def test_no_python_metadata():
+    for data in (compactable[0], [compactable[-1]] * 2):
+        sdt, names, out = write_readback(
+            data, matlab_compatible=False, store_python_metadata=False,
+            fixed_field_objects_as_compound=True)
+        assert sdt is None or sdt.names is None
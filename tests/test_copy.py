@@ -0,0 +1,221 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import tempfile
+
+import numpy as np
+import h5py
+
+from nose.tools import raises
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+
+from asserts import assert_equal
+
+
+def make_temp_file():
+    fld = tempfile.mkstemp(suffix='.mat')
+    os.close(fld[0])
+    return fld[1]
+
+
+def make_data(i):
+    # Data with References into the Group for references (lists and
+    # nested lists in dicts) and without.
+    return {'a': [np.int32(i), 'abc' * i, np.arange(3.0 + i)],
+            'b': {'x': np.ones((3, 2 + i)), 'y': ['p', [np.int8(i)]]},
+            'c': np.random.RandomState(i).rand(20, 30)}
+
+
+def check_copy(matlab_compatible):
+    keywords = {'matlab_compatible': matlab_compatible}
+    if matlab_compatible:
+        keywords['store_python_metadata'] = True
+    src = make_temp_file()
+    dst = make_temp_file()
+    try:
+        hdf5storage.writes({'/d': make_data(1), '/e': make_data(2)},
+                           filename=src, truncate_existing=True,
+                           **keywords)
+        hdf5storage.writes({'/d': make_data(3), '/f': make_data(4)},
+                           filename=dst, truncate_existing=True,
+                           **keywords)
+        hdf5storage.copy(src, dst, ['/d', '/e'], ['/d', '/g/h'],
+                         **keywords)
+        out = hdf5storage.reads(['/d', '/g/h', '/f'], filename=dst,
+                                **keywords)
+        if matlab_compatible:
+            with open(dst, 'rb') as f:
+                assert f.read(128).startswith(b'MATLAB 7.3 MAT-file')
+        with h5py.File(dst, mode='r') as f:
+            # The References must all point into the destination's Group
+            # for references, and the MATLAB H5PATH must follow.
+            for name in ('/d/a', '/g/h/a', '/g/h/b/y'):
+                for ref in f[name][...].flat:
+                    assert_equal_nose('/#refs#', f[ref].parent.name)
+            if matlab_compatible:
+                assert_equal_nose(b'/g/h', f['/g/h/b'].attrs['H5PATH'])
+        with hdf5storage.File(dst) as f:
+            report = f.storage_report()
+    finally:
+        for name in (src, dst):
+            if os.path.exists(name):
+                os.remove(name)
+    assert_equal(make_data(1), out[0])
+    assert_equal(make_data(2), out[1])
+    assert_equal(make_data(4), out[2])
+    # What the overwritten /d pointed to is left behind.
+    assert report['unreachable_objects'] > 0
+
+
+def test_copy():
+    for matlab_compatible in (True, False):
+        yield check_copy, matlab_compatible
+
+
+def test_copy_to_new_file():
+    src = make_temp_file()
+    dst = make_temp_file()
+    os.remove(dst)
+    try:
+        hdf5storage.writes({'/d': make_data(1), '/e': make_data(2)},
+                           filename=src, truncate_existing=True,
+                           matlab_compatible=False)
+        hdf5storage.copy(src, dst, ['/e'], matlab_compatible=False)
+        with hdf5storage.File(dst, matlab_compatible=False) as f:
+            assert_equal_nose(['e'], list(f.keys()))
+            assert_equal(make_data(2), f.read('/e'))
+            assert_equal_nose(0, f.storage_report()['unreachable_objects'])
+    finally:
+        for name in (src, dst):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def test_merge_into_root():
+    srcs = [make_temp_file() for i in range(3)]
+    dst = make_temp_file()
+    os.remove(dst)
+    try:
+        for i, src in enumerate(srcs):
+            hdf5storage.writes({'/common': make_data(i),
+                                '/x' + str(i): make_data(10 + i)},
+                               filename=src, truncate_existing=True,
+                               matlab_compatible=False)
+            hdf5storage.copy(src, dst, ['/'], matlab_compatible=False)
+        with hdf5storage.File(dst, matlab_compatible=False) as f:
+            assert_equal_nose(['common', 'x0', 'x1', 'x2'],
+                              sorted(f.keys()))
+            assert_equal(make_data(2), f.read('/common'))
+            for i in range(3):
+                assert_equal(make_data(10 + i), f.read('/x' + str(i)))
+    finally:
+        for name in srcs + [dst]:
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def test_copy_within_file():
+    filename = make_temp_file()
+    try:
+        hdf5storage.write(make_data(1), path='/d', filename=filename,
+                          truncate_existing=True, matlab_compatible=False)
+        with hdf5storage.File(filename, writable=True,
+                              matlab_compatible=False) as f:
+            f.copy(['/d', '/d/a'], ['/e', '/f'])
+            # The copies must not share what they point to with the
+            # original, so changing one doesn't change the other.
+            f.write(make_data(5), '/d')
+            f.collect_garbage()
+            assert_equal(make_data(1), f.read('/e'))
+            assert_equal(make_data(1)['a'], f.read('/f'))
+            assert_equal(make_data(5), f.read('/d'))
+        hdf5storage.copy(filename, filename, ['/e/c'], ['/g'],
+                         matlab_compatible=False)
+        assert_equal(make_data(1)['c'],
+                     hdf5storage.read('/g', filename=filename,
+                                      matlab_compatible=False))
+    finally:
+        os.remove(filename)
+
+
+def test_hard_links_kept():
+    src = make_temp_file()
+    dst = make_temp_file()
+    try:
+        with h5py.File(src, mode='w') as f:
+            f.create_dataset('d', data=np.arange(5))
+            f['g/h'] = f['d']
+        hdf5storage.copy(src, dst, ['/'])
+        with h5py.File(dst, mode='r') as f:
+            assert_equal_nose(h5py.h5o.get_info(f['d'].id).addr,
+                              h5py.h5o.get_info(f['g/h'].id).addr)
+    finally:
+        for name in (src, dst):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def check_copy_error(paths, dst_paths, same_file):
+    src = make_temp_file()
+    dst = src if same_file else make_temp_file()
+    try:
+        hdf5storage.write(make_data(1), path='/d', filename=src,
+                          truncate_existing=True)
+        hdf5storage.copy(src, dst, paths, dst_paths)
+    finally:
+        for name in set((src, dst)):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def test_copy_errors():
+    for error, paths, dst_paths, same_file in (
+            (KeyError, ['/e'], None, False),
+            (ValueError, ['/d'], ['/e', '/f'], False),
+            (ValueError, ['/#refs#/a'], None, False),
+            (ValueError, ['/d'], ['/#refs#/b'], False),
+            (ValueError, ['/d/c'], ['/'], False),
+            (ValueError, ['/d'], None, True),
+            (ValueError, ['/d'], ['/d/e'], True),
+            (ValueError, ['/d/a'], ['/d'], True),
+            (TypeError, 1, None, False)):
+        yield raises(error)(check_copy_error), paths, dst_paths, \
+            same_file
+
+
+@raises(IOError)
+def test_copy_not_writable():
+    filename = make_temp_file()
+    try:
+        hdf5storage.write(1, path='/d', filename=filename,
+                          truncate_existing=True)
+        with hdf5storage.File(filename) as f:
+            f.copy(['/d'], ['/e'])
+    finally:
+        os.remove(filename)
@@ -0,0 +1,144 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import os.path
+import tempfile
+
+import numpy as np
+import h5py
+
+from nose.tools import raises, assert_equal as assert_equal_nose
+
+import hdf5storage
+import hdf5storage.exceptions
+from hdf5storage.utilities import convert_datetime64_to_datenum, \
+    convert_datenum_to_datetime64
+
+
+def make_times(dtype, shape=(4, 3)):
+    data = np.arange(-5, np.prod(shape) - 5, dtype='int64') * 1234567
+    data = data.view('timedelta64[ms]').reshape(shape)
+    if np.dtype(dtype).kind == 'M':
+        data = np.datetime64('2021-07-04T10:11:12.131', 'ms') + data
+    data = data.astype(dtype)
+    if data.size != 0:
+        data.flat[1] = np.array('NaT', dtype=dtype)
+    return data
+
+
+def write_readback(data, **keywords):
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          **keywords)
+        with h5py.File(filename, mode='r') as f:
+            stored_dtype = f['a'].dtype
+            attrs = dict(f['a'].attrs)
+        out = hdf5storage.read(path='/a', filename=filename,
+                               matlab_compatible=False)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    return stored_dtype, attrs, out
+
+
+def check_readback(data, keywords, stored_dtype, exact):
+    sdt, attrs, out = write_readback(data, **keywords)
+    assert_equal_nose(sdt, np.dtype(stored_dtype))
+    assert_equal_nose(attrs['hdf5storage.TimeUnit'],
+                      data.dtype.name.encode())
+    assert_equal_nose(type(out), type(data))
+    assert_equal_nose(out.dtype, data.dtype)
+    assert_equal_nose(out.shape, data.shape)
+    np.testing.assert_array_equal(np.isnat(out), np.isnat(data))
+    diff = np.abs((out - data)[~np.isnat(data)].astype('int64'))
+    if exact:
+        assert np.all(diff == 0)
+    else:
+        assert np.all(diff <= 10 * np.timedelta64(1, 'us')
+                      / np.timedelta64(1, np.datetime_data(
+                          data.dtype)[0]))
+
+
+def test_readback():
+    for kind in ('datetime64', 'timedelta64'):
+        for unit in ('ns', 'us', 'ms', 's', 'm', 'h', 'D', '10ms'):
+            dtype = kind + '[' + unit + ']'
+            for data in (make_times(dtype), make_times(dtype)[0, 0],
+                         make_times(dtype, (0, 2))):
+                yield check_readback, data, \
+                    {'matlab_compatible': False}, 'int64', True
+                if data.ndim == 2 and data.size != 0:
+                    yield check_readback, data, \
+                        {'matlab_compatible': False,
+                         'store_python_metadata': False}, 'int64', True
+                if data.size != 0:
+                    yield check_readback, data, \
+                        {'matlab_compatible': True}, 'float64', \
+                        unit in ('s', 'm', 'h', 'D', '10ms')
+
+
+def test_matlab():
+    data = make_times('datetime64[ns]')
+    sdt, attrs, out = write_readback(data, matlab_compatible=True)
+    assert_equal_nose(attrs['MATLAB_class'], b'double')
+    sdt, attrs, out = write_readback(data[:0], matlab_compatible=True)
+    assert_equal_nose(attrs['MATLAB_class'], b'double')
+    assert_equal_nose(attrs['MATLAB_empty'], 1)
+
+
+@raises(hdf5storage.exceptions.TypeNotMatlabCompatibleError)
+def test_matlab_timedelta_months():
+    write_readback(np.timedelta64(3, 'M'), matlab_compatible=True)
+
+
+def test_datenum():
+    data = np.array(['0000-01-01', '1970-01-01', '2000-01-01T12:00',
+                     'NaT'], dtype='datetime64[m]')
+    datenum = convert_datetime64_to_datenum(data)
+    np.testing.assert_array_equal(datenum,
+                                  [1.0, 719529.0, 730486.5, np.nan])
+    np.testing.assert_array_equal(
+        convert_datenum_to_datetime64(datenum, data.dtype), data)
+    np.testing.assert_array_equal(
+        convert_datetime64_to_datenum(data.astype('datetime64[M]')),
+        [1.0, 719529.0, 730486.0, np.nan])
+    np.testing.assert_array_equal(
+        convert_datetime64_to_datenum(np.timedelta64(36, 'h')), 1.5)
+
+
+def test_options():
+    assert hdf5storage.Options().convert_datetime64_to_datenum
+    options = hdf5storage.Options(matlab_compatible=False)
+    assert not options.convert_datetime64_to_datenum
+    options.matlab_compatible = True
+    assert options.convert_datetime64_to_datenum
+    options.convert_datetime64_to_datenum = False
+    assert not options.matlab_compatible
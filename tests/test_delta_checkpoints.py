@@ -0,0 +1,302 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import os.path
+import tempfile
+
+import numpy as np
+import h5py
+
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+import hdf5storage.Marshallers
+
+
+def make_data(dtype, shape):
+    data = np.random.RandomState(7).randint(-100, 100, size=shape)
+    if dtype.startswith('datetime64'):
+        return np.datetime64('2020-02-03T04:05:06', 'ms') \
+            + data.astype('timedelta64[s]')
+    elif dtype == 'complex128':
+        return data + 1j * data[::-1]
+    elif dtype == 'bool':
+        return data > 0
+    return data.astype(dtype)
+
+
+def change(data, index):
+    data = data.copy()
+    if data.dtype.kind == 'b':
+        data[index] = ~data[index]
+    elif data.dtype.kind == 'M':
+        data[index] = data[index] + np.timedelta64(1, 's')
+    else:
+        data[index] = data[index] + data.dtype.type(1)
+    return data
+
+
+# Writes each of datas in turn to the same file with delta checkpoints
+# and returns the bytes written for each, what is read back after each,
+# and the final Dataset's chunk shape and Attributes.
+def write_checkpoints(datas, **keywords):
+    fld = None
+    written = []
+    outs = []
+
+    def record(event):
+        if event.operation == 'write_dataset':
+            written[-1] += event.bytes_in
+
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        with hdf5storage.File(filename, writable=True,
+                              delta_checkpoints=True, **keywords) as f:
+            for data in datas:
+                written.append(0)
+                with hdf5storage.instrument(record):
+                    f.write(data, '/a')
+                outs.append(f.read('/a'))
+        with h5py.File(filename, mode='r') as f:
+            chunks = getattr(f['a'], 'chunks', None)
+            attrs = dict(f['a'].attrs)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    return written, outs, chunks, attrs
+
+
+def check_checkpoints(dtype, shape, keywords):
+    data = make_data(dtype, shape)
+    index = tuple([n // 2 for n in shape])
+    datas = [data, data, change(data, index), change(data, index)]
+    written, outs, chunks, attrs = write_checkpoints(datas, **keywords)
+    for x, out in zip(datas, outs):
+        assert_equal_nose(out.dtype, x.dtype)
+        np.testing.assert_array_equal(out, x)
+    assert 'hdf5storage.ChunkHashes' in attrs
+    # Everything is written the first time, nothing when nothing
+    # changed, and one chunk when one element changed.
+    assert written[0] > 0
+    assert_equal_nose(written[1], 0)
+    assert 0 < written[2] <= np.prod(chunks) * written[0] / data.size
+    assert_equal_nose(written[3], 0)
+
+
+def test_checkpoints():
+    for dtype in ('bool', 'uint8', 'int32', 'float64', 'complex128',
+                  'datetime64[ms]'):
+        for shape in ((1000, ), (301, 200), (20, 30, 40)):
+            for keywords in ({'matlab_compatible': True},
+                             {'matlab_compatible': False},
+                             {'matlab_compatible': False,
+                              'compress': False},
+                             {'matlab_compatible': True,
+                              'shuffle_filter': False,
+                              'compressed_fletcher32_filter': False},
+                             {'matlab_compatible': False,
+                              'compression_algorithm': 'lzf'},
+                             {'matlab_compatible': True,
+                              'write_memory_budget': 1000}):
+                yield check_checkpoints, dtype, shape, keywords
+
+
+def check_direct_chunks(dtype, filters):
+    data = make_data(dtype, (100, 77))
+    m = hdf5storage.Marshallers.NumpyScalarArrayMarshaller()
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        with h5py.File(fld[1], mode='w') as f:
+            dset = f.create_dataset('a', data=data, chunks=(30, 20),
+                                    compression='gzip', **filters)
+            encode = m._get_chunk_encoder(dset)
+            # The chunks must be encoded exactly like HDF5 does,
+            # including the edge chunks.
+            for offsets in ((0, 0), (30, 20), (90, 60)):
+                chunk = data[offsets[0]:offsets[0] + 30,
+                             offsets[1]:offsets[1] + 20]
+                assert_equal_nose(encode(chunk),
+                                  dset.id.read_direct_chunk(offsets)[1])
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+
+
+def test_direct_chunks():
+    for dtype in ('uint8', 'int16', 'float64'):
+        for filters in ({}, {'shuffle': True}, {'fletcher32': True},
+                        {'shuffle': True, 'fletcher32': True}):
+            yield check_direct_chunks, dtype, filters
+
+
+def test_no_direct_chunks():
+    m = hdf5storage.Marshallers.NumpyScalarArrayMarshaller()
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        with h5py.File(fld[1], mode='w') as f:
+            for filters in ({'chunks': (3, )},
+                            {'compression': 'lzf'},
+                            {'compression': 'gzip', 'scaleoffset': 2}):
+                dset = f.create_dataset(str(len(f)), data=np.arange(10.0),
+                                        **filters)
+                assert m._get_chunk_encoder(dset) is None
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+
+
+def test_fletcher32():
+    # Check against the checksums HDF5 computes for some edge cases
+    # (odd numbers of bytes and all bits set).
+    m = hdf5storage.Marshallers.NumpyScalarArrayMarshaller()
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        with h5py.File(fld[1], mode='w') as f:
+            for data in (np.arange(7, dtype='uint8'),
+                         np.arange(1001, dtype='uint8'),
+                         np.full((5000, ), 255, dtype='uint8'),
+                         np.random.RandomState(8).rand(3000)):
+                dset = f.create_dataset(str(len(f)), data=data,
+                                        chunks=data.shape,
+                                        fletcher32=True)
+                raw = dset.id.read_direct_chunk((0, ))[1]
+                assert_equal_nose(
+                    m._fletcher32(np.frombuffer(raw[:-4],
+                                                dtype='uint8')),
+                    int.from_bytes(raw[-4:], 'little'))
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+
+
+def test_changed_shape_dtype():
+    data = make_data('float64', (1000, 200))
+    datas = [data, data[:600], data[:600].astype('float32'),
+             change(data[:600], (0, 0)).astype('float32')]
+    written, outs, chunks, attrs = write_checkpoints(
+        datas, matlab_compatible=False)
+    for x, out in zip(datas, outs):
+        np.testing.assert_array_equal(out, x)
+    assert_equal_nose(written[1], written[0] * 6 // 10)
+    assert_equal_nose(written[2], written[1] // 2)
+    assert written[3] < written[2]
+
+
+def test_many_chunks():
+    # The hashes are kept in their own Dataset, so there is no limit on
+    # the number of chunks. The Dataset is made beforehand with small
+    # chunks, which the write reuses, to get a lot of them.
+    data = make_data('float64', (100000, ))
+    fld = None
+    written = []
+
+    def record(event):
+        if event.operation == 'write_dataset':
+            written[-1] += event.bytes_in
+
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        with h5py.File(filename, mode='w') as f:
+            f.create_dataset('a', shape=data.shape, dtype=data.dtype,
+                             chunks=(10, ))
+        with hdf5storage.File(filename, writable=True,
+                              delta_checkpoints=True,
+                              matlab_compatible=False,
+                              compress=False) as f:
+            for x in (data, data, change(data, 5)):
+                written.append(0)
+                with hdf5storage.instrument(record):
+                    f.write(x, '/a')
+                np.testing.assert_array_equal(f.read('/a'), x)
+            # Collecting garbage must keep the hashes.
+            f.collect_garbage()
+        with h5py.File(filename, mode='r') as f:
+            assert_equal_nose(f['a'].chunks, (10, ))
+            hashes = f[f['a'].attrs['hdf5storage.ChunkHashes']]
+            assert_equal_nose(hashes.parent.name, '/#refs#')
+            assert_equal_nose(hashes.dtype, np.dtype('uint64'))
+            assert_equal_nose(hashes.shape, (10000, ))
+        with hdf5storage.File(filename, writable=True,
+                              delta_checkpoints=True,
+                              matlab_compatible=False,
+                              compress=False) as f:
+            written.append(0)
+            with hdf5storage.instrument(record):
+                f.write(change(data, 5), '/a')
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    assert_equal_nose(written, [data.nbytes, 0, 80, 0])
+
+
+def test_hashes_discarded():
+    data = make_data('int32', (100, 50))
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        for delta in (True, False):
+            hdf5storage.write(data, path='/a', filename=filename,
+                              delta_checkpoints=delta)
+            with h5py.File(filename, mode='r') as f:
+                assert_equal_nose('hdf5storage.ChunkHashes' in f['a'].attrs,
+                                  delta)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+
+
+def test_not_arrays():
+    # Scalars, empties, strings, and objects are written as usual.
+    datas = [np.float64(3), np.zeros((0, 3)), np.array(['ab', 'cde']),
+             [1, 'a'], {'b': np.arange(3)}]
+    for data in datas:
+        written, outs, chunks, attrs = write_checkpoints(
+            [data], matlab_compatible=False)
+        assert 'hdf5storage.ChunkHashes' not in attrs
+
+
+def test_options():
+    options = hdf5storage.Options()
+    assert_equal_nose(options.delta_checkpoints, False)
+    options.delta_checkpoints = True
+    assert_equal_nose(options.delta_checkpoints, True)
+    for value in (0, 1, None, 'True'):
+        options.delta_checkpoints = value
+        assert_equal_nose(options.delta_checkpoints, True)
+    assert options.matlab_compatible
@@ -0,0 +1,185 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import io
+
+import numpy as np
+
+from nose.tools import assert_equal as assert_equal_nose
+from nose.tools import raises
+
+import hdf5storage
+from hdf5storage.blockcache import BlockCache
+
+from asserts import assert_equal
+
+
+class RangeReader(object):
+    # Stand in for a remote object store that can only do range reads,
+    # counting the requests.
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+        self.requests = []
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            self.pos = offset
+        elif whence == 1:
+            self.pos += offset
+        else:
+            self.pos = len(self.data) + offset
+        return self.pos
+
+    def readinto(self, b):
+        chunk = self.data[self.pos:self.pos + len(b)]
+        memoryview(b)[:len(chunk)] = chunk
+        self.requests.append((self.pos, len(chunk)))
+        self.pos += len(chunk)
+        return len(chunk)
+
+
+def make_data():
+    return {'a': np.random.rand(500, 400), 'b': np.arange(10),
+            'c': [1, 'x', {'q': np.float32(2)}]}
+
+
+def check_bytesio(matlab_compatible):
+    data = make_data()
+    buf = io.BytesIO()
+    hdf5storage.writes(data, filename=buf,
+                       matlab_compatible=matlab_compatible)
+    assert_equal_nose(matlab_compatible,
+                      buf.getvalue().startswith(b'MATLAB 7.3 MAT-file'))
+    # Appending to it.
+    hdf5storage.write(5, path='/d', filename=buf,
+                      matlab_compatible=matlab_compatible)
+    out = hdf5storage.reads(['a', 'b', 'c', 'd'], filename=buf,
+                            matlab_compatible=matlab_compatible)
+    for x, y in zip([data['a'], data['b'], data['c'], 5], out):
+        assert_equal(x, y)
+    assert_equal_nose(sorted(['a', 'b', 'c', 'd']),
+                      sorted(hdf5storage.loads(
+                          buf.getvalue(),
+                          matlab_compatible=matlab_compatible)))
+    assert not buf.closed
+
+
+def test_bytesio():
+    for matlab_compatible in (True, False):
+        yield check_bytesio, matlab_compatible
+
+
+def test_to_bytes():
+    buf = io.BytesIO()
+    with hdf5storage.File(buf, writable=True) as f:
+        f['a'] = np.arange(3)
+        f.flush()
+        assert_equal_nose(buf.getvalue(), f.to_bytes())
+
+
+def test_block_cache_reads_only_needed_blocks():
+    data = make_data()
+    buf = io.BytesIO()
+    hdf5storage.writes(data, filename=buf, compress=False)
+    reader = RangeReader(buf.getvalue())
+    cache = BlockCache(reader, block_size=4096, capacity=32)
+    out = hdf5storage.loadmat(cache, variable_names=['b', 'c'])
+    assert_equal(data['b'], out['b'])
+    assert_equal(data['c'], out['c'])
+    # The big array 'a' must not have been fetched.
+    assert cache.bytes_fetched < data['a'].nbytes // 4
+    assert_equal_nose(len(reader.requests), cache.fetches)
+    assert_equal_nose(cache.bytes_fetched,
+                      sum(n for _, n in reader.requests))
+    # Reading again is all hits.
+    fetches = cache.fetches
+    hdf5storage.loadmat(cache, variable_names=['b', 'c'])
+    assert_equal_nose(fetches, cache.fetches)
+    assert cache.hits > 0
+    # The whole thing can still be read.
+    assert_equal(data['a'], hdf5storage.read('a', filename=cache))
+
+
+def test_block_cache_reads():
+    raw = bytes(bytearray(range(256))) * 40
+    reader = RangeReader(raw)
+    cache = BlockCache(reader, block_size=100, capacity=3)
+    assert_equal_nose(len(raw), cache.size)
+    cache.seek(250)
+    assert_equal_nose(raw[250:270], cache.read(20))
+    assert_equal_nose(270, cache.tell())
+    assert_equal_nose([(200, 100)], reader.requests)
+    # Blocks that are next to each other and not cached are fetched in
+    # one request.
+    cache.seek(500)
+    assert_equal_nose(raw[500:950], cache.read(450))
+    assert_equal_nose((500, 500), reader.requests[-1])
+    assert_equal_nose(2, cache.fetches)
+    # Only the most recently used blocks are kept, but all those needed
+    # by a read are kept until it is done.
+    assert_equal_nose([5, 6, 7, 8, 9], list(cache._blocks))
+    cache.seek(950)
+    assert_equal_nose(raw[950:1000], cache.read(50))
+    assert_equal_nose(2, cache.fetches)
+    cache.seek(0)
+    cache.read(10)
+    assert_equal_nose([8, 9, 0], list(cache._blocks))
+    # Reads past the end.
+    cache.seek(-5, 2)
+    assert_equal_nose(raw[-5:], cache.read(100))
+    assert_equal_nose(b'', cache.read(100))
+    cache.clear()
+    assert_equal_nose(0, len(cache._blocks))
+
+
+def test_block_cache_read_only_raw_read():
+    # The raw object only needs read, not readinto.
+    class Reader(object):
+        def __init__(self, data):
+            self.raw = io.BytesIO(data)
+            self.seek = self.raw.seek
+            self.read = self.raw.read
+
+    cache = BlockCache(Reader(b'0123456789' * 10), block_size=7,
+                       capacity=2, size=100)
+    cache.seek(3)
+    assert_equal_nose(b'3456789012', cache.read(10))
+
+
+@raises(ValueError)
+def test_block_cache_bad_block_size():
+    BlockCache(io.BytesIO(b''), block_size=0)
+
+
+@raises(ValueError)
+def test_block_cache_bad_capacity():
+    BlockCache(io.BytesIO(b''), capacity=0)
+
+
+@raises(TypeError)
+def test_not_file_like():
+    hdf5storage.File(object())
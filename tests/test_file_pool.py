@@ -0,0 +1,170 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import os.path
+import tempfile
+import time
+
+import h5py
+
+from nose.tools import raises, assert_equal as assert_equal_nose
+
+import hdf5storage
+
+
+def setup_module():
+    hdf5storage.enable_file_pool(max_open_files=2)
+
+
+def teardown_module():
+    hdf5storage.disable_file_pool()
+
+
+def make_filename():
+    fld = tempfile.mkstemp()
+    os.close(fld[0])
+    os.remove(fld[1])
+    return fld[1]
+
+
+def pooled_file(filename):
+    entry = hdf5storage._file_pool[0].files.get(os.path.realpath(filename))
+    if entry is None:
+        return None
+    return entry[1]
+
+
+def test_read_reuses_file():
+    filename = make_filename()
+    try:
+        hdf5storage.write(1, path='/a', filename=filename,
+                          truncate_existing=True)
+        hdf5storage.write(2, path='/b', filename=filename)
+        assert_equal_nose(2, hdf5storage.read('/b', filename=filename))
+        f = pooled_file(filename)
+        assert f is not None
+        assert_equal_nose(1, hdf5storage.read('/a', filename=filename))
+        assert f is pooled_file(filename)
+        assert not f.closed
+    finally:
+        hdf5storage.close_file_pool(filename)
+        os.remove(filename)
+
+
+def test_write_reuses_file():
+    filename = make_filename()
+    try:
+        hdf5storage.write(1, path='/a', filename=filename)
+        f = pooled_file(filename)
+        hdf5storage.writes({'b': 2, 'c': 3}, filename=filename)
+        assert f is pooled_file(filename)
+        hdf5storage.flush_file_pool()
+        assert_equal_nose([1, 2, 3],
+                          hdf5storage.reads(['a', 'b', 'c'],
+                                            filename=filename))
+        # Reading needed the file opened differently.
+        assert f.closed
+    finally:
+        hdf5storage.close_file_pool(filename)
+        os.remove(filename)
+
+
+def test_different_options_reopen():
+    filename = make_filename()
+    try:
+        hdf5storage.write(1, path='/a', filename=filename)
+        f = pooled_file(filename)
+        hdf5storage.write(2, path='/b', filename=filename,
+                          matlab_compatible=False)
+        assert f.closed
+        assert f is not pooled_file(filename)
+    finally:
+        hdf5storage.close_file_pool(filename)
+        os.remove(filename)
+
+
+def test_modified_file_reopened_for_read():
+    filename = make_filename()
+    try:
+        hdf5storage.write(1, path='/a', filename=filename)
+        hdf5storage.read('/a', filename=filename)
+        f = pooled_file(filename)
+        # Modify the file from outside the pool, which needs it closed
+        # first. Make sure the modification time changes.
+        hdf5storage.close_file_pool(filename)
+        time.sleep(0.01)
+        with h5py.File(filename, mode='a') as fh:
+            fh.attrs['foo'] = 'bar'
+        assert_equal_nose(1, hdf5storage.read('/a', filename=filename))
+        assert f is not pooled_file(filename)
+    finally:
+        hdf5storage.close_file_pool(filename)
+        os.remove(filename)
+
+
+def test_truncate_reopens():
+    filename = make_filename()
+    try:
+        hdf5storage.write(1, path='/a', filename=filename)
+        f = pooled_file(filename)
+        hdf5storage.write(2, path='/b', filename=filename,
+                          truncate_existing=True)
+        assert f.closed
+        hdf5storage.flush_file_pool(filename)
+        assert_equal_nose({'b': 2},
+                          hdf5storage.loadmat(filename, appendmat=False))
+    finally:
+        hdf5storage.close_file_pool(filename)
+        os.remove(filename)
+
+
+def test_lru_eviction():
+    filenames = [make_filename() for i in range(3)]
+    try:
+        for i, filename in enumerate(filenames):
+            hdf5storage.savemat(filename, {'a': i}, appendmat=False)
+        assert pooled_file(filenames[0]) is None
+        assert pooled_file(filenames[1]) is not None
+        assert pooled_file(filenames[2]) is not None
+        hdf5storage.close_file_pool()
+        for i, filename in enumerate(filenames):
+            assert_equal_nose(i, hdf5storage.read('/a',
+                                                  filename=filename))
+    finally:
+        hdf5storage.close_file_pool()
+        for filename in filenames:
+            os.remove(filename)
+
+
+@raises(TypeError)
+def test_enable_invalid_type():
+    hdf5storage.enable_file_pool(max_open_files=2.0)
+
+
+@raises(ValueError)
+def test_enable_invalid_value():
+    hdf5storage.enable_file_pool(max_open_files=0)
@@ -0,0 +1,65 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import subprocess
+import sys
+
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+import hdf5storage.Marshallers
+
+
+# Runs the code in a fresh interpreter, which is needed to see what
+# importing hdf5storage does, and returns the lines it prints.
+def run_in_new_interpreter(code):
+    return subprocess.check_output([sys.executable, '-c', code],
+                                   universal_newlines=True).split()
+
+
+def test_import_does_not_load_entry_point_modules():
+    out = run_in_new_interpreter(
+        'import sys\n'
+        'import hdf5storage\n'
+        'print(\'pkg_resources\' in sys.modules)\n'
+        'print(hdf5storage._default_marshaller_collection[0] is None)\n')
+    assert_equal_nose(['False', 'True'], out)
+
+
+def test_default_MarshallerCollection_made_on_first_use():
+    mc = hdf5storage.get_default_MarshallerCollection()
+    assert isinstance(mc, hdf5storage.MarshallerCollection)
+    assert mc is hdf5storage.get_default_MarshallerCollection()
+    assert mc is hdf5storage.Options().marshaller_collection
+
+
+def test_builtin_marshallers():
+    classes = [v for k, v in sorted(vars(hdf5storage.Marshallers).items())
+               if isinstance(v, type)
+               and issubclass(v, hdf5storage.Marshallers.TypeMarshaller)]
+    mc = hdf5storage.MarshallerCollection()
+    assert_equal_nose(classes,
+                      [type(m) for m in mc._builtin_marshallers])
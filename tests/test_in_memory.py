@@ -0,0 +1,155 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import tempfile
+
+import numpy as np
+
+from nose.tools import assert_equal as assert_equal_nose
+from nose.tools import raises
+
+import hdf5storage
+
+from asserts import assert_equal
+
+
+def make_data():
+    return {'a': np.arange(6).reshape(2, 3), 'b': 'hello',
+            'c': [1, 'x', {'q': 2.5}], 'd': np.float32(3)}
+
+
+def check_dumps_loads(matlab_compatible):
+    data = make_data()
+    buf = hdf5storage.dumps(data, matlab_compatible=matlab_compatible)
+    assert isinstance(buf, bytes)
+    assert_equal_nose(matlab_compatible,
+                      buf.startswith(b'MATLAB 7.3 MAT-file'))
+    out = hdf5storage.loads(buf, matlab_compatible=matlab_compatible)
+    assert_equal_nose(sorted(data), sorted(out))
+    for k, v in data.items():
+        assert_equal(v, out[k])
+
+
+def test_dumps_loads():
+    for matlab_compatible in (True, False):
+        yield check_dumps_loads, matlab_compatible
+
+
+def test_loads_not_matlab_compatible_by_default():
+    # Like read, data written without MATLAB compatibility can be read
+    # without giving any options.
+    data = make_data()
+    buf = hdf5storage.dumps(data, matlab_compatible=False)
+    out = hdf5storage.loads(buf)
+    assert_equal_nose(sorted(data), sorted(out))
+    for k, v in data.items():
+        assert_equal(v, out[k])
+
+
+def test_dumps_is_a_valid_file():
+    data = make_data()
+    buf = hdf5storage.dumps(data)
+    fld = None
+    try:
+        fld = tempfile.mkstemp(suffix='.mat')
+        os.close(fld[0])
+        with open(fld[1], 'wb') as f:
+            f.write(buf)
+        out = hdf5storage.loadmat(fld[1])
+        with hdf5storage.File(fld[1]) as f:
+            assert_equal_nose(buf, f.to_bytes())
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    for k, v in data.items():
+        assert_equal(v, out[k])
+
+
+def test_loads_accepts_bytes_like():
+    data = make_data()
+    buf = hdf5storage.dumps(data)
+    for x in (bytearray(buf), memoryview(buf)):
+        assert_equal_nose(sorted(data), sorted(hdf5storage.loads(x)))
+
+
+def test_in_memory_file():
+    with hdf5storage.File(writable=True, in_memory=True,
+                          filename='should_not_be_made.h5') as f:
+        f['a'] = np.arange(3)
+        assert_equal(np.arange(3), f['a'])
+        buf = f.to_bytes()
+    assert not os.path.exists('should_not_be_made.h5')
+    # Modifying a file made from an image doesn't change the image.
+    with hdf5storage.File(writable=True, in_memory=True,
+                          image=buf) as f:
+        f['b'] = 'x'
+        buf2 = f.to_bytes()
+    assert_equal_nose(['a'], sorted(hdf5storage.loads(buf)))
+    assert_equal_nose(['a', 'b'], sorted(hdf5storage.loads(buf2)))
+    with hdf5storage.File(writable=True, in_memory=True, image=buf,
+                          truncate_existing=True) as f:
+        assert_equal_nose(0, len(f))
+
+
+def test_in_memory_files_are_separate():
+    f1 = hdf5storage.File(writable=True, in_memory=True)
+    f2 = hdf5storage.File(writable=True, in_memory=True)
+    try:
+        f1['a'] = 1
+        f2['b'] = 2
+        assert_equal_nose(['a'], list(f1))
+        assert_equal_nose(['b'], list(f2))
+    finally:
+        f1.close()
+        f2.close()
+
+
+def test_in_memory_invalid_matlab_truncated():
+    buf = hdf5storage.dumps({'a': 1}, matlab_compatible=False)
+    # Strip the userblock, which is still a valid HDF5 file.
+    buf = buf[512:]
+    with hdf5storage.File(writable=True, in_memory=True, image=buf,
+                          truncate_invalid_matlab=True) as f:
+        assert_equal_nose(0, len(f))
+        f['b'] = 2
+        out = f.to_bytes()
+    assert out.startswith(b'MATLAB 7.3 MAT-file')
+
+
+@raises(ValueError)
+def test_in_memory_read_needs_image():
+    hdf5storage.File(in_memory=True)
+
+
+@raises(ValueError)
+def test_image_needs_in_memory():
+    hdf5storage.File(image=b'')
+
+
+@raises(IOError)
+def test_loads_not_hdf5():
+    hdf5storage.loads(b'not an HDF5 file' * 100)
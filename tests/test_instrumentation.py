@@ -0,0 +1,220 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from nose.tools import raises, assert_equal as assert_equal_nose
+
+import hdf5storage
+import hdf5storage.instrumentation
+import hdf5storage.Marshallers
+
+
+def write_and_read(data, **keywords):
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        with hdf5storage.instrument() as write_events:
+            hdf5storage.write(data, path='/a', filename=filename,
+                              truncate_existing=True, **keywords)
+        with hdf5storage.instrument() as read_events:
+            hdf5storage.read(path='/a', filename=filename, **keywords)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    # Only the events for the data are wanted.
+    return ([ev for ev in write_events if ev.operation == 'write'],
+            [ev for ev in read_events if ev.operation == 'read'])
+
+
+def test_no_subscribers_outside_instrument():
+    write_and_read(1)
+    assert_equal_nose((), hdf5storage.instrumentation._subscribers)
+
+
+def test_array_events():
+    data = np.arange(100, dtype='float64')
+    write_events, read_events = write_and_read(
+        data, matlab_compatible=False, compress=False)
+    assert_equal_nose(1, len(write_events))
+    assert_equal_nose(1, len(read_events))
+    for ev in write_events + read_events:
+        assert_equal_nose('/a', ev.path)
+        assert_equal_nose(hdf5storage.Marshallers.NumpyScalarArrayMarshaller,
+                          ev.marshaller)
+        assert_equal_nose(0, ev.depth)
+        assert ev.wall_time >= 0.0
+        assert ev.cpu_time >= 0.0
+        assert ev.error is None
+    assert_equal_nose(('write', data.nbytes, data.nbytes, 1),
+                      (write_events[0].operation,
+                       write_events[0].bytes_in,
+                       write_events[0].bytes_out,
+                       write_events[0].objects_created))
+    assert_equal_nose(('read', data.nbytes, data.nbytes, 0),
+                      (read_events[0].operation,
+                       read_events[0].bytes_in,
+                       read_events[0].bytes_out,
+                       read_events[0].objects_created))
+
+
+def test_nested_events():
+    data = {'b': [1, 'c'], 'd': 2}
+    write_events, read_events = write_and_read(data,
+                                               matlab_compatible=False)
+    for events in (write_events, read_events):
+        # Nested data comes first with the top level last.
+        assert_equal_nose('/a', events[-1].path)
+        assert_equal_nose(hdf5storage.Marshallers.PythonDictMarshaller,
+                          events[-1].marshaller)
+        assert_equal_nose(0, events[-1].depth)
+        assert_equal_nose([1] * 2 + [2] * 2,
+                          sorted(ev.depth for ev in events[:-1]))
+        for ev in events[:-1]:
+            assert ev.start_time >= events[-1].start_time
+    assert_equal_nose(len(write_events), write_events[-1].objects_created)
+
+
+def test_error_event():
+    class Unwritable(object):
+        pass
+    events = []
+    with hdf5storage.instrument(events.append):
+        try:
+            write_and_read([Unwritable()], matlab_compatible=False)
+        except NotImplementedError:
+            pass
+    events = [ev for ev in events if ev.operation == 'write']
+    assert_equal_nose(1, len(events))
+    assert isinstance(events[0].error, NotImplementedError)
+
+
+def test_subscribe_unsubscribe():
+    events = []
+    hdf5storage.instrumentation.subscribe(events.append)
+    try:
+        write_and_read(1)
+    finally:
+        hdf5storage.instrumentation.unsubscribe(events.append)
+    assert_equal_nose(['read', 'write'],
+                      sorted(ev.operation for ev in events
+                             if ev.operation in ('read', 'write')))
+    hdf5storage.instrumentation.unsubscribe(events.append)
+
+
+def test_spans():
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        with hdf5storage.instrument() as events:
+            hdf5storage.write([np.float64(1)], path='/a',
+                              filename=filename, matlab_compatible=False)
+            hdf5storage.write([np.float64(2)], path='/a',
+                              filename=filename, matlab_compatible=False)
+            hdf5storage.read(path='/a', filename=filename,
+                             matlab_compatible=False)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    operations = [ev.operation for ev in events]
+    for op in ('File.writes', 'File.reads', 'write_object_array',
+               'read_object_array', 'create_dataset', 'write_dataset',
+               'set_attributes'):
+        assert op in operations
+    # The last event of the first File.writes is for the call itself,
+    # which must contain all the others.
+    first = operations.index('File.writes')
+    assert_equal_nose(filename, events[first].path)
+    assert_equal_nose(
+        ['write', 'File.writes'],
+        [ev.operation for ev in events[first - 1:first + 1]])
+    for ev in events[:first]:
+        assert ev.start_time >= events[first].start_time
+        assert ev.start_time + ev.wall_time \
+            <= events[first].start_time + events[first].wall_time
+    for ev in events:
+        if ev.operation in ('create_dataset', 'write_dataset',
+                            'set_attributes'):
+            assert ev.path.startswith('/')
+
+
+def test_chrome_trace():
+    recorder = hdf5storage.instrumentation.ChromeTraceRecorder()
+    with hdf5storage.instrument(recorder):
+        write_and_read({'b': [1, 'c']}, matlab_compatible=False)
+    trace = recorder.to_dict()
+    assert_equal_nose(set(('traceEvents', 'displayTimeUnit')),
+                      set(trace))
+    assert len(trace['traceEvents']) > 0
+    names = set()
+    for ev in trace['traceEvents']:
+        assert_equal_nose('X', ev['ph'])
+        assert ev['dur'] >= 0
+        names.add(ev['name'])
+    assert 'write PythonDictMarshaller' in names
+    assert 'read PythonDictMarshaller' in names
+    assert 'File.writes' in names
+    json.dumps(trace)
+
+
+def test_trace_environment_variable():
+    fld = None
+    fld2 = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        fld2 = tempfile.mkstemp()
+        os.close(fld2[0])
+        env = dict(os.environ)
+        env['HDF5STORAGE_TRACE'] = fld2[1]
+        subprocess.check_call(
+            [sys.executable, '-c',
+             'import hdf5storage\n'
+             'hdf5storage.write([1, 2], path="/a", filename='
+             + repr(fld[1]) + ')\n'], env=env)
+        with open(fld2[1]) as f:
+            trace = json.load(f)
+    finally:
+        for x in (fld, fld2):
+            if x is not None:
+                os.remove(x[1])
+    assert 'write PythonListMarshaller' in [
+        ev['name'] for ev in trace['traceEvents']]
+
+
+@raises(TypeError)
+def test_subscribe_not_callable():
+    hdf5storage.instrumentation.subscribe(1)
@@ -28,8 +28,6 @@ import os
 import os.path
 import tempfile
 
-import pkg_resources
-
 from nose.tools import assert_equal as assert_equal_nose
 
 import unittest
@@ -63,7 +61,10 @@ def test_find_thirdparty_marshaller_plugins():
         assert isinstance(v, dict)
         for k2, v2 in v.items():
             assert isinstance(k2, str)
-            assert isinstance(v2, pkg_resources.EntryPoint)
+            # Can be an importlib.metadata or a pkg_resources EntryPoint
+            # depending on what is available.
+            assert_equal_nose(v2.name, k)
+            assert callable(getattr(v2, 'load', None))
             if k2 == 'example_hdf5storage_marshaller_plugin':
                 found_example = True
     assert_equal_nose(has_example_hdf5storage_marshaller_plugin,
@@ -110,8 +110,8 @@ def test_missing_required_non_lazy():
 
 def test_has_required_lazy():
     m = hdf5storage.Marshallers.TypeMarshaller()
-    m.required_parent_modules = ['json']
-    m.required_modules = ['json']
+    m.required_parent_modules = ['netrc']
+    m.required_modules = ['netrc']
     m.python_type_strings = ['ellipsis']
     m.types = ['builtins.ellipsis']
     m.update_type_lookups()
@@ -148,8 +148,8 @@ def test_has_required_lazy():
 
 def test_has_required_non_lazy():
     m = hdf5storage.Marshallers.TypeMarshaller()
-    m.required_parent_modules = ['csv']
-    m.required_modules = ['csv']
+    m.required_parent_modules = ['colorsys']
+    m.required_modules = ['colorsys']
     m.python_type_strings = ['ellipsis']
     m.types = ['builtins.ellipsis']
     m.update_type_lookups()
@@ -0,0 +1,142 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import io
+import os
+import tempfile
+
+import numpy as np
+import h5py
+
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+
+
+def make_temp_file():
+    fld = tempfile.mkstemp(suffix='.mat')
+    os.close(fld[0])
+    os.remove(fld[1])
+    return fld[1]
+
+
+def read_start(filename, n=128):
+    with open(filename, 'rb') as f:
+        return f.read(n)
+
+
+def has_matlab_header(filename):
+    header = read_start(filename)
+    return header.startswith(b'MATLAB 7.3 MAT-file') \
+        and header[-4:] == b'\x00\x02IM'
+
+
+def check_new_file(matlab_compatible, truncate_existing, exists):
+    filename = make_temp_file()
+    try:
+        if exists:
+            with open(filename, 'wb') as f:
+                f.write(b'garbage' * 1000)
+        with hdf5storage.File(filename, writable=True,
+                              truncate_existing=truncate_existing,
+                              matlab_compatible=matlab_compatible) as f:
+            f['a'] = np.arange(3)
+        assert_equal_nose(matlab_compatible, has_matlab_header(filename))
+        with h5py.File(filename, mode='r') as f:
+            assert_equal_nose(512, f.userblock_size)
+            assert_equal_nose([0, 1, 2], list(f['a'][...].flatten()))
+    finally:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+def test_new_file():
+    for matlab_compatible in (True, False):
+        yield check_new_file, matlab_compatible, False, False
+        yield check_new_file, matlab_compatible, True, False
+        yield check_new_file, matlab_compatible, True, True
+
+
+def check_existing_file(userblock_size, truncate_invalid_matlab):
+    filename = make_temp_file()
+    try:
+        with h5py.File(filename, mode='w',
+                       userblock_size=userblock_size) as f:
+            f['b'] = 5
+        with hdf5storage.File(
+                filename, writable=True,
+                truncate_invalid_matlab=truncate_invalid_matlab) as f:
+            f['a'] = 4
+            names = sorted(f)
+        with h5py.File(filename, mode='r') as f:
+            userblock_size_after = f.userblock_size
+        if userblock_size >= 128:
+            assert has_matlab_header(filename)
+            assert_equal_nose(userblock_size, userblock_size_after)
+            assert_equal_nose(['a', 'b'], names)
+        elif truncate_invalid_matlab:
+            assert has_matlab_header(filename)
+            assert_equal_nose(512, userblock_size_after)
+            assert_equal_nose(['a'], names)
+        else:
+            assert not has_matlab_header(filename)
+            assert_equal_nose(0, userblock_size_after)
+            assert_equal_nose(['a', 'b'], names)
+    finally:
+        if os.path.exists(filename):
+            os.remove(filename)
+
+
+def test_existing_file():
+    for userblock_size in (0, 512, 1024, 4096):
+        for truncate_invalid_matlab in (True, False):
+            yield check_existing_file, userblock_size, \
+                truncate_invalid_matlab
+
+
+def test_find_userblock_size():
+    for userblock_size in (0, 512, 2048):
+        buf = io.BytesIO()
+        with h5py.File(buf, mode='w',
+                       userblock_size=userblock_size) as f:
+            f['a'] = 1
+        assert_equal_nose(userblock_size,
+                          hdf5storage._find_userblock_size(buf))
+    assert_equal_nose(None, hdf5storage._find_userblock_size(
+        io.BytesIO(b'not an HDF5 file' * 1000)))
+
+
+def test_header_not_rewritten_read_only():
+    filename = make_temp_file()
+    try:
+        with h5py.File(filename, mode='w', userblock_size=512) as f:
+            f['b'] = 5
+        with hdf5storage.File(filename) as f:
+            assert_equal_nose(['b'], list(f))
+        assert_equal_nose(bytes(128), read_start(filename))
+    finally:
+        if os.path.exists(filename):
+            os.remove(filename)
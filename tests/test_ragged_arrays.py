@@ -0,0 +1,212 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import os.path
+import tempfile
+
+import numpy as np
+import h5py
+
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+
+from asserts import assert_equal
+
+
+def make_ragged(number, dtype='int32'):
+    return [np.arange(i % 7, dtype=dtype) for i in range(number)]
+
+
+def write_readback(data, **keywords):
+    keywords = dict({'ragged_arrays_as_vlen': True}, **keywords)
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          matlab_compatible=False, **keywords)
+        with h5py.File(filename, mode='r') as f:
+            vlen = None
+            if isinstance(f['a'], h5py.Dataset):
+                vlen = h5py.check_dtype(vlen=f['a'].dtype)
+            number_refs = len(f.get('/#refs#', ()))
+        out = hdf5storage.read(path='/a', filename=filename,
+                               matlab_compatible=False, **keywords)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    return vlen, number_refs, out
+
+
+def check_vlen(data, dtype):
+    vlen, number_refs, out = write_readback(data)
+    assert_equal_nose(vlen, np.dtype(dtype))
+    assert_equal_nose(number_refs, 0)
+    assert_equal(out, data)
+
+
+def test_vlen():
+    for dtype in ('uint8', 'int16', 'int64', 'float32', 'float64'):
+        data = make_ragged(20, dtype)
+        for tp in (list, tuple):
+            yield check_vlen, tp(data), dtype
+        obj = np.empty((4, 5), dtype='object')
+        obj.flat[:] = data
+        yield check_vlen, obj, dtype
+        yield check_vlen, [np.ones(3, dtype), np.ones(3, dtype)], dtype
+
+
+def test_vlen_many():
+    data = make_ragged(100000)
+    vlen, number_refs, out = write_readback(data)
+    assert_equal_nose(vlen, np.dtype('int32'))
+    assert_equal_nose(number_refs, 0)
+    assert_equal_nose(type(out), list)
+    assert_equal_nose([len(x) for x in out], [len(x) for x in data])
+    np.testing.assert_equal(np.concatenate(out), np.concatenate(data))
+
+
+def check_vlen_filters(keywords):
+    # HDF5 doesn't allow the fletcher32 filter (on by default) on
+    # variable length types, so it must be left out.
+    data = make_ragged(3000)
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          matlab_compatible=False,
+                          ragged_arrays_as_vlen=True, **keywords)
+        with h5py.File(filename, mode='r') as f:
+            assert_equal_nose(h5py.check_dtype(vlen=f['a'].dtype),
+                              np.dtype('int32'))
+            assert not f['a'].fletcher32
+            compression = f['a'].compression
+        out = hdf5storage.read(path='/a', filename=filename,
+                               matlab_compatible=False)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    assert_equal_nose(compression, keywords.get('compression_algorithm',
+                                                'gzip')
+                      if keywords.get('compress', True) else None)
+    assert_equal(out, data)
+
+
+def test_vlen_filters():
+    for keywords in ({}, {'compress_size_threshold': 0},
+                     {'compression_algorithm': 'lzf'},
+                     {'compress': False,
+                      'uncompressed_fletcher32_filter': True}):
+        yield check_vlen_filters, keywords
+
+
+def test_vlen_in_dict():
+    data = {'a': make_ragged(10), 'b': make_ragged(3, 'float64')}
+    vlen, number_refs, out = write_readback(data)
+    assert_equal_nose(number_refs, 0)
+    assert_equal(out, data)
+
+
+def test_vlen_struct_field():
+    data = np.zeros((3, ), dtype=[('a', 'int8', (0, )),
+                                  ('b', 'float32', (4, ))])
+    vlen, number_refs, out = write_readback(data)
+    assert_equal(out, data)
+
+
+def check_not_vlen(data, keywords):
+    vlen, number_refs, out = write_readback(data, **keywords)
+    assert vlen is None
+    assert number_refs != 0
+    assert_equal(out, data)
+
+
+def test_not_vlen():
+    datas = [[np.arange(3), np.arange(4.0)],
+             [np.arange(3), np.ones((2, 2))],
+             [np.arange(3), 1],
+             [np.arange(3), np.arange(3).astype('>i8')],
+             [np.arange(3, dtype='complex128')],
+             [np.arange(3) > 1],
+             [np.arange(3), np.matrix([1, 2])]]
+    for data in datas:
+        yield check_not_vlen, data, {}
+    yield check_not_vlen, make_ragged(4), {'ragged_arrays_as_vlen': False}
+
+
+def test_overwrite():
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        data = make_ragged(5)
+        for vlen in (False, True, False):
+            hdf5storage.write(data, path='/a', filename=filename,
+                              matlab_compatible=False,
+                              ragged_arrays_as_vlen=vlen)
+            out = hdf5storage.read(path='/a', filename=filename,
+                                   matlab_compatible=False)
+            assert_equal(out, data)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+
+
+def test_not_vlen_by_default():
+    # Older versions can't read them, so they must be asked for.
+    data = make_ragged(4)
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          matlab_compatible=False)
+        with h5py.File(filename, mode='r') as f:
+            assert h5py.check_dtype(ref=f['a'].dtype) is not None
+        out = hdf5storage.read(path='/a', filename=filename,
+                               matlab_compatible=False)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    assert_equal(out, data)
+
+
+def test_options():
+    assert not hdf5storage.Options(
+        matlab_compatible=False).ragged_arrays_as_vlen
+    options = hdf5storage.Options()
+    assert not options.ragged_arrays_as_vlen
+    options.ragged_arrays_as_vlen = True
+    assert not options.matlab_compatible
+    options.matlab_compatible = True
+    assert not options.ragged_arrays_as_vlen
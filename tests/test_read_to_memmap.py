@@ -0,0 +1,211 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import os.path
+import tempfile
+import tracemalloc
+
+import numpy as np
+import h5py
+
+from nose.tools import raises
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+import hdf5storage.exceptions
+
+
+def make_data(dtype, shape):
+    data = np.random.RandomState(5).randint(-100, 100, size=shape)
+    if dtype.startswith('datetime64') or dtype.startswith('timedelta64'):
+        return np.array(0, dtype=dtype) \
+            + data.astype('timedelta64[s]')
+    elif dtype == 'complex128':
+        return data + 1j * data[::-1]
+    elif dtype == 'bool':
+        return data > 0
+    return data.astype(dtype)
+
+
+def write_read_to_memmap(data, **keywords):
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, 'data.h5')
+    out_filename = os.path.join(tmpdir, 'data.dat')
+    try:
+        hdf5storage.write(data, path='/a', filename=filename,
+                          **keywords)
+        with hdf5storage.File(filename, writable=False,
+                              **keywords) as f:
+            whole = f.read('/a')
+            out = f.read_to_memmap('/a', out_filename)
+        # The memmap must have been written to its file.
+        on_disk = np.memmap(out_filename, dtype=out.dtype, mode='r',
+                            shape=out.shape)
+        np.testing.assert_array_equal(on_disk, out)
+        del on_disk
+        return whole, np.array(out)
+    finally:
+        for name in (filename, out_filename):
+            if os.path.exists(name):
+                os.remove(name)
+        os.rmdir(tmpdir)
+
+
+def check_same_as_read(dtype, shape, keywords):
+    whole, out = write_read_to_memmap(make_data(dtype, shape),
+                                      **keywords)
+    assert_equal_nose(out.dtype, whole.dtype)
+    assert_equal_nose(out.shape, whole.shape)
+    np.testing.assert_array_equal(out, whole)
+
+
+def test_same_as_read():
+    for dtype in ('bool', 'uint8', 'int32', 'float64', 'complex128',
+                  'datetime64[ms]', 'timedelta64[us]'):
+        for shape in ((100, ), (37, 50), (5, 6, 7)):
+            for keywords in ({'matlab_compatible': True},
+                             {'matlab_compatible': False},
+                             {'matlab_compatible': False,
+                              'reverse_dimension_order': True},
+                             {'matlab_compatible': False,
+                              'store_python_metadata': False},
+                             {'matlab_compatible': True,
+                              'store_python_metadata': False},
+                             {'matlab_compatible': True,
+                              'compress_size_threshold': 0,
+                              'write_memory_budget': 1000},
+                             {'matlab_compatible': True,
+                              'compress_size_threshold': 0,
+                              'scaleoffset_filter': {'int32': 0,
+                                                     'float64': 2},
+                              'write_memory_budget': 100}):
+                yield check_same_as_read, dtype, shape, keywords
+
+
+def test_memmap_written_as_is():
+    # A memmap written without metadata is read as its Dataset.
+    data = make_data('float64', (20, 30))
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, 'data.h5')
+    out_filename = os.path.join(tmpdir, 'data.dat')
+    try:
+        with h5py.File(filename, mode='w') as f:
+            f.create_dataset('a', data=data, chunks=(7, 4),
+                             compression='gzip')
+        with hdf5storage.File(filename, writable=False,
+                              write_memory_budget=64) as f:
+            out = f.read_to_memmap('a', out_filename)
+            assert isinstance(out, np.memmap)
+            np.testing.assert_array_equal(out, data)
+            del out
+    finally:
+        for name in (filename, out_filename):
+            if os.path.exists(name):
+                os.remove(name)
+        os.rmdir(tmpdir)
+
+
+def test_memory_bounded():
+    data = np.random.RandomState(6).rand(500, 2000)
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, 'data.h5')
+    out_filename = os.path.join(tmpdir, 'data.dat')
+    try:
+        for keywords in ({'compress': False}, {'compress': True}):
+            hdf5storage.write(data, path='/a', filename=filename,
+                              matlab_compatible=True, **keywords)
+            with hdf5storage.File(filename, writable=False,
+                                  write_memory_budget=2**20) as f:
+                tracemalloc.start()
+                try:
+                    out = f.read_to_memmap('/a', out_filename)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+            # The memmap is not allocated by Python, so only the blocks
+            # count.
+            assert peak < 2**20
+            np.testing.assert_array_equal(out, data)
+            del out
+    finally:
+        for name in (filename, out_filename):
+            if os.path.exists(name):
+                os.remove(name)
+        os.rmdir(tmpdir)
+
+
+def check_cant_read(data, keywords):
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, 'data.h5')
+    out_filename = os.path.join(tmpdir, 'data.dat')
+    try:
+        hdf5storage.write(data, path='/a', filename=filename,
+                          **keywords)
+        with hdf5storage.File(filename, writable=False) as f:
+            f.read_to_memmap('/a', out_filename)
+    finally:
+        for name in (filename, out_filename):
+            if os.path.exists(name):
+                os.remove(name)
+        os.rmdir(tmpdir)
+
+
+def test_cant_read():
+    for data in (np.array(['abc', 'de']), np.array([b'abc', b'de']),
+                 'abc', 3, [1, 2, 3], {'b': np.arange(3)},
+                 np.zeros((0, 3)), np.zeros((2, ), dtype='f8,i4'),
+                 np.array([1, 'a'], dtype='object')):
+        for keywords in ({'matlab_compatible': True},
+                         {'matlab_compatible': False}):
+            yield raises(hdf5storage.exceptions.CantReadError)(
+                check_cant_read), data, keywords
+
+
+@raises(KeyError)
+def test_missing():
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, 'data.h5')
+    try:
+        hdf5storage.write(1, path='/a', filename=filename)
+        with hdf5storage.File(filename, writable=False) as f:
+            f.read_to_memmap('/b/c', os.path.join(tmpdir, 'data.dat'))
+    finally:
+        os.remove(filename)
+        os.rmdir(tmpdir)
+
+
+@raises(IOError)
+def test_closed():
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, 'data.h5')
+    try:
+        f = hdf5storage.File(filename, writable=True)
+        f.close()
+        f.read_to_memmap('/a', os.path.join(tmpdir, 'data.dat'))
+    finally:
+        os.remove(filename)
+        os.rmdir(tmpdir)
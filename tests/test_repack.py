@@ -0,0 +1,199 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import tempfile
+
+import numpy as np
+import h5py
+
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+import hdf5storage.utilities
+
+from asserts import assert_equal
+
+
+def make_temp_file():
+    fld = tempfile.mkstemp(suffix='.mat')
+    os.close(fld[0])
+    return fld[1]
+
+
+def grow_file(filename, matlab_compatible):
+    # Writes data and then overwrites it several times with data of
+    # different shapes and deletes some, which leaves dead space and
+    # orphaned objects in the Group for references.
+    keywords = {'matlab_compatible': matlab_compatible}
+    if matlab_compatible:
+        keywords['store_python_metadata'] = True
+    hdf5storage.write({'x': np.arange(10.0), 'y': 'abc'}, path='/s',
+                      filename=filename, truncate_existing=True,
+                      **keywords)
+    for i in range(4):
+        data = {'a': [np.random.rand(50, 60 + i), 'abc' * i,
+                      [np.int32(i), np.ones((3, 4))]],
+                'b': np.random.rand(100, 100 + i),
+                'c': np.random.rand(20, 20)}
+        hdf5storage.writes(data, filename=filename, **keywords)
+    with hdf5storage.File(filename, writable=True, **keywords) as f:
+        del f['c']
+    return hdf5storage.reads(['a', 'b', 's'], filename=filename,
+                             **keywords)
+
+
+def check_repack(matlab_compatible, in_place):
+    src = make_temp_file()
+    dst = make_temp_file()
+    try:
+        before = grow_file(src, matlab_compatible)
+        with open(src, 'rb') as f:
+            header = f.read(128)
+        size_before = os.path.getsize(src)
+        if in_place:
+            hdf5storage.repack(src)
+            dst = src
+        else:
+            hdf5storage.repack(src, dst)
+        assert os.path.getsize(dst) < size_before
+        with open(dst, 'rb') as f:
+            assert_equal_nose(header, f.read(128))
+        after = hdf5storage.reads(['a', 'b', 's'], filename=dst,
+                                  matlab_compatible=matlab_compatible)
+        with hdf5storage.File(dst) as f:
+            report = f.storage_report()
+            assert_equal_nose(sorted(['a', 'b', 's']), sorted(f.keys()))
+    finally:
+        for name in set((src, dst)):
+            if os.path.exists(name):
+                os.remove(name)
+    for x, y in zip(before, after):
+        assert_equal(x, y)
+    assert_equal_nose(0, report['unreachable_objects'])
+
+
+def test_repack():
+    for matlab_compatible in (True, False):
+        for in_place in (True, False):
+            yield check_repack, matlab_compatible, in_place
+
+
+def test_repack_keeps_attributes_and_links():
+    src = make_temp_file()
+    dst = make_temp_file()
+    try:
+        with h5py.File(src, mode='w') as f:
+            f.attrs['root'] = np.int16(3)
+            d = f.create_dataset('d', data=np.arange(5))
+            d.attrs.create('vlen', np.array(['x', 'yy'], dtype=object),
+                           dtype=h5py.special_dtype(vlen=str))
+            d.attrs['fixed'] = np.bytes_(b'abc')
+            f.create_group('g').attrs['ga'] = np.float32(1.5)
+            f['g/hard'] = d
+            f['soft'] = h5py.SoftLink('/d')
+            f.create_dataset(
+                'r', data=np.array([d.ref, d.ref, h5py.Reference()],
+                                   dtype=h5py.special_dtype(
+                                   ref=h5py.Reference)))
+        hdf5storage.repack(src, dst)
+        with h5py.File(dst, mode='r') as f:
+            assert_equal_nose(np.int16(3), f.attrs['root'])
+            assert f['d'].attrs.get_id('vlen').get_type() \
+                .is_variable_str()
+            assert_equal_nose(['x', 'yy'], list(f['d'].attrs['vlen']))
+            assert_equal_nose(np.bytes_(b'abc'), f['d'].attrs['fixed'])
+            assert_equal_nose(np.float32(1.5), f['g'].attrs['ga'])
+            assert_equal_nose(h5py.h5o.get_info(f['d'].id).addr,
+                              h5py.h5o.get_info(f['g/hard'].id).addr)
+            assert_equal_nose('/d', f.get('soft', getlink=True).path)
+            refs = f['r'][...]
+            assert_equal_nose('/d', f[refs[0]].name)
+            assert_equal_nose('/d', f[refs[1]].name)
+            assert not refs[2]
+            assert '#refs#' not in f
+    finally:
+        for name in (src, dst):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def test_repack_in_place_keeps_mode():
+    src = make_temp_file()
+    try:
+        hdf5storage.write(np.arange(10), path='/a', filename=src,
+                          truncate_existing=True)
+        for mode in (0o644, 0o640):
+            os.chmod(src, mode)
+            hdf5storage.repack(src)
+            assert_equal_nose(mode, os.stat(src).st_mode & 0o7777)
+    finally:
+        if os.path.exists(src):
+            os.remove(src)
+
+
+def test_repack_drops_orphans():
+    src = make_temp_file()
+    dst = make_temp_file()
+    try:
+        hdf5storage.write([1, 'a', [2.0]], path='/a', filename=src,
+                          truncate_existing=True, matlab_compatible=False)
+        hdf5storage.write(3, path='/a', filename=src,
+                          matlab_compatible=False)
+        with h5py.File(src, mode='r') as f:
+            assert len(f['#refs#']) > 1
+        hdf5storage.repack(src, dst)
+        with h5py.File(dst, mode='r') as f:
+            assert_equal_nose(['a'], list(f['#refs#']))
+        assert_equal_nose(3, hdf5storage.read('/a', filename=dst,
+                                              matlab_compatible=False))
+    finally:
+        for name in (src, dst):
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def test_repack_recompress():
+    src = make_temp_file()
+    dst = make_temp_file()
+    data = {'a': np.zeros((200, 200)), 'b': [np.zeros((100, 100))]}
+    try:
+        hdf5storage.writes(data, filename=src, truncate_existing=True,
+                           compress=False, matlab_compatible=False)
+        hdf5storage.repack(src, dst, recompress=True, compress=True,
+                           compression_algorithm='lzf',
+                           matlab_compatible=False)
+        with h5py.File(dst, mode='r') as f:
+            assert_equal_nose('lzf', f['a'].compression)
+            assert_equal_nose('lzf', f[f['b'][0]].compression)
+        out = hdf5storage.reads(['a', 'b'], filename=dst,
+                                matlab_compatible=False)
+    finally:
+        for name in (src, dst):
+            if os.path.exists(name):
+                os.remove(name)
+    assert_equal(data['a'], out[0])
+    assert_equal(data['b'], out[1])
@@ -0,0 +1,149 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import os.path
+import tempfile
+import threading
+
+import numpy as np
+
+from nose.tools import raises
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+from hdf5storage.exceptions import TypeNotMatlabCompatibleError
+
+
+def make_items(dirname, number):
+    return [(os.path.join(dirname, 'data' + str(i)),
+             {'a': np.arange(i + 1, dtype='float64'), 'b': str(i)})
+            for i in range(number)]
+
+
+def check_items(items):
+    for i, (filename, mdict) in enumerate(items):
+        out = hdf5storage.loadmat(filename + '.mat')
+        np.testing.assert_equal(out['a'], mdict['a'])
+        assert_equal_nose(out['b'], mdict['b'])
+
+
+def test_serial():
+    with tempfile.TemporaryDirectory() as dirname:
+        items = make_items(dirname, 5)
+        errors = hdf5storage.savemat_many(items, workers=1)
+        assert_equal_nose(errors, [None] * 5)
+        check_items(items)
+
+
+def test_parallel():
+    with tempfile.TemporaryDirectory() as dirname:
+        items = make_items(dirname, 7)
+        errors = hdf5storage.savemat_many(items, workers=3)
+        assert_equal_nose(errors, [None] * 7)
+        check_items(items)
+
+
+def test_empty():
+    assert_equal_nose(hdf5storage.savemat_many([], workers=2), [])
+
+
+def test_options_keywords():
+    with tempfile.TemporaryDirectory() as dirname:
+        items = make_items(dirname, 2)
+        errors = hdf5storage.savemat_many(items, workers=2,
+                                          compress=False)
+        assert_equal_nose(errors, [None] * 2)
+        check_items(items)
+        f = hdf5storage.File(items[0][0] + '.mat')
+        try:
+            assert f._file['a'].compression is None
+        finally:
+            f.close()
+
+
+def test_errors_do_not_abort_batch():
+    for workers in (1, 2):
+        with tempfile.TemporaryDirectory() as dirname:
+            items = make_items(dirname, 4)
+            items[1] = (items[1][0], {'a': np.float16([1, 2])})
+            items[2] = (os.path.join(dirname, 'missing', 'data'),
+                        items[2][1])
+            errors = hdf5storage.savemat_many(items, workers=workers)
+            assert_equal_nose(errors[0], None)
+            assert isinstance(errors[1], TypeNotMatlabCompatibleError)
+            assert isinstance(errors[2], Exception)
+            assert_equal_nose(errors[3], None)
+            check_items([items[0], items[3]])
+
+
+class ExitOnUnpickle(object):
+    # Kills the worker process that unpickles it.
+    def __reduce__(self):
+        return (os._exit, (1, ))
+
+
+def test_unpicklable_and_dead_worker_do_not_abort_batch():
+    with tempfile.TemporaryDirectory() as dirname:
+        items = make_items(dirname, 12)
+        items[1] = (items[1][0], {'b': threading.Lock()})
+        items[5] = (items[5][0], {'b': ExitOnUnpickle()})
+        errors = hdf5storage.savemat_many(iter(items), workers=2)
+        assert_equal_nose(len(errors), 12)
+        assert isinstance(errors[1], Exception)
+        assert isinstance(errors[5], Exception)
+        # Files waiting in the pool when the worker died fail with it,
+        # but a new pool writes the ones after them.
+        assert_equal_nose(errors[0], None)
+        assert_equal_nose(errors[-1], None)
+        check_items([x for x, error in zip(items, errors)
+                     if error is None])
+
+
+def test_items_taken_lazily():
+    with tempfile.TemporaryDirectory() as dirname:
+        items = make_items(dirname, 20)
+        taken = []
+
+        def generate():
+            # Only a few files per worker can be waiting, so the ones
+            # well before each one taken must be written already.
+            for i, x in enumerate(items):
+                if i >= 8:
+                    assert os.path.exists(items[i - 8][0] + '.mat')
+                taken.append(i)
+                yield x
+
+        errors = hdf5storage.savemat_many(generate(), workers=2)
+        assert_equal_nose(errors, [None] * 20)
+        assert_equal_nose(taken, list(range(20)))
+        check_items(items)
+
+
+@raises(TypeError)
+def test_marshaller_collection_rejected():
+    hdf5storage.savemat_many(
+        [], marshaller_collection=hdf5storage.MarshallerCollection())
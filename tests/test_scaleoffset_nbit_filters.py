@@ -0,0 +1,231 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import tempfile
+
+import numpy as np
+import h5py
+
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+import hdf5storage.utilities
+
+from asserts import assert_equal
+
+
+def write_and_read(data, **keywords):
+    # Writes the data, reads it back, and gets the filters that were
+    # used on the Dataset and the precision of its datatype.
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          truncate_existing=True, **keywords)
+        out = hdf5storage.read(path='/a', filename=filename, **keywords)
+        with h5py.File(filename, mode='r') as f:
+            d = f['a']
+            dcpl = d.id.get_create_plist()
+            filters = [dcpl.get_filter(i)[0]
+                       for i in range(dcpl.get_nfilters())]
+            precision = d.id.get_type().get_precision()
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    return out, filters, precision
+
+
+def check_scaleoffset_int(dtype, bits, matlab_compatible):
+    data = np.random.randint(-100, 100, size=(50, 40)).astype(dtype)
+    out, filters, _ = write_and_read(
+        data, matlab_compatible=matlab_compatible,
+        scaleoffset_filter={dtype: bits})
+    assert_equal(out, data)
+    assert_equal_nose(h5py.h5z.FILTER_SCALEOFFSET, filters[0])
+    assert h5py.h5z.FILTER_FLETCHER32 not in filters
+
+
+def check_scaleoffset_float(dtype, digits, matlab_compatible):
+    data = np.random.uniform(-1000, 1000, size=(50, 40)).astype(dtype)
+    out, filters, _ = write_and_read(
+        data, matlab_compatible=matlab_compatible,
+        scaleoffset_filter={dtype: digits})
+    assert_equal_nose(data.dtype, out.dtype)
+    assert_equal_nose(data.shape, out.shape)
+    assert np.all(np.abs(out - data) <= 10.0**(-digits))
+    assert_equal_nose(h5py.h5z.FILTER_SCALEOFFSET, filters[0])
+
+
+def check_nbit(dtype, bits, matlab_compatible):
+    info = np.iinfo(dtype)
+    low = max(info.min, -2**(bits - 1))
+    high = min(info.max, 2**(bits - 1) - 1) if info.min < 0 \
+        else min(info.max, 2**bits - 1)
+    data = np.random.randint(low, high + 1,
+                             size=(50, 40)).astype(dtype)
+    data.flat[0] = low
+    data.flat[1] = high
+    out, filters, precision = write_and_read(
+        data, matlab_compatible=matlab_compatible,
+        nbit_filter={dtype: bits})
+    assert_equal(out, data)
+    assert_equal_nose(h5py.h5z.FILTER_NBIT, filters[0])
+    assert_equal_nose(bits, precision)
+
+
+def test_scaleoffset_int():
+    for dtype in ('int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32',
+                  'int64', 'uint64'):
+        for bits in (0, 7, 8):
+            for matlab_compatible in (True, False):
+                yield check_scaleoffset_int, dtype, bits, matlab_compatible
+
+
+def test_scaleoffset_float():
+    for dtype in ('float32', 'float64'):
+        for digits in (0, 2):
+            for matlab_compatible in (True, False):
+                yield check_scaleoffset_float, dtype, digits, \
+                    matlab_compatible
+
+
+def test_nbit():
+    for dtype, bits in (('int8', 5), ('uint8', 3), ('int16', 12),
+                        ('uint16', 12), ('int32', 17), ('uint32', 24),
+                        ('int64', 40), ('uint64', 33)):
+        for matlab_compatible in (True, False):
+            yield check_nbit, dtype, bits, matlab_compatible
+
+
+def test_nbit_with_compression():
+    data = np.random.randint(-2048, 2048, size=(200, 100)).astype('int16')
+    out, filters, precision = write_and_read(
+        data, compress=True, compress_size_threshold=0,
+        shuffle_filter=True, compressed_fletcher32_filter=True,
+        nbit_filter={'int16': 12})
+    assert_equal(out, data)
+    assert_equal_nose([h5py.h5z.FILTER_NBIT, h5py.h5z.FILTER_SHUFFLE,
+                       h5py.h5z.FILTER_DEFLATE,
+                       h5py.h5z.FILTER_FLETCHER32], filters)
+    assert_equal_nose(12, precision)
+
+
+def test_nbit_data_too_big():
+    data = np.array([0, 5000, -3], dtype='int16')
+    out, filters, precision = write_and_read(data,
+                                             nbit_filter={'int16': 12})
+    assert_equal(out, data)
+    assert h5py.h5z.FILTER_NBIT not in filters
+    assert_equal_nose(16, precision)
+
+
+def test_scaleoffset_int_data_too_big():
+    data = np.array([0, 5000, -3], dtype='int16')
+    out, filters, _ = write_and_read(data,
+                                     scaleoffset_filter={'int16': 4})
+    assert_equal(out, data)
+    assert_equal_nose([h5py.h5z.FILTER_SCALEOFFSET], filters)
+
+
+def test_scaleoffset_float_not_finite():
+    data = np.array([0.5, np.nan, np.inf, -1.25])
+    out, filters, _ = write_and_read(data,
+                                     scaleoffset_filter={'float64': 1})
+    assert_equal(out, data)
+    assert h5py.h5z.FILTER_SCALEOFFSET not in filters
+
+
+def test_no_rule_for_dtype():
+    data = np.arange(100, dtype='int32')
+    out, filters, _ = write_and_read(data,
+                                     scaleoffset_filter={'int16': 0},
+                                     nbit_filter={'uint32': 20})
+    assert_equal(out, data)
+    assert_equal_nose([], filters)
+
+
+def test_scaleoffset_takes_precedence():
+    data = np.arange(100, dtype='int16')
+    out, filters, _ = write_and_read(data,
+                                     scaleoffset_filter={'int16': 0},
+                                     nbit_filter={'int16': 12})
+    assert_equal(out, data)
+    assert_equal_nose([h5py.h5z.FILTER_SCALEOFFSET], filters)
+
+
+def test_overwrite_changes_filters():
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        data = np.arange(100, dtype='int16')
+        hdf5storage.write(data, path='/a', filename=filename,
+                          truncate_existing=True,
+                          nbit_filter={'int16': 12})
+        hdf5storage.write(data, path='/a', filename=filename,
+                          nbit_filter={'int16': 10})
+        with h5py.File(filename, mode='r') as f:
+            assert_equal_nose(10, f['a'].id.get_type().get_precision())
+        hdf5storage.write(data, path='/a', filename=filename)
+        with h5py.File(filename, mode='r') as f:
+            assert_equal_nose(16, f['a'].id.get_type().get_precision())
+            assert_equal_nose(0, f['a'].id.get_create_plist().get_nfilters())
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+
+
+def test_options_normalize_rules():
+    options = hdf5storage.Options(
+        scaleoffset_filter={np.int32: 0, np.dtype('>f8'): 3},
+        nbit_filter={'u2': 12})
+    assert_equal_nose({'int32': 0, 'float64': 3},
+                      options.scaleoffset_filter)
+    assert_equal_nose({'uint16': 12}, options.nbit_filter)
+    assert options.matlab_compatible
+
+
+def test_options_invalid_rules_ignored():
+    for rules in ({'float16': 2}, {'complex128': 2}, {'int8': 9},
+                  {'int16': -1}, {'int16': 2.0}, {'int16': True},
+                  {'notadtype': 3}, [('int16', 3)]):
+        options = hdf5storage.Options(scaleoffset_filter=rules,
+                                      nbit_filter=rules)
+        assert_equal_nose({}, options.scaleoffset_filter)
+        assert_equal_nose({}, options.nbit_filter)
+    for rules in ({'float32': 2}, {'uint8': 0}):
+        options = hdf5storage.Options(nbit_filter=rules)
+        assert_equal_nose({}, options.nbit_filter)
+
+
+def test_options_rules_are_copied():
+    options = hdf5storage.Options(nbit_filter={'int16': 12})
+    options.nbit_filter['int32'] = 20
+    assert_equal_nose({'int16': 12}, options.nbit_filter)
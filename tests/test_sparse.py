@@ -0,0 +1,166 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import collections
+import os
+import os.path
+import tempfile
+
+import numpy as np
+import scipy.sparse
+import h5py
+
+from nose.tools import raises, assert_equal as assert_equal_nose
+
+import hdf5storage
+import hdf5storage.exceptions
+import hdf5storage.Marshallers
+
+
+def make_sparse(dtype='float64', fmt='csc', shape=(30, 20)):
+    data = scipy.sparse.random(shape[0], shape[1], density=0.2,
+                               format='csc', random_state=0)
+    data = (10 * data).astype(dtype)
+    if np.dtype(dtype).kind == 'c':
+        data = data + 1j * data
+    return data.asformat(fmt)
+
+
+def assert_sparse_equal(a, b):
+    assert_equal_nose(type(a), type(b))
+    assert_equal_nose(a.dtype, b.dtype)
+    assert_equal_nose(a.shape, b.shape)
+    assert_equal_nose((a != b).nnz, 0)
+
+
+def write_readback(data, matlab_compatible=True, **keywords):
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          matlab_compatible=matlab_compatible,
+                          **keywords)
+        with h5py.File(filename, mode='r') as f:
+            attrs = dict(f['a'].attrs)
+            names = sorted(f['a'])
+        out = hdf5storage.read(path='/a', filename=filename,
+                               matlab_compatible=matlab_compatible)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    return attrs, names, out
+
+
+def check_readback(dtype, fmt, matlab_compatible):
+    data = make_sparse(dtype, fmt)
+    attrs, names, out = write_readback(data, matlab_compatible)
+    assert_equal_nose(names, ['data', 'ir', 'jc'])
+    assert_equal_nose(attrs['MATLAB_sparse'], data.shape[0])
+    assert_sparse_equal(out, data)
+
+
+def test_readback():
+    for fmt in ('bsr', 'coo', 'csc', 'csr', 'dia', 'dok', 'lil'):
+        for dtype in ('bool', 'float64', 'complex128'):
+            yield check_readback, dtype, fmt, True
+        for dtype in ('bool', 'uint8', 'int32', 'float32', 'float64',
+                      'complex64'):
+            yield check_readback, dtype, fmt, False
+
+
+def test_matlab_layout():
+    data = make_sparse()
+    attrs, names, out = write_readback(data)
+    assert_equal_nose(attrs['MATLAB_class'], b'double')
+    attrs, names, out = write_readback(data > 5)
+    assert_equal_nose(attrs['MATLAB_class'], b'logical')
+
+
+def test_empty():
+    for shape in ((0, 0), (4, 0), (0, 3), (5, 6)):
+        data = scipy.sparse.csc_matrix(shape)
+        attrs, names, out = write_readback(data)
+        assert_equal_nose(names, ['jc'])
+        assert_sparse_equal(out, data)
+        attrs, names, out = write_readback(data.astype('int8'), False)
+        assert_equal_nose(names, ['data', 'ir', 'jc'])
+        assert_sparse_equal(out, data.astype('int8'))
+
+
+def test_duplicates_and_unsorted():
+    data = scipy.sparse.coo_matrix(
+        ([1.0, 2.0, 3.0], ([2, 0, 2], [1, 1, 1])), shape=(3, 2))
+    attrs, names, out = write_readback(data)
+    assert_sparse_equal(out, data.tocsc().tocoo())
+    np.testing.assert_equal(out.toarray(), data.toarray())
+
+
+def test_in_dict_and_list():
+    data = {'a': make_sparse(), 'b': [make_sparse('bool'), 2]}
+    attrs, names, out = write_readback(data)
+    assert_sparse_equal(out['a'], data['a'])
+    assert_sparse_equal(out['b'][0], data['b'][0])
+
+
+def test_read_matlab_written():
+    # MATLAB doesn't write Python.Type and can allocate more space for
+    # the values and row indices than there are non-zero elements.
+    data = make_sparse()
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        with h5py.File(filename, mode='w') as f:
+            grp = f.create_group('a')
+            grp.create_dataset('data', data=np.concatenate(
+                [data.data, np.zeros(5)]))
+            grp.create_dataset('ir', data=np.concatenate(
+                [data.indices, np.zeros(5)]).astype('uint64'))
+            grp.create_dataset('jc', data=data.indptr.astype('uint64'))
+            grp.attrs['MATLAB_class'] = np.bytes_(b'double')
+            grp.attrs['MATLAB_sparse'] = np.uint64(data.shape[0])
+        out = hdf5storage.read(path='/a', filename=filename)
+        options = hdf5storage.Options()
+        with h5py.File(filename, mode='r') as f:
+            m = hdf5storage.Marshallers.ScipySparseMatrixMarshaller()
+            attributes = collections.defaultdict(type(None),
+                                                 f['a'].attrs.items())
+            approx = m.read_approximate(f, f['a'], attributes, options)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    assert_sparse_equal(out, data)
+    assert_equal_nose(type(approx), np.ndarray)
+    np.testing.assert_equal(approx, data.toarray())
+
+
+@raises(hdf5storage.exceptions.TypeNotMatlabCompatibleError)
+def test_matlab_incompatible_dtype():
+    write_readback(make_sparse('int32'),
+                   action_for_matlab_incompatible='error')
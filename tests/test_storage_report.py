@@ -0,0 +1,110 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import tempfile
+
+import numpy as np
+
+from nose.tools import raises, assert_equal as assert_equal_nose
+
+import hdf5storage
+
+
+def make_report(mdict, overwrite=None, path='/'):
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.writes(mdict, filename=filename,
+                           truncate_existing=True,
+                           matlab_compatible=True)
+        if overwrite is not None:
+            hdf5storage.writes(overwrite, filename=filename,
+                               matlab_compatible=True)
+        with hdf5storage.File(filename) as f:
+            report = f.storage_report(path)
+        file_size = os.path.getsize(filename)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    return report, file_size
+
+
+def test_variables():
+    data = np.zeros((10000, ), dtype='float64')
+    report, file_size = make_report({'a': data, 'b': [1, 'b', data]})
+    assert_equal_nose(set(['/a', '/b']), set(report['variables']))
+    a = report['variables']['/a']
+    assert_equal_nose(data.nbytes, a['logical_bytes'])
+    assert 0 < a['storage_bytes'] < data.nbytes
+    assert a['compression_ratio'] > 1
+    assert_equal_nose(1, a['objects'])
+    assert_equal_nose(0, a['referenced_objects'])
+    assert a['header_bytes'] > a['attribute_bytes'] > 0
+    b = report['variables']['/b']
+    assert_equal_nose(3, b['referenced_objects'])
+    assert_equal_nose(4, b['objects'])
+    assert b['logical_bytes'] > data.nbytes
+    assert_equal_nose(file_size, report['file_size'])
+    assert_equal_nose(512, report['userblock_size'])
+    assert_equal_nose(0, report['unreachable_objects'])
+    assert_equal_nose(0, report['unreachable_bytes'])
+    assert report['other_bytes'] >= 0
+
+
+def test_scalar_and_str():
+    # Their Python.Shape Attributes are empty, which take no space.
+    report, file_size = make_report({'c': 3, 'd': 'abc',
+                                     'e': {'a': [1, 2], 'b': 'x'}})
+    assert_equal_nose(set(['/c', '/d', '/e']), set(report['variables']))
+    for v in report['variables'].values():
+        assert v['header_bytes'] > v['attribute_bytes'] > 0
+    assert_equal_nose(8, report['variables']['/c']['logical_bytes'])
+    assert_equal_nose(6, report['variables']['/d']['logical_bytes'])
+
+
+def test_unreachable():
+    report, file_size = make_report({'a': [1, 2, 3]},
+                                    overwrite={'a': 1})
+    assert_equal_nose(['/a'], list(report['variables']))
+    assert report['unreachable_objects'] >= 3
+    assert report['unreachable_bytes'] > 0
+
+
+def test_path():
+    report, file_size = make_report({'a': {'b': 1, 'c': 'd'}, 'e': 2},
+                                    path='/a')
+    assert_equal_nose(set(['/a/b', '/a/c']), set(report['variables']))
+    report, file_size = make_report({'a': {'b': 1, 'c': 'd'}, 'e': 2},
+                                    path='/e')
+    assert_equal_nose(['/e'], list(report['variables']))
+
+
+@raises(KeyError)
+def test_missing_path():
+    make_report({'a': 1}, path='/b')
@@ -0,0 +1,172 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import collections
+import os
+import os.path
+import tempfile
+
+import numpy as np
+import h5py
+
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+
+from asserts import assert_equal
+
+
+strs = ['a', 'bc', '', 'h\xe9llo', '\U0001F600', 'x' * 1000]
+
+
+def write_readback(data, **keywords):
+    keywords = dict({'str_collections_as_vlen': True}, **keywords)
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          matlab_compatible=False, **keywords)
+        with h5py.File(filename, mode='r') as f:
+            vlen = None
+            if isinstance(f['a'], h5py.Dataset):
+                vlen = h5py.check_dtype(vlen=f['a'].dtype)
+            number_refs = len(f.get('/#refs#', ()))
+        out = hdf5storage.read(path='/a', filename=filename,
+                               matlab_compatible=False, **keywords)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    return vlen, number_refs, out
+
+
+def check_vlen(data):
+    vlen, number_refs, out = write_readback(data)
+    assert vlen is str
+    assert_equal_nose(number_refs, 0)
+    assert_equal(out, data)
+    if isinstance(out, np.ndarray):
+        out = out.flat
+    assert all([type(x) == str for x in out])
+
+
+def test_vlen():
+    for tp in (list, tuple, set, frozenset, collections.deque):
+        yield check_vlen, tp(strs)
+    obj = np.empty((2, 3), dtype='object')
+    obj.flat[:] = strs
+    yield check_vlen, obj
+
+
+def test_vlen_many():
+    data = ['label' + str(i) for i in range(100000)]
+    vlen, number_refs, out = write_readback(data)
+    assert vlen is str
+    assert_equal_nose(number_refs, 0)
+    assert_equal_nose(out, data)
+    assert all([isinstance(x, str) for x in out])
+
+
+def test_vlen_filters():
+    # The data is bigger than compress_size_threshold, and HDF5 doesn't
+    # allow the fletcher32 filter (on by default) on variable length
+    # types.
+    data = ['label' + str(i) for i in range(10000)]
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          matlab_compatible=False,
+                          str_collections_as_vlen=True)
+        with h5py.File(filename, mode='r') as f:
+            assert h5py.check_dtype(vlen=f['a'].dtype) is str
+            assert_equal_nose(f['a'].compression, 'gzip')
+            assert not f['a'].fletcher32
+        out = hdf5storage.read(path='/a', filename=filename,
+                               matlab_compatible=False)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    assert_equal_nose(out, data)
+
+
+def test_vlen_in_dict():
+    data = {'a': list(strs), 'b': tuple(strs[:2])}
+    vlen, number_refs, out = write_readback(data)
+    assert_equal_nose(number_refs, 0)
+    assert_equal(out, data)
+
+
+def check_not_vlen(data, keywords):
+    vlen, number_refs, out = write_readback(data, **keywords)
+    assert vlen is None
+    assert number_refs != 0
+    assert_equal(out, data)
+
+
+def test_not_vlen():
+    datas = [['a', 'b\x00c'],
+             ['a', np.unicode_('b')],
+             ['a', b'b'],
+             ['a', 1]]
+    for data in datas:
+        yield check_not_vlen, data, {}
+    yield check_not_vlen, list(strs), {'str_collections_as_vlen': False}
+
+
+def test_not_vlen_by_default():
+    # Older versions read them back as bytes, so they must be asked
+    # for.
+    data = list(strs)
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          matlab_compatible=False)
+        with h5py.File(filename, mode='r') as f:
+            assert h5py.check_dtype(ref=f['a'].dtype) is not None
+        out = hdf5storage.read(path='/a', filename=filename,
+                               matlab_compatible=False)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    assert_equal(out, data)
+
+
+def test_options():
+    assert not hdf5storage.Options(
+        matlab_compatible=False).str_collections_as_vlen
+    options = hdf5storage.Options()
+    assert not options.str_collections_as_vlen
+    options.str_collections_as_vlen = True
+    assert not options.matlab_compatible
+    options.matlab_compatible = True
+    assert not options.str_collections_as_vlen
@@ -30,6 +30,7 @@ import numpy as np
 
 import hdf5storage.utilities as utils
 
+from nose.tools import raises
 from nose.tools import assert_equal as assert_equal_nose
 
 from asserts import assert_equal
@@ -78,3 +79,82 @@ def test_numpy_str_someunicode_to_uint32_back():
         assert_equal_nose(intermed.tostring(), data.tostring())
         assert_equal_nose(out.tostring(), data.tostring())
         assert_equal(out, data)
+
+
+# Arrays of strings, with some shorter than the width and some with
+# characters that aren't ASCII or need a UTF-16 doublet, which are
+# converted all at once or element by element respectively.
+str_arrays = [np.array(['ab', 'cde', '']),
+              np.array([['ab', 'c'], ['d', 'efgh']]),
+              np.array(['a\x00b', 'c']),
+              np.array(['ab', str_unicode[-5:]]),
+              np.array([[str_unicode[-3:], 'x'], ['\U0001F600', 'y']]),
+              np.array(['a\U0001F600\u0100', '\U0001F600\U0001F601'])]
+
+
+def test_numpy_str_array_to_uint32_back():
+    for data in str_arrays:
+        intermed = utils.convert_numpy_str_to_uint32(data)
+        out = utils.convert_to_numpy_str(
+            intermed, length=data.dtype.itemsize // 4)
+        assert_equal_nose(out.dtype, data.dtype)
+        assert_equal(out, data)
+
+
+def test_numpy_str_array_to_uint16_back():
+    for data in str_arrays:
+        intermed = utils.convert_numpy_str_to_uint16(data)
+        expected = np.char.encode(data, 'UTF-16LE')
+        assert_equal_nose(intermed.shape[-1],
+                          data.shape[-1] * expected.dtype.itemsize // 2)
+        out = utils.convert_to_numpy_str(
+            intermed, length=expected.dtype.itemsize // 2)
+        assert_equal_nose(out.tolist(), data.tolist())
+
+
+def test_uint_array_non_native_to_numpy_str():
+    data = np.array([['ab', 'c'], ['d', 'efgh']])
+    intermed = utils.convert_numpy_str_to_uint32(data)
+    for dt in ('<u4', '>u4', '<u2', '>u2'):
+        out = utils.convert_to_numpy_str(intermed.astype(dt), length=4)
+        assert_equal(out, data)
+        out = utils.convert_to_numpy_str(
+            intermed.astype(dt).T.copy().T, length=4)
+        assert_equal(out, data)
+
+
+def test_uint8_array_to_numpy_str():
+    data = np.array(['ab', 'é', ''])
+    intermed = np.frombuffer(
+        np.char.encode(data, 'UTF-8').astype('S4').tostring(),
+        dtype='uint8')
+    out = utils.convert_to_numpy_str(intermed, length=4)
+    assert_equal(out, data)
+
+
+def test_numpy_str_array_to_numpy_bytes():
+    for data in str_arrays:
+        out = utils.convert_to_numpy_bytes(data)
+        assert_equal_nose(out.dtype, np.dtype('S' + str(
+            data.dtype.itemsize)))
+        assert_equal_nose(out.tolist(),
+                          np.char.encode(data, 'UTF-8').tolist())
+
+
+def test_uint_array_to_numpy_bytes():
+    data = np.array([[b'ab', b'c'], [b'd', b'efgh']])
+    intermed = np.frombuffer(data.tostring(), dtype='uint8').reshape(
+        2, 8)
+    for dt in ('uint8', '<u2', '>u2', '<u4', '>u4'):
+        out = utils.convert_to_numpy_bytes(intermed.astype(dt),
+                                           length=4)
+        assert_equal(out, data)
+        out = utils.convert_to_numpy_bytes(
+            intermed.astype(dt).T.copy().T, length=4)
+        assert_equal(out, data)
+
+
+@raises(UnicodeDecodeError)
+def test_uint16_lone_surrogate_to_numpy_str():
+    utils.convert_to_numpy_str(np.uint16([[0xD800, 97], [98, 99]]),
+                               length=2)
@@ -0,0 +1,138 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import os
+import os.path
+import tempfile
+
+import numpy as np
+import h5py
+
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+
+from asserts import assert_equal
+
+
+# Strings and arrays of them (ASCII, not ASCII, and with nulls inside
+# and at the ends) that are written as UTF-8 when the
+# convert_numpy_str_to_utf8 option is set.
+datas = [np.unicode_('abcdefghijklmnopqrstuvwxyz'),
+         np.unicode_('h\xe9llo \U0001F600'),
+         'a python str',
+         np.array('abc'),
+         np.array(['ab', 'cdefgh', '']),
+         np.array([['\xe9', 'x'], ['\U0001F600', 'yy']], dtype='U7'),
+         np.array([['a\x00b', 'c'], ['d', 'e']]),
+         np.array(['a', 'b'], dtype='U20')]
+
+
+def write_readback(data, **keywords):
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          matlab_compatible=False,
+                          convert_numpy_str_to_utf8=True, **keywords)
+        with h5py.File(filename, mode='r') as f:
+            stored = None
+            if isinstance(f['a'], h5py.Dataset) \
+                    and f['a'].dtype.kind == 'S':
+                stored = (f['a'].dtype,
+                          f['a'].id.get_type().get_cset())
+        out = hdf5storage.read(path='/a', filename=filename,
+                               matlab_compatible=False, **keywords)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    return stored, out
+
+
+def check_utf8(data, keywords):
+    stored, out = write_readback(data, **keywords)
+    assert_equal_nose(stored[0].kind, 'S')
+    assert_equal_nose(stored[1], h5py.h5t.CSET_UTF8)
+    encoded = np.char.encode(np.atleast_1d(data), 'UTF-8')
+    assert_equal_nose(stored[0].itemsize, encoded.dtype.itemsize)
+    assert_equal(out, data)
+
+
+def test_utf8():
+    for data in datas:
+        for keywords in ({}, {'reverse_dimension_order': True},
+                         {'compress': False}):
+            yield check_utf8, data, keywords
+
+
+def test_empty_not_utf8():
+    for data in (np.unicode_(''), np.array([], dtype='U3')):
+        stored, out = write_readback(data)
+        assert stored is None
+        assert_equal(out, data)
+
+
+def test_in_containers():
+    data = {'a': ['xy', np.array(['a', '\xe9'])],
+            'b': np.array([np.unicode_('p'), np.unicode_('qr')],
+                          dtype='object')}
+    stored, out = write_readback(data)
+    assert_equal(out, data)
+
+
+def test_smaller_than_utf32():
+    data = np.array(['label' + str(i) for i in range(1000)], dtype='U20')
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        sizes = []
+        for utf8 in (False, True):
+            hdf5storage.write(data, path='/a', filename=filename,
+                              truncate_existing=True,
+                              matlab_compatible=False, compress=False,
+                              convert_numpy_str_to_utf8=utf8)
+            with h5py.File(filename, mode='r') as f:
+                sizes.append(f['a'].id.get_storage_size())
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    assert sizes[1] * 4 < sizes[0]
+
+
+def test_matlab_compatible_turns_off():
+    options = hdf5storage.Options(matlab_compatible=False,
+                                  convert_numpy_str_to_utf8=True)
+    assert options.convert_numpy_str_to_utf8
+    assert not options.matlab_compatible
+    options.matlab_compatible = True
+    assert not options.convert_numpy_str_to_utf8
+    options.convert_numpy_str_to_utf8 = True
+    assert not options.matlab_compatible
+    assert not hdf5storage.Options().convert_numpy_str_to_utf8
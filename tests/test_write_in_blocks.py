@@ -0,0 +1,232 @@
+# Copyright (c) 2020, Freja Nordsiek
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+import itertools
+import os
+import os.path
+import tempfile
+import tracemalloc
+
+import numpy as np
+import h5py
+
+from nose.tools import assert_equal as assert_equal_nose
+
+import hdf5storage
+from hdf5storage.utilities import get_array_blocks
+
+
+def check_blocks(shape, order, max_bytes, chunks):
+    data = np.zeros(shape, dtype='float64', order=order)
+    blocks = get_array_blocks(data.shape, data.strides,
+                              data.dtype.itemsize, max_bytes,
+                              chunks=chunks)
+    # Every element must be in exactly one block.
+    for index in blocks:
+        data[index] += 1
+    assert np.all(data == 1)
+    # The blocks must fit if a chunk does, and each chunk must be in a
+    # single block.
+    if chunks is None:
+        units = (1, ) * len(shape)
+    else:
+        units = [min(c, n) for c, n in zip(chunks, shape)]
+    for index in blocks:
+        block = data[index]
+        if 8 * np.prod(units) <= max_bytes:
+            assert block.nbytes <= max_bytes
+        for s, n, unit in zip(index, shape, units):
+            start, stop, step = s.indices(n)
+            assert start % unit == 0
+            assert stop % unit == 0 or stop == n
+
+
+def test_get_array_blocks():
+    for shape, order, max_bytes, chunks in itertools.product(
+            ((1000, ), (37, 51), (5, 6, 7), (1, 300, 2)), 'CF',
+            (8, 100, 1000, 10**6), (None, 'auto')):
+        if chunks == 'auto':
+            chunks = h5py.filters.guess_chunk(shape, None, 8)
+        yield check_blocks, shape, order, max_bytes, chunks
+
+
+def test_get_array_blocks_sequential():
+    # The blocks of a transposed C ordered array must be sequential in
+    # the original.
+    data = np.arange(30 * 20).reshape(30, 20)
+    blocks = get_array_blocks(data.T.shape, data.T.strides,
+                              data.itemsize, 5 * 20 * data.itemsize)
+    assert_equal_nose(len(blocks), 6)
+    for i, index in enumerate(blocks):
+        np.testing.assert_array_equal(data.T[index].T,
+                                      data[5 * i:5 * (i + 1)])
+
+
+def test_get_array_blocks_scalar_empty():
+    assert_equal_nose(get_array_blocks((), (), 8, 1), [()])
+    assert_equal_nose(get_array_blocks((0, 3), (24, 8), 8, 1),
+                      [(slice(None), slice(None))])
+
+
+def write_readback(data, **keywords):
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        hdf5storage.write(data, path='/a', filename=filename,
+                          **keywords)
+        with h5py.File(filename, mode='r') as f:
+            stored = f['a'][...]
+            attrs = dict(f['a'].attrs)
+            filters = (f['a'].compression, f['a'].shuffle,
+                       f['a'].fletcher32, f['a'].scaleoffset)
+        out = hdf5storage.read(path='/a', filename=filename,
+                               **keywords)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    return stored, attrs, filters, out
+
+
+def make_data(dtype):
+    data = np.random.RandomState(3).randint(-100, 100, size=(37, 50))
+    if dtype.startswith('datetime64'):
+        return np.datetime64('2020-02-03T04:05:06', 'ms') \
+            + data.astype('timedelta64[s]')
+    elif dtype == 'complex128':
+        return data + 1j * data[::-1]
+    elif dtype == 'bool':
+        return data > 0
+    return data.astype(dtype)
+
+
+def check_same_as_whole(dtype, keywords):
+    data = make_data(dtype)
+    whole = write_readback(data, **keywords)
+    blocked = write_readback(data, write_memory_budget=1000, **keywords)
+    np.testing.assert_array_equal(blocked[0], whole[0])
+    assert_equal_nose(blocked[0].dtype, whole[0].dtype)
+    assert_equal_nose(blocked[1].keys(), whole[1].keys())
+    # Adaptive compression breaks ties in size by the measured speed,
+    # so it can choose differently each time.
+    if 'adaptive_compression' not in keywords:
+        assert_equal_nose(blocked[2], whole[2])
+    assert_equal_nose(type(blocked[3]), np.ndarray)
+    assert_equal_nose(blocked[3].dtype, data.dtype)
+    np.testing.assert_array_equal(blocked[3], whole[3])
+    # The scale-offset filter is lossy for floats.
+    if 'scaleoffset_filter' not in keywords:
+        np.testing.assert_array_equal(blocked[3], data)
+
+
+def test_same_as_whole():
+    for dtype in ('bool', 'uint8', 'int32', 'float64', 'complex128',
+                  'datetime64[ms]'):
+        for keywords in ({'matlab_compatible': True},
+                         {'matlab_compatible': False},
+                         {'matlab_compatible': False,
+                          'compress': False},
+                         {'matlab_compatible': True,
+                          'compress_size_threshold': 0,
+                          'scaleoffset_filter': {'int32': 0,
+                                                 'float64': 2}},
+                         {'matlab_compatible': True,
+                          'compress_size_threshold': 0,
+                          'nbit_filter': {'int32': 9}},
+                         {'matlab_compatible': False,
+                          'compress_size_threshold': 0,
+                          'adaptive_compression': True}):
+            yield check_same_as_whole, dtype, keywords
+
+
+def test_overwrite():
+    data = make_data('float64')
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        filename = fld[1]
+        for x in (data, 2 * data, data[:3], {'b': 1}, 3 * data):
+            hdf5storage.write(x, path='/a', filename=filename,
+                              matlab_compatible=False,
+                              write_memory_budget=1000)
+        out = hdf5storage.read(path='/a', filename=filename)
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+    np.testing.assert_array_equal(out, 3 * data)
+
+
+def test_memmap():
+    fld = None
+    try:
+        fld = tempfile.mkstemp()
+        os.close(fld[0])
+        data = np.memmap(fld[1], dtype='float64', mode='w+',
+                         shape=(200, 30))
+        data[...] = np.arange(6000).reshape(200, 30)
+        data.flush()
+        for budget in (1000, 10**8):
+            stored, attrs, filters, out = write_readback(
+                data, matlab_compatible=True, write_memory_budget=budget)
+            assert_equal_nose(attrs['Python.Type'], b'numpy.ndarray')
+            assert_equal_nose(type(out), np.ndarray)
+            np.testing.assert_array_equal(out, data)
+            np.testing.assert_array_equal(stored, data.T)
+        del data
+    finally:
+        if fld is not None:
+            os.remove(fld[1])
+
+
+def test_memory_bounded():
+    data = np.random.RandomState(4).rand(500, 2000)
+    for keywords in ({'compress': False}, {'compress': True},
+                     {'compress': True, 'adaptive_compression': True}):
+        tracemalloc.start()
+        try:
+            stored, attrs, filters, out = write_readback(
+                data.T, matlab_compatible=True,
+                write_memory_budget=2**20, **keywords)
+            peak = tracemalloc.get_traced_memory()[1] - data.nbytes
+        finally:
+            tracemalloc.stop()
+        # The read back array and the one it is read into are the only
+        # whole copies made.
+        assert peak < 2 * data.nbytes + 2**20
+        np.testing.assert_array_equal(out, data.T)
+
+
+def test_options():
+    options = hdf5storage.Options()
+    assert_equal_nose(options.write_memory_budget, 256 * 1024 * 1024)
+    options.write_memory_budget = 1000
+    assert_equal_nose(options.write_memory_budget, 1000)
+    for value in (0, -1, 1.5, True, None, '1000'):
+        options.write_memory_budget = value
+        assert_equal_nose(options.write_memory_budget, 1000)
+    assert options.matlab_compatible